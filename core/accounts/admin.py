@@ -26,7 +26,8 @@ class CustomUserAdmin(UserAdmin):
         "is_superuser",
         "is_active",
     )
-    searching_fields = ("phone",)
+    # prefix match, also what the order and payment user filters autocomplete on
+    search_fields = ("^phone",)
     ordering = ("phone",)
     filter_horizontal = []
     fieldsets = (
@@ -78,4 +79,7 @@ class CustomUserAdmin(UserAdmin):
     )
 admin.site.register(User, CustomUserAdmin)
 
-admin.site.register(Profile)
+
+@admin.register(Profile)
+class ProfileAdmin(admin.ModelAdmin):
+    list_select_related = ('user',)
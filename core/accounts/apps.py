@@ -8,4 +8,4 @@ class AccountsConfig(AppConfig):
     name = 'accounts'
 
     def ready(self):
-        pass
+        from . import signals  # noqa: F401
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from django.contrib.auth import get_user_model
+from django.utils.functional import cached_property
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+
+
+class ClaimsUser(TokenUser):
+    """
+    User built from the signed claims of an access token: id, phone and
+    is_staff at issue time. Anything else, the email or
+    set_password for example, loads the row on first use. Filter querysets
+    by ``user_id=request.user.id``, the ORM does not take this object.
+    """
+
+    @cached_property
+    def phone(self):
+        return self.token.get("phone") or self.user.phone
+
+    @cached_property
+    def user(self):
+        return get_user_model().objects.get(pk=self.pk)
+
+    # TokenUser refuses these, here they act on the row
+    def save(self, *args, **kwargs):
+        self.user.save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self.user.delete(*args, **kwargs)
+
+    def set_password(self, raw_password):
+        self.user.set_password(raw_password)
+
+    def check_password(self, raw_password):
+        return self.user.check_password(raw_password)
+
+    def __getattr__(self, attr):
+        # only reached for names TokenUser does not define
+        if attr.startswith("_") or attr == "token":
+            raise AttributeError(attr)
+        return getattr(self.user, attr)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the per-request user query for safe requests
+    of regular users. Writes and staff tokens load the row, so they act on
+    the current is_active and is_staff rather than on the claims at issue
+    time. Revocation is still checked when the token is validated.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is None:
+            return None
+        user, validated_token = result
+        if request.method not in SAFE_METHODS or user.is_staff:
+            return JWTAuthentication.get_user(self, validated_token), validated_token
+        return result
+
+    def get_user(self, validated_token):
+        return ClaimsUser(validated_token)
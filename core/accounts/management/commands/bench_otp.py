@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from utils.loadtest import cache_settings, percentile
+
+from accounts.otp import LOCKED, VERIFIED, get_otp_store
+
+
+# stop guessing even if the store never locks the phone
+MAX_GUESSES = 1000
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark OTP issue/verify throughput and check that concurrent verifies "
+        "of one code have a single winner and that wrong guesses lock a phone out."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--phones", type=int, default=1000)
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument(
+            "--racers",
+            type=int,
+            default=50,
+            help="Threads verifying the same code at once.",
+        )
+        parser.add_argument(
+            "--cache",
+            choices=["default", "locmem", "fakeredis"],
+            default="default",
+            help="'default' runs against the configured cache (Redis in production).",
+        )
+
+    def handle(self, *args, **options):
+        caches = (
+            settings.CACHES
+            if options["cache"] == "default"
+            else cache_settings(options["cache"])
+        )
+        with override_settings(CACHES=caches):
+            store = get_otp_store()
+            self.stdout.write(f"Store: {type(store).__name__}")
+            # a random prefix keeps runs against a shared Redis apart
+            prefix = f"0{secrets.randbelow(90) + 10}"
+            phones = [f"{prefix}{i:08d}" for i in range(options["phones"])]
+            try:
+                self.throughput(store, phones, options["threads"])
+                self.race(store, f"{prefix}99999999", options["racers"])
+                self.brute_force(store, f"{prefix}99999998")
+            finally:
+                for phone in [*phones, f"{prefix}99999999", f"{prefix}99999998"]:
+                    store.reset(phone)
+
+    def timed(self, label, func, items, threads):
+        latencies = []
+        lock = threading.Lock()
+
+        def one(item):
+            started = time.perf_counter()
+            result = func(item)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+            return result
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(one, items))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{label}: {len(items) / elapsed:.0f} ops/s, "
+            f"p50 {percentile(latencies, 50) * 1000:.2f}ms, "
+            f"p99 {percentile(latencies, 99) * 1000:.2f}ms"
+        )
+        return results
+
+    def throughput(self, store, phones, threads):
+        issued = self.timed("issue", store.issue, phones, threads)
+        codes = dict(zip(phones, (result.code for result in issued)))
+        verified = self.timed(
+            "verify", lambda phone: store.verify(phone, codes[phone]), phones, threads
+        )
+        ok = sum(1 for result in verified if result.status == VERIFIED)
+        self.stdout.write(f"verified {ok}/{len(phones)}")
+
+    def race(self, store, phone, racers):
+        code = store.issue(phone).code
+        barrier = threading.Barrier(racers)
+
+        def verify(_):
+            barrier.wait()
+            return store.verify(phone, code).status
+
+        with ThreadPoolExecutor(max_workers=racers) as pool:
+            statuses = list(pool.map(verify, range(racers)))
+        winners = statuses.count(VERIFIED)
+        self.stdout.write(
+            f"race: {racers} concurrent verifies of one code, {winners} succeeded"
+            f"{'' if winners == 1 else ' (EXPECTED 1)'}"
+        )
+
+    def brute_force(self, store, phone):
+        code = store.issue(phone).code
+        wrong = str(int(code) % 900000 + 100001)
+        guesses = 0
+        result = store.verify(phone, wrong)
+        while result.status != LOCKED and guesses < MAX_GUESSES:
+            guesses += 1
+            result = store.verify(phone, wrong)
+        self.stdout.write(
+            f"brute force: locked after {guesses + 1} wrong guesses, "
+            f"retry after {result.retry_after}s, "
+            f"new code allowed: {store.issue(phone).status}"
+        )
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import secrets
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from products.catalog import get_trial_plan
+from products.models import Plan
+
+from accounts.models import Profile, User
+from accounts.services import bulk_signup, signup
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare queries and latency per signup for the post_save receivers, "
+        "the signup service and bulk_signup."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users", type=int, default=500, help="Signups per strategy."
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = options["users"]
+        trial = None
+        if get_trial_plan() is None:
+            trial = Plan.objects.create(
+                duration_days=3, price=0, description="signup benchmark"
+            )
+        # a random prefix keeps the benchmark clear of real phones
+        prefix = f"0{secrets.randbelow(90) + 10}"
+
+        try:
+            get_trial_plan()
+            self.run(
+                "post_save receivers",
+                total,
+                lambda: [
+                    User.objects.create(phone=f"{prefix}1{i:07d}") for i in range(total)
+                ],
+            )
+            self.run(
+                "signup service",
+                total,
+                lambda: [signup(f"{prefix}2{i:07d}") for i in range(total)],
+            )
+            self.run(
+                "bulk_signup",
+                total,
+                lambda: bulk_signup(
+                    [f"{prefix}3{i:07d}" for i in range(total)],
+                    batch_size=options["batch_size"],
+                ),
+            )
+        finally:
+            users = User.objects.filter(phone__startswith=prefix)
+            Profile.objects.filter(user__in=users).delete()
+            users.delete()
+            if trial is not None:
+                trial.delete()
+
+    def run(self, label, total, func):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{label}: {len(queries) / total:.2f} queries/signup, "
+            f"{elapsed / total * 1000:.2f}ms/signup, {total / elapsed:.0f} signups/s"
+        )
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from utils.send_otp import Dispatcher
+
+
+class Command(BaseCommand):
+    help = "Deliver queued OTP messages through the configured SMS providers."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--providers",
+            nargs="+",
+            metavar="NAME",
+            help="Only drain these providers, all configured ones by default.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help=(
+                "Keep draining, sleeping --interval seconds whenever the queues "
+                "are empty."
+            ),
+        )
+        parser.add_argument("--interval", type=float, default=0.2)
+
+    def handle(self, *args, **options):
+        try:
+            dispatcher = Dispatcher(providers=options["providers"])
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        try:
+            while True:
+                started = time.monotonic()
+                stats = dispatcher.run_once()
+                handled = sum(stats.values())
+                if handled:
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(
+                        f"Sent {stats['sent']}, retried {stats['retried']}, "
+                        f"dead-lettered {stats['dead']}, expired {stats['expired']} "
+                        f"in {elapsed:.2f}s"
+                    )
+                if not options["loop"]:
+                    break
+                if not handled:
+                    time.sleep(options["interval"])
+        finally:
+            dispatcher.close()
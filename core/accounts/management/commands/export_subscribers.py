@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import csv
+import json
+from pathlib import Path
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef, Prefetch
+from django.utils import timezone
+from products.entitlements import ACTIVE_STATUSES
+from products.models import Subscription
+
+from accounts.models import Profile, User
+from accounts.services import PROFILE_FIELDS
+
+
+FIELDS = (
+    "phone",
+    "email",
+    *PROFILE_FIELDS,
+    "plan_id",
+    "status",
+    "start_date",
+    "end_date",
+    "is_trial",
+)
+
+
+def export_row(user):
+    try:
+        profile = user.profile
+    except Profile.DoesNotExist:
+        profile = None
+    row = {"phone": user.phone, "email": user.email or ""}
+    for field in PROFILE_FIELDS:
+        row[field] = getattr(profile, field, None) or ""
+
+    # the prefetch is ordered by end_date, the first one is the current subscription
+    subscription = user.latest_subscriptions[0] if user.latest_subscriptions else None
+    if subscription is None:
+        row.update(plan_id="", status="", start_date="", end_date="", is_trial="")
+    else:
+        row.update(
+            plan_id=subscription.plan_id,
+            status=subscription.status,
+            start_date=subscription.start_date.isoformat(),
+            end_date=subscription.end_date.isoformat(),
+            is_trial=int(subscription.is_trial),
+        )
+    return row
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream subscribers, one row per user with their latest subscription, "
+        "as CSV or JSONL in the format import_subscribers reads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", "-o", default="-", help="Output file, - for stdout."
+        )
+        parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument(
+            "--active-only",
+            action="store_true",
+            help="Only users with a subscription that is active right now.",
+        )
+
+    def handle(self, *args, **options):
+        users = (
+            User.objects.select_related("profile")
+            .prefetch_related(
+                Prefetch(
+                    "subscriptions",
+                    queryset=Subscription.objects.order_by("-end_date"),
+                    to_attr="latest_subscriptions",
+                )
+            )
+            .order_by("id")
+        )
+        if options["active_only"]:
+            users = users.filter(
+                Exists(
+                    Subscription.objects.filter(
+                        user=OuterRef("pk"),
+                        status__in=ACTIVE_STATUSES,
+                        end_date__gt=timezone.now(),
+                    )
+                )
+            )
+
+        if options["output"] == "-":
+            self.export(users, sys.stdout, options["format"], options["chunk_size"])
+            return
+        path = Path(options["output"])
+        with path.open("w", newline="", encoding="utf-8") as output:
+            self.export(users, output, options["format"], options["chunk_size"])
+
+    def export(self, users, output, fmt, chunk_size):
+        writer = None
+        if fmt == "csv":
+            writer = csv.DictWriter(output, fieldnames=FIELDS)
+            writer.writeheader()
+
+        started = time.monotonic()
+        exported = 0
+        for user in users.iterator(chunk_size=chunk_size):
+            row = export_row(user)
+            if writer:
+                writer.writerow(row)
+            else:
+                output.write(json.dumps(row) + "\n")
+            exported += 1
+            if exported % chunk_size == 0:
+                self.progress(exported, started)
+        self.progress(exported, started, done=True)
+
+    def progress(self, exported, started, done=False):
+        # progress goes to stderr so it never mixes with data written to stdout
+        elapsed = time.monotonic() - started
+        rate = exported / elapsed if elapsed else 0
+        self.stderr.write(
+            f"{'Exported' if done else '...'} {exported} subscribers "
+            f"in {elapsed:.1f}s ({rate:.0f} rows/sec)"
+        )
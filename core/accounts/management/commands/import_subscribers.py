@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+from contextlib import ExitStack
+import csv
+from datetime import timedelta
+import itertools
+import json
+from pathlib import Path
+import re
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from products.models import Plan, Subscription
+
+from accounts.models import User
+from accounts.services import PROFILE_FIELDS, import_subscribers
+
+
+PHONE_RE = re.compile(User.phone_regex.regex.pattern)
+PHONE_MAX_LENGTH = User._meta.get_field("phone").max_length
+STATUSES = {status for status, _ in Subscription.STATUS_CHOICES}
+TRUE_VALUES = {"1", "true", "yes", "y"}
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(path, fmt):
+    if fmt:
+        return fmt
+    suffix = Path(path).suffix.lower()
+    if suffix == ".csv":
+        return "csv"
+    if suffix in (".jsonl", ".ndjson"):
+        return "jsonl"
+    msg = "Cannot tell the format from the file name, pass --format."
+    raise CommandError(msg)
+
+
+def read_rows(stream, fmt):
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def parse_datetime_field(value, name):
+    if not value:
+        return None
+    parsed = parse_datetime(str(value))
+    if parsed is None:
+        msg = f"invalid {name}"
+        raise RowError(msg)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_row(row, plans):
+    phone = str(row.get("phone") or "").strip()
+    if not phone or len(phone) > PHONE_MAX_LENGTH or not PHONE_RE.match(phone):
+        msg = "invalid phone"
+        raise RowError(msg)
+
+    record = {"phone": phone, "email": (row.get("email") or "").strip() or None}
+    for field in PROFILE_FIELDS:
+        record[field] = row.get(field) or None
+
+    plan_id = row.get("plan_id")
+    if plan_id not in (None, ""):
+        try:
+            plan_id = int(plan_id)
+        except (TypeError, ValueError):
+            msg = "invalid plan_id"
+            raise RowError(msg)
+        if plan_id not in plans:
+            msg = "unknown plan_id"
+            raise RowError(msg)
+
+        status = row.get("status") or "active"
+        if status not in STATUSES:
+            msg = "invalid status"
+            raise RowError(msg)
+        start_date = (
+            parse_datetime_field(row.get("start_date"), "start_date") or timezone.now()
+        )
+        end_date = parse_datetime_field(
+            row.get("end_date"), "end_date"
+        ) or start_date + timedelta(days=plans[plan_id])
+        record["subscription"] = {
+            "plan_id": plan_id,
+            "status": status,
+            "start_date": start_date,
+            "end_date": end_date,
+            "is_trial": str(row.get("is_trial") or "").strip().lower() in TRUE_VALUES,
+        }
+    return record
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream subscribers from a CSV or JSONL file into users, profiles and "
+        "subscriptions in chunked bulk inserts. Existing phones are skipped, so "
+        "an interrupted import can simply be run again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV/JSONL file, - for stdin.")
+        parser.add_argument("--format", choices=["csv", "jsonl"])
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument(
+            "--trial",
+            action="store_true",
+            help="Give rows without a plan_id the trial subscription.",
+        )
+        parser.add_argument(
+            "--rejects", help="Write rejected rows with the reason to this JSONL file."
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("jsonl" if path == "-" else None)
+        fmt = detect_format(path, fmt)
+        plans = dict(Plan.objects.values_list("id", "duration_days"))
+
+        self.totals = {"rows": 0, "created": 0, "skipped": 0, "rejected": 0}
+        self.started = time.monotonic()
+        with ExitStack() as stack:
+            stream = sys.stdin
+            if path != "-":
+                stream = stack.enter_context(
+                    Path(path).open(newline="", encoding="utf-8")
+                )
+            rejects = None
+            if options["rejects"]:
+                rejects = stack.enter_context(
+                    Path(options["rejects"]).open("w", encoding="utf-8")
+                )
+            rows = enumerate(read_rows(stream, fmt), start=1)
+            while True:
+                chunk = list(itertools.islice(rows, options["chunk_size"]))
+                if not chunk:
+                    break
+                self.import_chunk(chunk, plans, options["trial"], rejects)
+                self.progress()
+        self.progress(done=True)
+
+    def import_chunk(self, chunk, plans, trial, rejects):
+        records = []
+        for line, row in chunk:
+            try:
+                records.append(parse_row(row, plans))
+            except RowError as e:
+                self.totals["rejected"] += 1
+                if rejects:
+                    rejects.write(
+                        json.dumps({"line": line, "reason": str(e), "row": row}) + "\n"
+                    )
+
+        created = len(import_subscribers(records, trial=trial)) if records else 0
+        self.totals["rows"] += len(chunk)
+        self.totals["created"] += created
+        self.totals["skipped"] += len(records) - created
+
+    def progress(self, done=False):
+        elapsed = time.monotonic() - self.started
+        rate = self.totals["rows"] / elapsed if elapsed else 0
+        self.stdout.write(
+            f"{'Imported' if done else '...'} {self.totals['rows']} rows: "
+            f"{self.totals['created']} created, {self.totals['skipped']} skipped, "
+            f"{self.totals['rejected']} rejected in {elapsed:.1f}s "
+            f"({rate:.0f} rows/sec)"
+        )
@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+import secrets
+import threading
+import time
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django_redis import get_redis_connection
+from django_redis.cache import RedisCache
+from utils.metrics import cache_lookup
+
+
+ISSUED = "issued"
+THROTTLED = "throttled"
+LOCKED = "locked"
+VERIFIED = "verified"
+INVALID = "invalid"
+EXPIRED = "expired"
+
+
+class OTPResult(NamedTuple):
+    status: str
+    code: str | None = None
+    # seconds until the phone may ask again (throttled/locked)
+    retry_after: int = 0
+    # wrong guesses left before the lockout (invalid)
+    attempts_left: int | None = None
+
+
+def generate_code():
+    return str(100000 + secrets.randbelow(900000))
+
+
+def otp_keys(phone):
+    # the braces are a Redis hash tag, all keys of a phone land on the same cluster slot
+    base = f"otp:{{{phone}}}"
+    return base, f"{base}:attempts", f"{base}:locked"
+
+
+# KEYS: code, attempts, locked  ARGV: code, ttl
+ISSUE_SCRIPT = """
+if redis.call("EXISTS", KEYS[3]) == 1 then
+    return {"locked", redis.call("TTL", KEYS[3])}
+end
+if redis.call("SET", KEYS[1], ARGV[1], "EX", ARGV[2], "NX") then
+    return {"issued", 0}
+end
+return {"throttled", redis.call("TTL", KEYS[1])}
+"""
+
+# KEYS: code, attempts, locked  ARGV: code, max attempts, attempt window, lockout
+VERIFY_SCRIPT = """
+if redis.call("EXISTS", KEYS[3]) == 1 then
+    return {"locked", redis.call("TTL", KEYS[3])}
+end
+local code = redis.call("GET", KEYS[1])
+if not code then
+    return {"expired", 0}
+end
+if code == ARGV[1] then
+    redis.call("DEL", KEYS[1], KEYS[2])
+    return {"verified", 0}
+end
+local attempts = redis.call("INCR", KEYS[2])
+if attempts == 1 then
+    redis.call("EXPIRE", KEYS[2], ARGV[3])
+end
+local left = tonumber(ARGV[2]) - attempts
+if left <= 0 then
+    redis.call("DEL", KEYS[1], KEYS[2])
+    redis.call("SET", KEYS[3], 1, "EX", ARGV[4])
+    return {"locked", tonumber(ARGV[4])}
+end
+return {"invalid", left}
+"""
+
+
+class BaseOTPStore(ABC):
+    """
+    Issues and checks one-time codes per phone. A phone gets one live code at
+    a time, every wrong guess counts against it and ``MAX_ATTEMPTS`` wrong
+    guesses lock it out of both issuing and verifying for ``LOCKOUT`` seconds.
+    """
+
+    def __init__(self):
+        self.config = settings.OTP
+
+    def issue(self, phone):
+        code = generate_code()
+        status, value = self._issue(otp_keys(phone), code)
+        if status == ISSUED:
+            return OTPResult(ISSUED, code=code)
+        return OTPResult(status, retry_after=max(value, 0))
+
+    def verify(self, phone, code):
+        status, value = self._verify(otp_keys(phone), code)
+        if status != LOCKED:
+            cache_lookup("otp", status != EXPIRED)
+        if status == LOCKED:
+            return OTPResult(LOCKED, retry_after=max(value, 0))
+        if status == INVALID:
+            return OTPResult(INVALID, attempts_left=value)
+        return OTPResult(status)
+
+    @abstractmethod
+    def current_code(self, phone):
+        """
+        Live code of ``phone``, for tests and load tests only.
+        """
+
+    @abstractmethod
+    def reset(self, phone):
+        """
+        Drop the code, attempt counter and lockout of ``phone``.
+        """
+
+    @abstractmethod
+    def _issue(self, keys, code): ...
+
+    @abstractmethod
+    def _verify(self, keys, code): ...
+
+
+class RedisOTPStore(BaseOTPStore):
+    """
+    Every operation is a single Lua script, so issuing and verifying cost one
+    round trip each and concurrent verifies of the same code cannot both win.
+    """
+
+    def __init__(self, client, key_func=None):
+        super().__init__()
+        self.client = client
+        self.key_func = key_func or (lambda key: key)
+        self.issue_script = client.register_script(ISSUE_SCRIPT)
+        self.verify_script = client.register_script(VERIFY_SCRIPT)
+
+    def _keys(self, keys):
+        return [self.key_func(key) for key in keys]
+
+    def _issue(self, keys, code):
+        status, value = self.issue_script(
+            keys=self._keys(keys), args=[code, self.config["TTL"]]
+        )
+        return status.decode(), int(value)
+
+    def _verify(self, keys, code):
+        status, value = self.verify_script(
+            keys=self._keys(keys),
+            args=[
+                code,
+                self.config["MAX_ATTEMPTS"],
+                self.config["ATTEMPT_WINDOW"],
+                self.config["LOCKOUT"],
+            ],
+        )
+        return status.decode(), int(value)
+
+    def current_code(self, phone):
+        code = self.client.get(self.key_func(otp_keys(phone)[0]))
+        return code.decode() if code is not None else None
+
+    def reset(self, phone):
+        self.client.delete(*self._keys(otp_keys(phone)))
+
+
+class CacheOTPStore(BaseOTPStore):
+    """
+    Same rules on top of any Django cache, for development and tests without
+    Redis. Operations are only atomic within one process.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, cache):
+        super().__init__()
+        self.cache = cache
+
+    def _get(self, key):
+        # values are stored as (value, deadline) so the remaining TTL is known
+        item = self.cache.get(key)
+        if item is None or item[1] <= time.time():
+            return None, 0
+        return item[0], int(item[1] - time.time())
+
+    def _set(self, key, value, ttl):
+        self.cache.set(key, (value, time.time() + ttl), timeout=ttl)
+
+    def _issue(self, keys, code):
+        code_key, _, locked_key = keys
+        with self._lock:
+            locked, ttl = self._get(locked_key)
+            if locked:
+                return LOCKED, ttl
+            current, ttl = self._get(code_key)
+            if current is not None:
+                return THROTTLED, ttl
+            self._set(code_key, code, self.config["TTL"])
+            return ISSUED, 0
+
+    def _verify(self, keys, code):
+        code_key, attempts_key, locked_key = keys
+        with self._lock:
+            locked, ttl = self._get(locked_key)
+            if locked:
+                return LOCKED, ttl
+            current, _ = self._get(code_key)
+            if current is None:
+                return EXPIRED, 0
+            if current == code:
+                self.cache.delete_many([code_key, attempts_key])
+                return VERIFIED, 0
+
+            attempts, ttl = self._get(attempts_key)
+            attempts = (attempts or 0) + 1
+            left = self.config["MAX_ATTEMPTS"] - attempts
+            if left <= 0:
+                self.cache.delete_many([code_key, attempts_key])
+                self._set(locked_key, True, self.config["LOCKOUT"])
+                return LOCKED, self.config["LOCKOUT"]
+            self._set(
+                attempts_key,
+                attempts,
+                max(ttl, 1) if attempts > 1 else self.config["ATTEMPT_WINDOW"],
+            )
+            return INVALID, left
+
+    def current_code(self, phone):
+        return self._get(otp_keys(phone)[0])[0]
+
+    def reset(self, phone):
+        self.cache.delete_many(otp_keys(phone))
+
+
+def get_otp_store(alias="default"):
+    """
+    Redis backed store when the cache is django-redis, the plain cache store
+    otherwise.
+    """
+    backend = caches[alias]
+    if not isinstance(backend, RedisCache):
+        return CacheOTPStore(backend)
+    return RedisOTPStore(get_redis_connection(alias), key_func=backend.make_key)
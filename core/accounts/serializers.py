@@ -6,9 +6,18 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from django.core import exceptions
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+    TokenVerifySerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
 
 from .models import Profile
+from .tokens import RefreshToken, is_revoked, revoke_token, user_claims
 
 
 User = get_user_model()
@@ -80,6 +89,7 @@ class CompleteSignUpSerializer(serializers.Serializer):
         return data
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = RefreshToken
 
     def validate(self, attrs):
         validate_data = super().validate(attrs)
@@ -88,6 +98,45 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         validate_data["user_id"] = self.user.pk
         return validate_data
 
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        # revocation lives in the cache, so unlike the parent no outstanding
+        # token table is involved. The claims are read again from the row, a
+        # refresh never carries a stale is_staff forward.
+        refresh = self.token_class(attrs["refresh"])
+        user = (
+            User.objects.filter(pk=refresh[api_settings.USER_ID_CLAIM], is_active=True)
+            .only("id", "phone", "is_staff")
+            .first()
+        )
+        if user is None:
+            raise AuthenticationFailed(
+                self.error_messages["no_active_account"], "no_active_account"
+            )
+        for claim, value in user_claims(user).items():
+            refresh[claim] = value
+        data = {"access": str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            # a rotated refresh token is spent
+            revoke_token(refresh)
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data["refresh"] = str(refresh)
+        return data
+
+class CustomTokenVerifySerializer(TokenVerifySerializer):
+
+    def validate(self, attrs):
+        token = UntypedToken(attrs["token"])
+        if is_revoked(token.payload):
+            msg = "Token is revoked"
+            raise TokenError(msg)
+        return {}
+
 class UserRelatedSerializer(serializers.ModelSerializer):
 
     class Meta:
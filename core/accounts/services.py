@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import secrets
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.db import IntegrityError, transaction
+from products.catalog import trial_subscription, trial_subscriptions
+from products.models import Subscription
+from stats.rollups import record_subscriptions
+
+from .models import Profile, User
+
+
+PROFILE_FIELDS = ("first_name", "last_name", "address", "postal_code", "national_code")
+
+
+def _new_user(phone, email=None):
+    # what set_unusable_password stores, without 40 secrets.choice calls per user
+    user = User(
+        phone=phone,
+        email=email,
+        password=UNUSABLE_PASSWORD_PREFIX + secrets.token_urlsafe(30),
+    )
+    # the post_save receivers leave the profile and trial to the service
+    user._skip_bootstrap = True
+    return user
+
+
+def signup(phone):
+    """
+    Create a user with its Profile and trial Subscription in one transaction,
+    three inserts and two rollup updates, no lookups once the trial plan
+    is cached.
+    """
+    with transaction.atomic():
+        user = _new_user(phone)
+        user.save(force_insert=True)
+        Profile.objects.create(user=user)
+        subscription = trial_subscription(user)
+        if subscription:
+            subscription.save(force_insert=True)
+            record_subscriptions([subscription])
+    return user
+
+
+def get_or_signup(phone):
+    """
+    Returns ``(user, created)`` like get_or_create, signing the phone up when
+    it is new.
+    """
+    user = User.objects.filter(phone=phone).first()
+    if user is not None:
+        return user, False
+    try:
+        return signup(phone), True
+    except IntegrityError:
+        # a concurrent request signed the same phone up first
+        return User.objects.get(phone=phone), False
+
+
+def import_subscribers(records, trial=False):
+    """
+    Insert one chunk of subscriber records, dicts with a ``phone`` and
+    optionally an ``email``, the PROFILE_FIELDS and a ``subscription`` dict of
+    Subscription fields. Phones and emails that already exist are skipped.
+    The chunk is one transaction of a bulk insert per table, signals do not
+    fire. With ``trial`` records without a subscription get the trial plan.
+    Returns the created users.
+    """
+    try:
+        return _import_chunk(records, trial)
+    except IntegrityError:
+        # a concurrent writer took one of the phones or emails, look again
+        return _import_chunk(records, trial)
+
+
+def _import_chunk(records, trial):
+    by_phone = {}
+    for record in records:
+        by_phone.setdefault(record["phone"], record)
+    existing = set(
+        User.objects.filter(phone__in=by_phone).values_list("phone", flat=True)
+    )
+    emails = [record["email"] for record in by_phone.values() if record.get("email")]
+    taken = set(User.objects.filter(email__in=emails).values_list("email", flat=True))
+
+    fresh = []
+    for phone, record in by_phone.items():
+        email = record.get("email") or None
+        if phone in existing or email in taken:
+            continue
+        if email:
+            taken.add(email)
+        fresh.append(record)
+
+    with transaction.atomic():
+        users = User.objects.bulk_create(
+            [
+                _new_user(record["phone"], record.get("email") or None)
+                for record in fresh
+            ]
+        )
+        Profile.objects.bulk_create(
+            Profile(user=user, **{field: record.get(field) for field in PROFILE_FIELDS})
+            for user, record in zip(users, fresh)
+        )
+        subscriptions = [
+            Subscription(user=user, **record["subscription"])
+            for user, record in zip(users, fresh)
+            if record.get("subscription")
+        ]
+        if trial:
+            subscriptions += trial_subscriptions(
+                user
+                for user, record in zip(users, fresh)
+                if not record.get("subscription")
+            )
+        Subscription.objects.bulk_create(subscriptions)
+        record_subscriptions(subscriptions)
+    return users
+
+
+def bulk_signup(phones, batch_size=1000):
+    """
+    Sign many phones up with one bulk insert per table and batch, for imports
+    and data migrations. Phones that already exist are skipped, signals do
+    not fire. Returns the created users.
+    """
+    phones = list(dict.fromkeys(phones))
+    users = []
+    for start in range(0, len(phones), batch_size):
+        users += import_subscribers(
+            [{"phone": phone} for phone in phones[start : start + batch_size]],
+            trial=True,
+        )
+    return users
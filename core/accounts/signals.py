@@ -1,13 +1,34 @@
 from __future__ import annotations
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_init, post_save
 from django.dispatch import receiver
 
 from .models import Profile, User
+from .tokens import revoke_user_tokens
 
 
 @receiver(post_save, sender=User)
 def save_profile(sender, instance, created, **kwargs):
 
-    if created:
+    # accounts.services.signup creates the profile itself
+    if created and not getattr(instance, "_skip_bootstrap", False):
         Profile.objects.create(user=instance)
+
+
+@receiver(post_init, sender=User)
+def remember_is_staff(sender, instance, **kwargs):
+
+    # from __dict__, a deferred is_staff must not cost a query per instance
+    instance._loaded_is_staff = instance.__dict__.get("is_staff")
+
+
+@receiver(post_save, sender=User)
+def revoke_inactive_user_tokens(sender, instance, created, **kwargs):
+
+    # tokens are not checked against the user row, revoke them instead. A
+    # demoted staff user would keep is_staff in its access tokens until they
+    # expire, queryset.update() skips this and must revoke by hand.
+    demoted = instance._loaded_is_staff and not instance.is_staff
+    if not created and (not instance.is_active or demoted):
+        revoke_user_tokens(instance.pk)
+    instance._loaded_is_staff = instance.is_staff
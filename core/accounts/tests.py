@@ -1,2 +1,579 @@
+from __future__ import annotations
 
-# Create your tests here.
+from concurrent.futures import ThreadPoolExecutor
+import csv
+from io import StringIO
+import json
+from pathlib import Path
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from django_redis import get_redis_connection
+from products.catalog import invalidate_trial_plan
+from products.models import Plan, Subscription
+from utils import send_otp
+from utils.loadtest import cache_settings
+from utils.testing import QueryBudgetMixin
+
+from . import otp
+from .authentication import ClaimsUser
+from .models import Profile
+from .services import bulk_signup, get_or_signup, signup
+from .tokens import AccessToken, revoke_user_tokens
+
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+User = get_user_model()
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AccountQueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(phone="09129999999", password="password")
+        self.seeded = 0
+
+    def seed_users(self, count):
+        for _ in range(count):
+            self.seeded += 1
+            user = User.objects.create(phone=f"0913{self.seeded:07d}")
+            Profile.objects.get_or_create(user=user)
+
+    def test_profile(self):
+        user = User.objects.create(phone="09121111111")
+        Profile.objects.get_or_create(user=user)
+        client = APIClient()
+        client.force_authenticate(user)
+        url = reverse("accounts:profile")
+        self.assertConstantQueries(self.seed_users, lambda: client.get(url))
+
+    def test_user_admin_changelist(self):
+        self.client.force_login(self.admin)
+        url = reverse("admin:accounts_user_changelist")
+        self.assertConstantQueries(self.seed_users, lambda: self.client.get(url))
+
+    def test_profile_admin_changelist(self):
+        self.client.force_login(self.admin)
+        url = reverse("admin:accounts_profile_changelist")
+        self.assertConstantQueries(self.seed_users, lambda: self.client.get(url))
+
+
+class OTPStoreTestsMixin:
+
+    phone = "09121111111"
+
+    def setUp(self):
+        self.store = otp.get_otp_store()
+        self.store.reset(self.phone)
+
+    def test_issue_throttles_until_code_expires(self):
+        issued = self.store.issue(self.phone)
+        self.assertEqual(issued.status, otp.ISSUED)
+        self.assertEqual(len(issued.code), 6)
+
+        again = self.store.issue(self.phone)
+        self.assertEqual(again.status, otp.THROTTLED)
+        self.assertGreater(again.retry_after, 0)
+
+    def test_verify_consumes_code(self):
+        code = self.store.issue(self.phone).code
+
+        self.assertEqual(self.store.verify(self.phone, code).status, otp.VERIFIED)
+        self.assertEqual(self.store.verify(self.phone, code).status, otp.EXPIRED)
+
+    def test_wrong_guesses_lock_phone_out(self):
+        code = self.store.issue(self.phone).code
+        wrong = "000000" if code != "000000" else "111111"
+
+        for left in range(settings.OTP["MAX_ATTEMPTS"] - 1, 0, -1):
+            result = self.store.verify(self.phone, wrong)
+            self.assertEqual(result, otp.OTPResult(otp.INVALID, attempts_left=left))
+
+        locked = self.store.verify(self.phone, wrong)
+        self.assertEqual(locked.status, otp.LOCKED)
+        self.assertEqual(self.store.verify(self.phone, code).status, otp.LOCKED)
+        self.assertEqual(self.store.issue(self.phone).status, otp.LOCKED)
+
+    def test_concurrent_verifies_have_one_winner(self):
+        code = self.store.issue(self.phone).code
+        racers = 20
+        barrier = threading.Barrier(racers)
+
+        def verify(_):
+            barrier.wait()
+            return self.store.verify(self.phone, code).status
+
+        with ThreadPoolExecutor(max_workers=racers) as pool:
+            statuses = list(pool.map(verify, range(racers)))
+
+        self.assertEqual(statuses.count(otp.VERIFIED), 1)
+        self.assertEqual(statuses.count(otp.EXPIRED), racers - 1)
+
+
+@override_settings(CACHES=cache_settings("locmem"))
+class CacheOTPStoreTests(OTPStoreTestsMixin, SimpleTestCase):
+    pass
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+@override_settings(CACHES=cache_settings("fakeredis"))
+class RedisOTPStoreTests(OTPStoreTestsMixin, SimpleTestCase):
+
+    def test_uses_lua_store(self):
+        self.assertIsInstance(self.store, otp.RedisOTPStore)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    RATELIMIT_ENABLE=False,
+    OTP_DELIVERY={**settings.OTP_DELIVERY, "LOCAL_QUEUE": True},
+)
+class OTPLoginTests(TestCase):
+
+    phone = "09121111111"
+
+    def setUp(self):
+        self.client = APIClient()
+        otp.get_otp_store().reset(self.phone)
+        self.addCleanup(send_otp.LocalQueue.clear)
+
+    def request_otp(self):
+        return self.client.post(reverse("accounts:login-signup"), {"phone": self.phone}, format="json")
+
+    def verify(self, code):
+        return self.client.post(
+            reverse("accounts:login-signup-verify"), {"phone": self.phone, "otp": code}, format="json",
+        )
+
+    def test_login_with_issued_code(self):
+        self.assertEqual(self.request_otp().status_code, 200)
+        self.assertEqual(self.request_otp().status_code, 429)
+
+        response = self.verify(otp.get_otp_store().current_code(self.phone))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access_token", response.data)
+        self.assertTrue(User.objects.filter(phone=self.phone).exists())
+
+    def test_lockout_answers_429(self):
+        self.request_otp()
+        code = otp.get_otp_store().current_code(self.phone)
+        wrong = "000000" if code != "000000" else "111111"
+
+        for _ in range(settings.OTP["MAX_ATTEMPTS"] - 1):
+            self.assertEqual(self.verify(wrong).status_code, 400)
+        response = self.verify(wrong)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(self.request_otp().status_code, 429)
+
+
+class FailingBackend(send_otp.BaseSMSBackend):
+
+    def send_batch(self, messages):
+        raise send_otp.DeliveryError("provider down")
+
+
+def delivery_settings(backend="utils.send_otp.LocMemBackend", **provider):
+    return {
+        "PROVIDER": "test",
+        "PROVIDERS": {"test": {"BACKEND": backend, **provider}},
+        "MAX_RETRIES": 1,
+        "RETRY_BACKOFF": 0,
+        "LOCAL_QUEUE": True,
+    }
+
+
+class OTPDeliveryTestsMixin:
+
+    def setUp(self):
+        send_otp.outbox.clear()
+        send_otp.LocalQueue.clear()
+
+    def test_batches_respect_provider_limits(self):
+        for i in range(250):
+            send_otp.send_otp(f"0912{i:07d}", "123456")
+
+        with override_settings(OTP_DELIVERY=delivery_settings(BATCH_SIZE=50, CONCURRENCY=2)):
+            dispatcher = send_otp.Dispatcher()
+            try:
+                self.assertEqual(dispatcher.run_once()["sent"], 100)
+                self.assertEqual(dispatcher.run_once()["sent"], 100)
+                self.assertEqual(dispatcher.run_once()["sent"], 50)
+            finally:
+                dispatcher.close()
+        self.assertEqual(len(send_otp.outbox), 250)
+
+    def test_failed_batches_are_retried_then_dead_lettered(self):
+        send_otp.send_otp("09121111111", "123456")
+
+        with override_settings(OTP_DELIVERY=delivery_settings(f"{__name__}.FailingBackend")):
+            dispatcher = send_otp.Dispatcher()
+            try:
+                self.assertEqual(dispatcher.run_once()["retried"], 1)
+                self.assertEqual(dispatcher.run_once()["dead"], 1)
+            finally:
+                dispatcher.close()
+            self.assertEqual(dispatcher.queue.sizes("test"), {"queued": 0, "retrying": 0, "processing": 0, "dead": 1})
+        dead = dispatcher.queue.dead_letters("test")
+        self.assertEqual(dead[0]["phone"], "09121111111")
+        self.assertNotIn("code", dead[0])
+
+    def test_dead_letters_are_capped(self):
+        for i in range(3):
+            send_otp.send_otp(f"0912{i:07d}", "123456")
+
+        delivery = {**delivery_settings(f"{__name__}.FailingBackend"), "MAX_RETRIES": 0, "DEAD_LETTER_MAX": 2}
+        with override_settings(OTP_DELIVERY=delivery):
+            dispatcher = send_otp.Dispatcher()
+            try:
+                self.assertEqual(dispatcher.run_once()["dead"], 3)
+            finally:
+                dispatcher.close()
+        phones = [message["phone"] for message in dispatcher.queue.dead_letters("test")]
+        self.assertEqual(phones, ["09120000001", "09120000002"])
+
+    def test_expired_codes_are_dropped(self):
+        message = send_otp.send_otp("09121111111", "123456")
+        dispatcher = send_otp.Dispatcher()
+        dispatcher.queue.ack("test", dispatcher.queue.pop("test", 1, time.time()))
+        dispatcher.queue.push("test", {**message, "queued_at": time.time() - settings.OTP["TTL"]})
+        try:
+            self.assertEqual(dispatcher.run_once()["expired"], 1)
+        finally:
+            dispatcher.close()
+        self.assertEqual(send_otp.outbox, [])
+        self.assertEqual(dispatcher.queue.sizes("test")["processing"], 0)
+
+    def test_unacknowledged_messages_are_redelivered(self):
+        send_otp.send_otp("09121111111", "123456")
+
+        with override_settings(OTP_DELIVERY={**delivery_settings(), "ACK_TIMEOUT": 60}):
+            dispatcher = send_otp.Dispatcher()
+            try:
+                # a worker that died between the pop and the send
+                dispatcher.queue.pop("test", 1, time.time() - 61)
+                self.assertEqual(dispatcher.queue.sizes("test")["processing"], 1)
+                self.assertEqual(dispatcher.run_once()["sent"], 1)
+            finally:
+                dispatcher.close()
+        self.assertEqual(send_otp.outbox[0]["phone"], "09121111111")
+        self.assertEqual(dispatcher.queue.sizes("test")["processing"], 0)
+
+
+@override_settings(CACHES=cache_settings("locmem"), OTP_DELIVERY=delivery_settings())
+class LocalOTPDeliveryTests(OTPDeliveryTestsMixin, SimpleTestCase):
+    pass
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+@override_settings(CACHES=cache_settings("fakeredis"), OTP_DELIVERY=delivery_settings())
+class RedisOTPDeliveryTests(OTPDeliveryTestsMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        get_redis_connection().flushdb()
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    RATELIMIT_ENABLE=False,
+    OTP_DELIVERY=delivery_settings(latency=1.0),
+)
+class OTPRequestDeliveryTests(TestCase):
+
+    def setUp(self):
+        send_otp.outbox.clear()
+        send_otp.LocalQueue.clear()
+        otp.get_otp_store().reset("09121111111")
+
+    def test_request_does_not_wait_for_provider(self):
+        started = time.perf_counter()
+        response = APIClient().post(reverse("accounts:login-signup"), {"phone": "09121111111"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual(send_otp.outbox, [])
+
+        dispatcher = send_otp.Dispatcher()
+        try:
+            self.assertEqual(dispatcher.run_once()["sent"], 1)
+        finally:
+            dispatcher.close()
+        self.assertEqual(send_otp.outbox[0]["code"], otp.get_otp_store().current_code("09121111111"))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, OTP_DELIVERY={**delivery_settings(), "LOCAL_QUEUE": False})
+class UnsharedOTPDeliveryTests(SimpleTestCase):
+
+    def setUp(self):
+        send_otp.outbox.clear()
+        send_otp.LocalQueue.clear()
+
+    def test_otps_are_sent_right_away(self):
+        send_otp.send_otp("09121111111", "123456")
+        self.assertEqual(send_otp.outbox[0]["code"], "123456")
+        self.assertEqual(send_otp.LocalQueue().sizes("test")["queued"], 0)
+
+    def test_worker_refuses_to_start(self):
+        with self.assertRaises(CommandError):
+            call_command("deliver_otps")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SignupServiceTests(TestCase):
+
+    def setUp(self):
+        self.trial = Plan.objects.create(duration_days=3, price=0)
+        # on_commit never runs inside TestCase, drop whatever an earlier test cached
+        invalidate_trial_plan()
+
+    def assertBootstrapped(self, user):
+        self.assertTrue(Profile.objects.filter(user=user).exists())
+        subscription = Subscription.objects.get(user=user)
+        self.assertEqual(subscription.plan_id, self.trial.id)
+        self.assertTrue(subscription.is_trial)
+
+    def test_signup_inserts_without_lookups(self):
+        signup("09121111110")
+
+        with CaptureQueriesContext(connection) as queries:
+            user = signup("09121111111")
+        statements = [query["sql"].split()[0] for query in queries]
+        self.assertEqual(statements.count("INSERT"), 3)
+        self.assertNotIn("SELECT", statements)
+        self.assertBootstrapped(user)
+
+    def test_get_or_signup_returns_existing_user(self):
+        user, created = get_or_signup("09121111111")
+        self.assertTrue(created)
+        self.assertEqual(get_or_signup("09121111111"), (user, False))
+        self.assertEqual(Subscription.objects.filter(user=user).count(), 1)
+
+    def test_post_save_receivers_still_bootstrap_other_users(self):
+        user = User.objects.create_user(phone="09121111111", password="password")
+        self.assertBootstrapped(user)
+
+    def test_bulk_signup_skips_existing_phones(self):
+        existing = signup("09121111111")
+
+        users = bulk_signup(["09121111111", "09121111112", "09121111113", "09121111112"], batch_size=2)
+
+        self.assertEqual(sorted(user.phone for user in users), ["09121111112", "09121111113"])
+        for user in [existing, *users]:
+            self.assertBootstrapped(user)
+
+    def test_plan_change_refreshes_cached_trial(self):
+        signup("09121111110")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.trial.delete()
+
+        user = signup("09121111111")
+        self.assertFalse(Subscription.objects.filter(user=user).exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SubscriberImportExportTests(TestCase):
+
+    def setUp(self):
+        self.trial = Plan.objects.create(duration_days=3, price=0)
+        self.plan = Plan.objects.create(duration_days=30, price=1000)
+        invalidate_trial_plan()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+
+    def write_csv(self, rows):
+        path = self.tmp / "subscribers.csv"
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["phone", "email", "first_name", "plan_id", "end_date"])
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def import_file(self, path, *args):
+        out = StringIO()
+        call_command("import_subscribers", str(path), "--chunk-size", "2", *args, stdout=out)
+        return out.getvalue()
+
+    def test_import_is_idempotent_and_rejects_bad_rows(self):
+        path = self.write_csv([
+            {"phone": "09121111111", "email": "a@example.com", "first_name": "Ali", "plan_id": self.plan.id},
+            {"phone": "09121111112", "email": "", "first_name": "", "plan_id": ""},
+            {"phone": "09121111111", "email": "", "first_name": "duplicate", "plan_id": ""},
+            {"phone": "not-a-phone", "email": "", "first_name": "", "plan_id": ""},
+            {"phone": "09121111113", "email": "", "first_name": "", "plan_id": 999},
+        ])
+        rejects = self.tmp / "rejects.jsonl"
+
+        output = self.import_file(path, "--trial", "--rejects", str(rejects))
+        self.assertIn("2 created, 1 skipped, 2 rejected", output)
+        reasons = [json.loads(line)["reason"] for line in rejects.read_text().splitlines()]
+        self.assertEqual(reasons, ["invalid phone", "unknown plan_id"])
+
+        paid = User.objects.get(phone="09121111111")
+        self.assertEqual(paid.profile.first_name, "Ali")
+        self.assertEqual(paid.subscriptions.get().plan_id, self.plan.id)
+        self.assertTrue(User.objects.get(phone="09121111112").subscriptions.get().is_trial)
+
+        self.assertIn("0 created, 3 skipped, 2 rejected", self.import_file(path))
+
+    def test_export_round_trips_through_import(self):
+        path = self.write_csv([
+            {"phone": "09121111111", "email": "a@example.com", "first_name": "Ali", "plan_id": self.plan.id},
+            {"phone": "09121111112", "email": "", "first_name": "", "plan_id": ""},
+        ])
+        self.import_file(path)
+
+        exported = self.tmp / "export.jsonl"
+        call_command(
+            "export_subscribers", "-o", str(exported), "--format", "jsonl", "--chunk-size", "1", stderr=StringIO(),
+        )
+        rows = [json.loads(line) for line in exported.read_text().splitlines()]
+        self.assertEqual([row["phone"] for row in rows], ["09121111111", "09121111112"])
+        self.assertEqual(rows[0]["plan_id"], self.plan.id)
+        self.assertEqual(rows[1]["plan_id"], "")
+
+        User.objects.all().delete()
+        self.assertIn("2 created", self.import_file(exported))
+        self.assertEqual(
+            User.objects.get(phone="09121111111").subscriptions.get().end_date.isoformat(),
+            rows[0]["end_date"],
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StatelessJWTTests(TestCase):
+
+    password = "Old-password-1!"
+
+    def setUp(self):
+        # revocations outlive the test transaction in locmem
+        cache.clear()
+        self.user = User.objects.create_user(phone="09121111112", password=self.password)
+        self.client = APIClient()
+        tokens = self.client.post(
+            reverse("accounts:jwt-login"), {"phone": self.user.phone, "password": self.password}, format="json",
+        ).data
+        self.access, self.refresh = tokens["access"], tokens["refresh"]
+
+    def get_profile(self, access):
+        return self.client.get(reverse("accounts:profile"), HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    def test_profile_skips_the_user_query(self):
+        self.assertEqual(AccessToken(self.access)["phone"], self.user.phone)
+        # only the profile with its user joined, no separate user lookup
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_profile(self.access).status_code, 200)
+
+    def test_claims_user_loads_the_row_on_demand(self):
+        user = ClaimsUser(AccessToken(self.access))
+        with self.assertNumQueries(0):
+            self.assertEqual((user.pk, user.phone, user.is_staff), (self.user.pk, self.user.phone, False))
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password(self.password))
+
+    def test_password_change_revokes_tokens(self):
+        response = self.client.put(
+            reverse("accounts:change-password"),
+            {"old_password": self.password, "new_password": "New-password-1!", "new_password1": "New-password-1!"},
+            format="json",
+            HTTP_AUTHORIZATION=f"Bearer {self.access}",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # issued in an earlier second than the revocation
+        with mock.patch("accounts.tokens.time.time", return_value=time.time() + 1):
+            revoke_user_tokens(self.user.pk)
+        self.assertEqual(self.get_profile(self.access).status_code, 401)
+        response = self.client.post(reverse("accounts:jwt-refresh"), {"refresh": self.refresh}, format="json")
+        self.assertEqual(response.status_code, 401)
+
+    def test_demoted_staff_loses_admin_access(self):
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        staff = self.client.post(
+            reverse("accounts:jwt-login"), {"phone": self.user.phone, "password": self.password}, format="json",
+        ).data
+        search = reverse("payments:orders-search")
+        self.assertEqual(
+            self.client.get(search, {"q": "abc"}, HTTP_AUTHORIZATION=f"Bearer {staff['access']}").status_code, 200
+        )
+
+        # issued in an earlier second than the revocation
+        with mock.patch("accounts.tokens.time.time", return_value=time.time() + 1):
+            user = User.objects.get(pk=self.user.pk)
+            user.is_staff = False
+            user.save()
+        self.assertEqual(
+            self.client.get(search, {"q": "abc"}, HTTP_AUTHORIZATION=f"Bearer {staff['access']}").status_code, 401
+        )
+        response = self.client.post(reverse("accounts:jwt-refresh"), {"refresh": staff["refresh"]}, format="json")
+        self.assertEqual(response.status_code, 401)
+
+    def test_staff_tokens_are_checked_against_the_row(self):
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        staff = self.client.post(
+            reverse("accounts:jwt-login"), {"phone": self.user.phone, "password": self.password}, format="json",
+        ).data["access"]
+        search = reverse("payments:orders-search")
+        self.assertEqual(self.client.get(search, {"q": "abc"}, HTTP_AUTHORIZATION=f"Bearer {staff}").status_code, 200)
+
+        # a bulk update sends no post_save, the token is not revoked
+        User.objects.filter(pk=self.user.pk).update(is_staff=False)
+        self.assertEqual(self.client.get(search, {"q": "abc"}, HTTP_AUTHORIZATION=f"Bearer {staff}").status_code, 403)
+        stats = reverse("stats:revenue")
+        self.assertEqual(self.client.get(stats, HTTP_AUTHORIZATION=f"Bearer {staff}").status_code, 403)
+
+    def test_writes_load_the_user(self):
+        url = reverse("accounts:profile")
+        # the token's user and then the profile
+        with self.assertNumQueries(3):
+            response = self.client.patch(
+                url, {"first_name": "name"}, format="json", HTTP_AUTHORIZATION=f"Bearer {self.access}"
+            )
+        self.assertEqual(response.status_code, 200)
+
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.patch(
+            url, {"first_name": "other"}, format="json", HTTP_AUTHORIZATION=f"Bearer {self.access}"
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_reads_the_claims_from_the_row(self):
+        User.objects.filter(pk=self.user.pk).update(is_staff=True, phone="09121111113")
+        response = self.client.post(reverse("accounts:jwt-refresh"), {"refresh": self.refresh}, format="json")
+        self.assertEqual(response.status_code, 200)
+        access = AccessToken(response.data["access"])
+        self.assertEqual((access["is_staff"], access["phone"]), (True, "09121111113"))
+        self.assertNotIn("ent", access)
+
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.post(reverse("accounts:jwt-refresh"), {"refresh": response.data["refresh"]}, format="json")
+        self.assertEqual(response.status_code, 401)
+
+    def test_rotated_refresh_token_is_spent(self):
+        url = reverse("accounts:jwt-refresh")
+        first = self.client.post(url, {"refresh": self.refresh}, format="json")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(AccessToken(first.data["access"])["phone"], self.user.phone)
+
+        self.assertEqual(self.client.post(url, {"refresh": self.refresh}, format="json").status_code, 401)
+        verify = self.client.post(reverse("accounts:jwt-verify"), {"token": self.refresh}, format="json")
+        self.assertEqual(verify.status_code, 401)
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import time
+
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+
+REVOKED_JTI_KEY = "jwt:revoked:{jti}"
+REVOKED_BEFORE_KEY = "jwt:revoked-before:{user_id}"
+
+
+def _revocation_keys(payload):
+    return (
+        REVOKED_JTI_KEY.format(jti=payload.get(api_settings.JTI_CLAIM)),
+        REVOKED_BEFORE_KEY.format(user_id=payload.get(api_settings.USER_ID_CLAIM)),
+    )
+
+
+def is_revoked(payload):
+    """
+    One cache round trip for both the token's own jti and the user's
+    revoke-everything-before timestamp.
+    """
+    jti_key, user_key = _revocation_keys(payload)
+    found = cache.get_many([jti_key, user_key])
+    if jti_key in found:
+        return True
+    revoked_before = found.get(user_key)
+    return revoked_before is not None and payload.get("iat", 0) < revoked_before
+
+
+def revoke_token(token):
+    """
+    Revoke one token, the entry lives only as long as the token would.
+    """
+    remaining = int(token.payload["exp"] - time.time())
+    if remaining > 0:
+        jti_key, _ = _revocation_keys(token.payload)
+        cache.set(jti_key, 1, timeout=remaining)
+
+
+def revoke_user_tokens(user_id):
+    """
+    Revoke every token issued to ``user_id`` so far, e.g. after a password
+    change. Whole seconds, like ``iat``, so a token issued in the same second
+    as the revocation survives rather than a fresh login being rejected.
+    """
+    lifetime = max(
+        api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME
+    )
+    cache.set(
+        REVOKED_BEFORE_KEY.format(user_id=user_id),
+        int(time.time()),
+        timeout=int(lifetime.total_seconds()),
+    )
+
+
+def user_claims(user):
+    """
+    Claims the stateless authentication builds its user from. A refresh
+    reads them again from the row.
+    """
+    return {"phone": user.phone, "is_staff": user.is_staff}
+
+
+class RevocableMixin:
+    def verify(self):
+        super().verify()
+        if is_revoked(self.payload):
+            raise TokenError(_("Token is revoked"))
+
+
+class AccessToken(RevocableMixin, tokens.AccessToken):
+    pass
+
+
+class RefreshToken(RevocableMixin, tokens.RefreshToken):
+    access_token_class = AccessToken
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim, value in user_claims(user).items():
+            token[claim] = value
+        return token
@@ -1,17 +1,17 @@
 from __future__ import annotations
 
-import random
-
 from django.contrib.auth import get_user_model
-from django.core.cache import cache
 from django.shortcuts import get_object_or_404
-from django_ratelimit.decorators import ratelimit
+from django.utils.decorators import method_decorator
 from rest_framework import generics, mixins, status
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
+from utils.metrics import ratelimit
+from utils.send_otp import send_otp
 
+from . import otp as otp_codes
+from .authentication import StatelessJWTAuthentication
 from .models import Profile
 from .serializers import (
     CompleteSignUpSerializer,
@@ -21,6 +21,8 @@ from .serializers import (
     ProfileSerializer,
     UserChangePasswordSerializer,
 )
+from .services import get_or_signup
+from .tokens import RefreshToken, revoke_user_tokens
 
 
 User = get_user_model()
@@ -32,7 +34,9 @@ class OTPLoginOrSignupView(generics.GenericAPIView):
     permission_classes = [AllowAny]
     serializer_class = OTPLoginOrSignupSerializer
 
-    @ratelimit(key='user_or_ip', rate='5/m', method='POST', block=True)
+    @method_decorator(
+        ratelimit(key='user_or_ip', rate='5/m', method='POST', block=True)
+    )
     def post(self, request, *args, **kwargs):
 
         serializer = self.serializer_class(data=request.data)
@@ -42,14 +46,21 @@ class OTPLoginOrSignupView(generics.GenericAPIView):
         if not phone:
             return Response({"detail":"Phone number is required!"}, status=status.HTTP_400_BAD_REQUEST)
 
-        cache_key = f"otp:{phone}"
-        if cache.get(cache_key):
-            return Response({"detail":"Please wait before requesting again."}, status=status.HTTP_429_TOO_MANY_REQUESTS)
-
-        otp = str(random.randint(100000, 999999))
-        cache.set(cache_key, otp, timeout=120)
-
-        print(f"Send OTP {otp} to phone {phone}")
+        result = otp_codes.get_otp_store().issue(phone)
+        if result.status == otp_codes.LOCKED:
+            return Response(
+                {"detail":"Too many failed attempts, try again later."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(result.retry_after)},
+            )
+        if result.status == otp_codes.THROTTLED:
+            return Response(
+                {"detail":"Please wait before requesting again."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(result.retry_after)},
+            )
+
+        send_otp(phone, result.code)
 
         return Response({"detail":"OTP sent successfully."}, status=status.HTTP_200_OK)
 
@@ -69,19 +80,28 @@ class OTPLoginOrSignupVerifyView(generics.GenericAPIView):
         if not phone or not otp:
             return Response({"detail":"Both phone and OTP are required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        cache_key = f"otp:{phone}"
-        cached_otp = cache.get(cache_key)
-        if not cached_otp:
+        result = otp_codes.get_otp_store().verify(phone, otp)
+        if result.status == otp_codes.LOCKED:
+            return Response(
+                {"detail":"Too many failed attempts, try again later."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(result.retry_after)},
+            )
+        if result.status == otp_codes.EXPIRED:
             return Response({"detail":"OTP code has be expired try again"}, status=status.HTTP_400_BAD_REQUEST)
-        if otp != cached_otp:
-            return Response({"error": "Invalid or expired OTP."}, status=status.HTTP_400_BAD_REQUEST)
+        if result.status == otp_codes.INVALID:
+            return Response(
+                {
+                    "error": "Invalid or expired OTP.",
+                    "attempts_left": result.attempts_left,
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        user, _ = User.objects.get_or_create(phone=phone)
+        user, _ = get_or_signup(phone)
 
-        access = AccessToken.for_user(user=user)
         refresh = RefreshToken.for_user(user=user)
-
-        cache.delete(cache_key)
+        access = refresh.access_token
 
         return Response(
             {
@@ -99,7 +119,9 @@ class CompleteSignUpView(generics.GenericAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = CompleteSignUpSerializer
 
-    @ratelimit(key='user_or_ip', rate='10/m', method='POST', block=True)
+    @method_decorator(
+        ratelimit(key='user_or_ip', rate='10/m', method='POST', block=True)
+    )
     def post(self, request, *args, **kwargs):
 
         serializer = self.serializer_class(data=request.data)
@@ -118,16 +140,19 @@ class CompleteSignUpView(generics.GenericAPIView):
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
-    @ratelimit(key='user_or_ip', rate='5/m', method='POST', block=True)
+    @method_decorator(
+        ratelimit(key='user_or_ip', rate='5/m', method='POST', block=True)
+    )
     def post(self, request, *args, **kwargs):
         return super().post(request, *args, **kwargs)
 class ProfileView(generics.GenericAPIView, mixins.RetrieveModelMixin, mixins.UpdateModelMixin):
 
     permission_classes = [IsAuthenticated]
+    authentication_classes = (StatelessJWTAuthentication,)
     serializer_class = ProfileSerializer
 
     def get_object(self):
-        return Profile.objects.select_related("user").get(user=self.request.user)
+        return Profile.objects.select_related("user").get(user_id=self.request.user.id)
 
     def get(self, request, *args, **kwargs):
         return self.retrieve(request, *args, **kwargs)
@@ -142,7 +167,9 @@ class UserChangePasswordView(generics.GenericAPIView):
     def get_object(self):
         return get_object_or_404(User, id=self.request.user.id)
 
-    @ratelimit(key='user_or_ip', rate='5/m', method='POST', block=True)
+    @method_decorator(
+        ratelimit(key='user_or_ip', rate='5/m', method='POST', block=True)
+    )
     def put(self, request, *args, **kwargs):
 
         user = self.get_object()
@@ -154,5 +181,7 @@ class UserChangePasswordView(generics.GenericAPIView):
 
         user.set_password(serializer.validated_data["new_password"])
         user.save()
+        # sessions elsewhere must log in again with the new password
+        revoke_user_tokens(user.pk)
 
         return Response({"detail": "Change password successfully"}, status=status.HTTP_200_OK)
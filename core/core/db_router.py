@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+import random
+
+from django.conf import settings
+from django.db import connections
+
+
+_use_replica = ContextVar("use_replica", default=False)
+
+
+@contextmanager
+def use_replica():
+    """
+    Send the reads inside the block to a read replica. Only for reads that
+    can tolerate replication lag, everything else keeps reading the primary
+    so a request always sees its own writes.
+    """
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, _model, **_hints):
+        if not _use_replica.get() or not settings.DATABASE_REPLICAS:
+            return None
+        # inside a transaction on the primary the replica would miss its writes
+        if connections["default"].in_atomic_block:
+            return None
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, _model, **_hints):
+        return "default"
+
+    def allow_relation(self, _obj1, _obj2, **_hints):
+        return True
+
+    def allow_migrate(self, db, _app_label, **_hints):
+        return db == "default"
@@ -42,13 +42,13 @@ ALLOWED_HOSTS = config(
 APPS = [
     "accounts",
     "orders",
-    "products"
+    "products",
+    "stats",
 ]
 
 THIRD_PARTY_MODULES = [
     "rest_framework",
     "rest_framework_simplejwt",
-    'rest_framework_simplejwt.token_blacklist',
     "drf_spectacular",
 ]
 
@@ -64,6 +64,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'utils.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -96,12 +97,61 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgres for production, SQLite stays the zero-config default.
+DB_ENGINE = config("DB_ENGINE", default="sqlite")
+
+if DB_ENGINE == "postgres":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": config("DB_NAME", default="subscription"),
+            "USER": config("DB_USER", default="postgres"),
+            "PASSWORD": config("DB_PASSWORD", default=""),
+            "HOST": config("DB_HOST", default="postgres"),
+            "PORT": config("DB_PORT", cast=int, default=5432),
+            # persistent connections, checked before reuse
+            "CONN_MAX_AGE": config("DB_CONN_MAX_AGE", cast=int, default=60),
+            "CONN_HEALTH_CHECKS": True,
+            # a transaction-pooling PgBouncer cannot keep server-side cursors open
+            "DISABLE_SERVER_SIDE_CURSORS": (
+                config("DB_POOLER", default="") == "pgbouncer"
+            ),
+            "OPTIONS": {
+                "connect_timeout": config("DB_CONNECT_TIMEOUT", cast=int, default=5),
+            },
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config("DB_NAME", default=str(BASE_DIR / 'db.sqlite3')),
+            'OPTIONS': {
+                # wait for the write lock instead of failing with "database is locked"
+                'timeout': config("DB_LOCK_TIMEOUT", cast=int, default=20),
+            },
+        }
+    }
+
+# read replicas, only used for reads wrapped in core.db_router.use_replica()
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+    config(
+        "DB_REPLICA_HOSTS",
+        cast=lambda v: [s.strip() for s in v.split(",") if s.strip()],
+        default="",
+    ),
+    start=1,
+):
+    alias = f"replica{index}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["core.db_router.ReplicaRouter"]
 
 
 # Password validation
@@ -167,12 +217,65 @@ CACHES = {
     }
 }
 
+# Entitlement cache configs
+ENTITLEMENT_CACHE = {
+    "TIMEOUT": config("ENTITLEMENT_CACHE_TIMEOUT", cast=int, default=3600),
+    "NEGATIVE_TIMEOUT": config(
+        "ENTITLEMENT_CACHE_NEGATIVE_TIMEOUT", cast=int, default=300
+    ),
+    "LOCAL_TIMEOUT": config("ENTITLEMENT_CACHE_LOCAL_TIMEOUT", cast=int, default=5),
+    "LOCAL_MAXSIZE": config("ENTITLEMENT_CACHE_LOCAL_MAXSIZE", cast=int, default=10000),
+}
+
+# one-time login codes
+OTP = {
+    "TTL": config("OTP_TTL", cast=int, default=120),
+    "MAX_ATTEMPTS": config("OTP_MAX_ATTEMPTS", cast=int, default=5),
+    "ATTEMPT_WINDOW": config("OTP_ATTEMPT_WINDOW", cast=int, default=900),
+    "LOCKOUT": config("OTP_LOCKOUT", cast=int, default=900),
+}
+
+# OTP sms delivery, sends are queued and dispatched by the deliver_otps worker
+OTP_DELIVERY = {
+    "PROVIDER": config("OTP_DELIVERY_PROVIDER", default="console"),
+    "PROVIDERS": {
+        "console": {
+            "BACKEND": "utils.send_otp.ConsoleBackend",
+            "BATCH_SIZE": config("OTP_DELIVERY_BATCH_SIZE", cast=int, default=100),
+            "CONCURRENCY": config("OTP_DELIVERY_CONCURRENCY", cast=int, default=4),
+        },
+    },
+    "MAX_RETRIES": config("OTP_DELIVERY_MAX_RETRIES", cast=int, default=3),
+    "RETRY_BACKOFF": config("OTP_DELIVERY_RETRY_BACKOFF", cast=float, default=2.0),
+    # seconds before a message a worker popped but never acknowledged is queued again
+    "ACK_TIMEOUT": config("OTP_DELIVERY_ACK_TIMEOUT", cast=int, default=30),
+    # failed messages, without their code, for inspection
+    "DEAD_LETTER_MAX": config("OTP_DELIVERY_DEAD_LETTER_MAX", cast=int, default=1000),
+    "DEAD_LETTER_TTL": config(
+        "OTP_DELIVERY_DEAD_LETTER_TTL", cast=int, default=7 * 86400
+    ),
+}
+
+# public plan catalog, pre-rendered and versioned by a generation counter
+PLAN_CATALOG = {
+    "TIMEOUT": config("PLAN_CATALOG_TIMEOUT", cast=int, default=86400),
+    "MAX_AGE": config("PLAN_CATALOG_MAX_AGE", cast=int, default=60),
+}
+
+# stats rollups, the admin dashboard is cached and the API range is bounded
+STATS = {
+    "DASHBOARD_DAYS": config("STATS_DASHBOARD_DAYS", cast=int, default=30),
+    "DASHBOARD_TIMEOUT": config("STATS_DASHBOARD_TIMEOUT", cast=int, default=300),
+    "MAX_RANGE_DAYS": config("STATS_MAX_RANGE_DAYS", cast=int, default=366),
+}
+
 # rest framework configs
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    "EXCEPTION_HANDLER": "utils.metrics.exception_handler",
 }
 
 # jwt configs
@@ -190,6 +293,10 @@ SIMPLE_JWT = {
     "AUTH_HEADER_TYPES": ("Bearer",),
     "USER_ID_FIELD": "id",
     "USER_ID_CLAIM": "sub",
+    # revocation lives in the cache (accounts.tokens), not in blacklist tables
+    "AUTH_TOKEN_CLASSES": ("accounts.tokens.AccessToken",),
+    "TOKEN_REFRESH_SERIALIZER": "accounts.serializers.CustomTokenRefreshSerializer",
+    "TOKEN_VERIFY_SERIALIZER": "accounts.serializers.CustomTokenVerifySerializer",
 }
 
 # Document configs
@@ -208,8 +315,39 @@ SPECTACULAR_SETTINGS = {
 # ZarinPal Configs
 ZARINPAL = {
     "MERCHANT_ID" : config("MERCHANT_ID"),
-    "SANDBOX" : config("SANDBOX")
+    "SANDBOX" : config("SANDBOX"),
+    "CALLBACK_URL": config(
+        "ZARINPAL_CALLBACK_URL",
+        default="http://127.0.0.1:8000/api/v1/payments/callback/",
+    ),
+    "API_URL": config("ZARINPAL_API_URL", default=None),
+    "POOL_SIZE": config("ZARINPAL_POOL_SIZE", cast=int, default=10),
+    "CONNECT_TIMEOUT": config("ZARINPAL_CONNECT_TIMEOUT", cast=float, default=3.05),
+    "READ_TIMEOUT": config("ZARINPAL_READ_TIMEOUT", cast=float, default=10.0),
+    "VERIFY_RETRIES": config("ZARINPAL_VERIFY_RETRIES", cast=int, default=2),
+    "BREAKER_FAILURES": config("ZARINPAL_BREAKER_FAILURES", cast=int, default=5),
+    "BREAKER_RESET": config("ZARINPAL_BREAKER_RESET", cast=float, default=30.0),
+}
+
+# payment callbacks, only one verify call per authority at a time
+PAYMENT_CALLBACK = {
+    # longer than a verify call with all its retries
+    "CLAIM_TIMEOUT": config("PAYMENT_CALLBACK_CLAIM_TIMEOUT", cast=int, default=60),
+    "WAIT_TIMEOUT": config("PAYMENT_CALLBACK_WAIT_TIMEOUT", cast=float, default=15.0),
+    "POLL_INTERVAL": config("PAYMENT_CALLBACK_POLL_INTERVAL", cast=float, default=0.05),
 }
 
 # Ratelimit configs
 RATELIMIT_CACHE_BACKEND = 'default'
+
+# Metrics configs, set PROMETHEUS_MULTIPROC_DIR when running several workers
+METRICS = {
+    # /metrics answers nobody until a token or the scraper's networks are set
+    "TOKEN": config("METRICS_TOKEN", default=None),
+    # e.g. "10.0.0.0/8,127.0.0.1"
+    "ALLOWED_NETWORKS": config(
+        "METRICS_ALLOWED_NETWORKS",
+        cast=lambda v: [s.strip() for s in v.split(",") if s.strip()],
+        default="",
+    ),
+}
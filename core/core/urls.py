@@ -25,6 +25,7 @@ from drf_spectacular.views import (
     SpectacularRedocView,
     SpectacularSwaggerView,
 )
+from utils.metrics import metrics_view
 
 
 urlpatterns = [
@@ -32,6 +33,8 @@ urlpatterns = [
     path("api/v1/accounts/", include("accounts.urls", namespace="accounts")),
     path("api/v1/products/", include("products.urls", namespace="products")),
     path("api/v1/payments/", include("orders.urls", namespace="payments")),
+    path("api/v1/stats/", include("stats.urls", namespace="stats")),
+    path("metrics", metrics_view, name="metrics"),
 
     # schema generation
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
@@ -0,0 +1,96 @@
+"""
+Production serving profile, ``gunicorn -c gunicorn.conf.py``.
+
+``GUNICORN_WORKER_CLASS=gthread`` (default) serves core.wsgi from a thread
+pool per worker, ``uvicorn`` serves core.asgi from an event loop per worker.
+Nearly every view is sync and under ASGI Django runs all sync views of a
+worker on a single thread, so gthread wins unless the traffic is dominated
+by the async payment callback. ``manage.py bench_serving`` measures both.
+
+Worker and thread counts come from the CPU count and ``GUNICORN_IO_WAIT``,
+the share of a request spent waiting on the database, Redis and the
+gateway, which bench_serving also measures.
+"""
+
+from __future__ import annotations
+
+import math
+import multiprocessing
+import os
+from pathlib import Path
+
+import decouple
+
+
+# every lowercase module name is read as a gunicorn setting and
+# "config" is one of them
+env = decouple.config
+
+WORKER_CLASSES = {
+    "gthread": ("gthread", "core.wsgi:application"),
+    "uvicorn": ("uvicorn_worker.UvicornWorker", "core.asgi:application"),
+}
+
+
+def auto_workers(cpus):
+    # one process per core keeps every core busy, the threads cover the waiting
+    return max(2, cpus + 1)
+
+
+def auto_threads(io_wait):
+    # a thread is on the CPU (1 - io_wait) of the time, this many fill one core
+    io_wait = min(max(io_wait, 0.0), 0.95)
+    return max(1, math.ceil(1 / (1 - io_wait)))
+
+
+cpus = multiprocessing.cpu_count()
+io_wait = env("GUNICORN_IO_WAIT", cast=float, default=0.5)
+worker_class, wsgi_app = WORKER_CLASSES[env("GUNICORN_WORKER_CLASS", default="gthread")]
+
+bind = env("GUNICORN_BIND", default="0.0.0.0:8000")
+workers = env("GUNICORN_WORKERS", cast=int, default=auto_workers(cpus))
+threads = env("GUNICORN_THREADS", cast=int, default=auto_threads(io_wait))
+
+# import Django and the apps once in the master, workers share those pages
+# copy-on-write. kill -HUP still replaces the workers gracefully but keeps the
+# preloaded code, deploying new code takes a restart.
+preload_app = True
+# recycle workers now and then so slow leaks never build up, jitter keeps
+# them from restarting all at once
+max_requests = env("GUNICORN_MAX_REQUESTS", cast=int, default=2000)
+max_requests_jitter = env("GUNICORN_MAX_REQUESTS_JITTER", cast=int, default=200)
+# gateway verification retries can take up to ~30s, SIGTERM/HUP wait for them
+timeout = env("GUNICORN_TIMEOUT", cast=int, default=60)
+graceful_timeout = env("GUNICORN_GRACEFUL_TIMEOUT", cast=int, default=30)
+keepalive = env("GUNICORN_KEEPALIVE", cast=int, default=5)
+# heartbeat files on tmpfs, a container's overlay filesystem can block workers
+worker_tmp_dir = "/dev/shm" if Path("/dev/shm").is_dir() else None
+
+# "-" logs requests to stdout, unset keeps the access log off
+accesslog = env("GUNICORN_ACCESS_LOG", default="") or None
+errorlog = "-"
+loglevel = env("GUNICORN_LOG_LEVEL", default="info")
+
+
+def on_starting(_server):
+    # samples of the previous run's workers would be added to this one's
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        for stale in path.glob("*.db"):
+            stale.unlink()
+
+
+def post_fork(_server, _worker):
+    # never share a socket opened in the master during preloading
+    from django.db import connections
+
+    connections.close_all()
+
+
+def child_exit(_server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
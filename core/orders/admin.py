@@ -1,35 +1,185 @@
 from __future__ import annotations
 
+from datetime import timedelta
 import json
 
 from django import forms
 from django.contrib import admin, messages
+from django.contrib.admin.views.main import PAGE_VAR, SEARCH_VAR
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.utils import timezone
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
+from utils.pagination import EstimatedCountPaginator
 
-from .models import Order, Payment
+from .bulk_actions import enqueue_bulk_action
+from .models import BulkActionJob, Order, Payment, PaymentOutbox
+from .search import as_id, search
 
 
 User = get_user_model()
 
-class PaymentAdminForm(forms.ModelForm):
-    class Meta:
-        model = Payment
-        fields = '__all__'
 
-    def clean_gateway_response(self):
-        data = self.cleaned_data['gateway_response']
-        if data and not isinstance(data, dict):
-            try:
-                json.loads(data)
-            except json.JSONDecodeError:
-                raise forms.ValidationError("فیلد gateway_response باید یک JSON معتبر باشد.")
-        return data
+# List filters that stay cheap on tables of tens of millions of rows: none of
+# them lists the distinct values of a column.
+
+class InputFilter(admin.SimpleListFilter):
+    """
+    Exact match on ``field`` typed into a text box.
+    """
+
+    template = "admin/orders/input_filter.html"
+    field = None
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.field: self.value()})
+        return queryset
+
+    def choices(self, changelist):
+        # the other parameters, carried by the form, and the link that clears this one
+        yield {
+            "query_string": changelist.get_query_string(
+                remove=[self.parameter_name, PAGE_VAR]
+            ),
+            "query_parts": [
+                (name, value)
+                for name, value in changelist.params.items()
+                if name not in (self.parameter_name, PAGE_VAR)
+            ],
+        }
+
+
+class AutocompleteFilter(InputFilter):
+    """
+    Pick one related object of the foreign key ``field`` through the admin's
+    autocomplete view. The related model admin needs search_fields.
+    """
+
+    template = "admin/orders/autocomplete_filter.html"
+
+    def __init__(self, request, params, model, model_admin):
+        self.parameter_name = f"{self.field}__id__exact"
+        super().__init__(request, params, model, model_admin)
+        self.app_label = model._meta.app_label
+        self.model_name = model._meta.model_name
+        self.field_name = self.field
+        self.related_model = model._meta.get_field(self.field).related_model
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.parameter_name: self.value()})
+        return queryset
+
+    @property
+    def selected(self):
+        if self.value():
+            return self.related_model._default_manager.filter(pk=self.value()).first()
+        return None
+
+
+class UserFilter(AutocompleteFilter):
+    title = "کاربر"
+    field = "user"
+
+
+class CityFilter(InputFilter):
+    title = "شهر"
+    parameter_name = "city"
+    field = "city"
+
+
+class RecentFilter(admin.SimpleListFilter):
+    """
+    Shows the last 30 days of ``field`` unless another period is picked, so
+    the default changelist is an index range scan instead of the whole
+    table. A search or a date filter on the field lifts the default bound.
+    """
+
+    title = "بازه زمانی"
+    parameter_name = "period"
+    field = "created"
+    default = "30"
+
+    def __init__(self, request, params, model, model_admin):
+        self.explicit = SEARCH_VAR in request.GET or any(
+            name.startswith(f"{self.field}__") for name in params
+        )
+        super().__init__(request, params, model, model_admin)
+
+    def lookups(self, request, model_admin):
+        return (
+            ("1", "۲۴ ساعت اخیر"),
+            ("7", "یک هفته اخیر"),
+            ("30", "۳۰ روز اخیر"),
+            ("90", "۹۰ روز اخیر"),
+            ("all", "همه"),
+        )
+
+    def value(self):
+        value = super().value()
+        if value in dict(self.lookup_choices):
+            return value
+        return "all" if self.explicit else self.default
+
+    def queryset(self, request, queryset):
+        if self.value() == "all":
+            return queryset
+        since = timezone.now() - timedelta(days=int(self.value()))
+        return queryset.filter(**{f"{self.field}__gte": since})
+
+    def choices(self, changelist):
+        for lookup, title in self.lookup_choices:
+            yield {
+                "selected": self.value() == lookup,
+                "query_string": changelist.get_query_string(
+                    {self.parameter_name: lookup}, [PAGE_VAR]
+                ),
+                "display": title,
+            }
+
+
+def queue_bulk_action(modeladmin, request, action, queryset):
+    job = enqueue_bulk_action(action, queryset, user=request.user)
+    if job is None:
+        return
+    url = reverse('admin:orders_bulkactionjob_change', args=[job.id])
+    modeladmin.message_user(
+        request,
+        format_html(
+            'عملیات گروهی <a href="{}">{}</a> در صف اجرا قرار گرفت.', url, job.id
+        ),
+        messages.SUCCESS,
+    )
+
+
+class LargeChangelistMixin:
+    """
+    Changelist settings for tables too big to count or scan per page view.
+    """
+
+    paginator = EstimatedCountPaginator
+    # no second COUNT(*) of the unfiltered table next to the filtered total
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        # select2 and the admin's autocomplete script for AutocompleteFilter
+        field = self.model._meta.get_field(UserFilter.field)
+        autocomplete = AutocompleteSelect(field, self.admin_site).media
+        script = forms.Media(js=["orders/js/autocomplete_filter.js"])
+        return super().media + autocomplete + script
+
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeChangelistMixin, admin.ModelAdmin):
     list_display = (
         'id',
         'user_link',
@@ -45,23 +195,17 @@ class OrderAdmin(admin.ModelAdmin):
     )
     list_filter = (
         'status',
+        RecentFilter,
         'created',
         'updated',
         'plan',
-        'city',
-        'user',
+        CityFilter,
+        UserFilter,
     )
-    search_fields = (
-        'id',
-        'first_name',
-        'last_name',
-        'phone',
-        'user__phone',
-        'user__email',
-        'address',
-    )
-    list_editable = ('status',)
+    # answered by the search index, see get_search_results
+    search_fields = ('search__document',)
     readonly_fields = ('created', 'updated', 'user', 'payment_link')
+    list_select_related = ('user', 'plan', 'payment')
     list_per_page = 25
     date_hierarchy = 'created'
     ordering = ('-created',)
@@ -70,7 +214,7 @@ class OrderAdmin(admin.ModelAdmin):
     def user_link(self, obj):
         app_label = User._meta.app_label
         model_name = User._meta.model_name
-        url = reverse(f'admin:{app_label}_{model_name}_change', args=[obj.user.id])
+        url = reverse(f'admin:{app_label}_{model_name}_change', args=[obj.user_id])
         return format_html('<a href="{}">{}</a>', url, obj.user.phone or obj.user.email or obj.user.username)
     user_link.short_description = 'کاربر'
 
@@ -104,24 +248,28 @@ class OrderAdmin(admin.ModelAdmin):
             return 'بدون پرداخت'
     payment_link.short_description = 'پرداخت'
 
+    # run in the background by run_bulk_actions, with the payment and
+    # subscription transitions of a callback
     def cancel_orders(self, request, queryset):
-        updated = queryset.update(status='CANCELED')
-        self.message_user(request, f"{updated} سفارش با موفقیت لغو شدند.", messages.SUCCESS)
+        queue_bulk_action(self, request, 'cancel_orders', queryset)
     cancel_orders.short_description = 'لغو سفارش‌های انتخاب‌شده'
 
     def mark_as_completed(self, request, queryset):
-        updated = queryset.update(status='COMPLETED')
-        self.message_user(request, f"{updated} سفارش با موفقیت به‌عنوان تکمیل‌شده علامت‌گذاری شدند.", messages.SUCCESS)
+        queue_bulk_action(self, request, 'complete_orders', queryset)
     mark_as_completed.short_description = 'علامت‌گذاری به‌عنوان تکمیل‌شده'
 
+    def get_search_results(self, request, queryset, search_term):
+        return search(queryset, search_term), False
+
+    # status changes go through the actions, they carry the payment and
+    # subscription along
     def get_readonly_fields(self, request, obj=None):
         if obj:
-            return self.readonly_fields + ('plan',)
+            return (*self.readonly_fields, 'plan', 'status')
         return self.readonly_fields
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
-    form = PaymentAdminForm
+class PaymentAdmin(LargeChangelistMixin, admin.ModelAdmin):
     list_display = (
         'id',
         'order_link',
@@ -136,19 +284,14 @@ class PaymentAdmin(admin.ModelAdmin):
     )
     list_filter = (
         'status',
+        RecentFilter,
         'created',
         'payment_date',
         'order__plan',
-        'user',
-    )
-    search_fields = (
-        'id',
-        'order__id',
-        'user__phone',
-        'user__email',
-        'authority',
-        'ref_id',
+        UserFilter,
     )
+    # answered by the order search index, see get_search_results
+    search_fields = ('order__search__document',)
     readonly_fields = (
         'created',
         'updated',
@@ -157,21 +300,22 @@ class PaymentAdmin(admin.ModelAdmin):
         'user_link',
         'payment_url_link',
     )
-    list_editable = ('status',)
+    # order_link only needs order_id
+    list_select_related = ('user',)
     list_per_page = 25
     date_hierarchy = 'created'
     ordering = ('-created',)
     actions = ['mark_as_failed', 'mark_as_paid']
 
     def order_link(self, obj):
-        url = reverse('admin:orders_order_change', args=[obj.order.id])
-        return format_html('<a href="{}">سفارش {}</a>', url, obj.order.id)
+        url = reverse('admin:orders_order_change', args=[obj.order_id])
+        return format_html('<a href="{}">سفارش {}</a>', url, obj.order_id)
     order_link.short_description = 'سفارش'
 
     def user_link(self, obj):
         app_label = User._meta.app_label
         model_name = User._meta.model_name
-        url = reverse(f'admin:{app_label}_{model_name}_change', args=[obj.user.id])
+        url = reverse(f'admin:{app_label}_{model_name}_change', args=[obj.user_id])
         return format_html('<a href="{}">{}</a>', url, obj.user.phone or obj.user.email or obj.user.username)
     user_link.short_description = 'کاربر'
 
@@ -182,25 +326,81 @@ class PaymentAdmin(admin.ModelAdmin):
     payment_url_link.short_description = 'لینک پرداخت'
 
     def gateway_response_display(self, obj):
-        if obj.gateway_response:
-            return format_html(
-                '<pre style="white-space: pre-wrap;">{}</pre>',
-                json.dumps(obj.gateway_response, indent=2, ensure_ascii=False)
-            )
-        return 'بدون پاسخ'
+        # only rendered on the change page, the changelist never loads payloads
+        events = obj.events.order_by('created', 'id') if obj.pk else []
+        if not events:
+            return 'بدون پاسخ'
+        return format_html_join(
+            '',
+            '<p>{} - {}</p><pre style="white-space: pre-wrap;">{}</pre>',
+            (
+                (
+                    event.get_kind_display(),
+                    event.created,
+                    json.dumps(event.data, indent=2, ensure_ascii=False),
+                )
+                for event in events
+            ),
+        )
     gateway_response_display.short_description = 'پاسخ دروازه پرداخت'
 
     def mark_as_failed(self, request, queryset):
-        updated = queryset.update(status='FAILED')
-        self.message_user(request, f"{updated} پرداخت با موفقیت به‌عنوان ناموفق علامت‌گذاری شدند.", messages.SUCCESS)
+        queue_bulk_action(self, request, 'mark_payments_failed', queryset)
     mark_as_failed.short_description = 'علامت‌گذاری به‌عنوان ناموفق'
 
     def mark_as_paid(self, request, queryset):
-        updated = queryset.update(status='PAID', payment_date=timezone.now())
-        self.message_user(request, f"{updated} پرداخت با موفقیت به‌عنوان موفق علامت‌گذاری شدند.", messages.SUCCESS)
+        queue_bulk_action(self, request, 'mark_payments_paid', queryset)
     mark_as_paid.short_description = 'علامت‌گذاری به‌عنوان موفق'
 
+    def get_search_results(self, request, queryset, search_term):
+        results = search(queryset, search_term, path='order__')
+        pk = as_id(search_term)
+        if pk is not None:
+            results |= queryset.filter(pk=pk)
+        return results, False
+
+    # status changes go through the actions, see OrderAdmin
     def get_readonly_fields(self, request, obj=None):
         if obj:
-            return self.readonly_fields + ('order', 'user', 'authority', 'ref_id')
+            return (
+                *self.readonly_fields, 'order', 'user', 'authority', 'ref_id', 'status'
+            )
         return self.readonly_fields
+
+@admin.register(PaymentOutbox)
+class PaymentOutboxAdmin(admin.ModelAdmin):
+    list_display = ('id', 'payment', 'status', 'attempts', 'available_at', 'updated')
+    list_filter = ('status',)
+    readonly_fields = ('created', 'updated')
+    raw_id_fields = ('payment',)
+    list_select_related = ('payment',)
+    ordering = ('-created',)
+
+@admin.register(BulkActionJob)
+class BulkActionJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id',
+        'action',
+        'status',
+        'progress',
+        'changed',
+        'created_by',
+        'created',
+        'finished',
+    )
+    list_filter = ('status', 'action')
+    list_select_related = ('created_by',)
+    exclude = ('ids',)
+    ordering = ('-created',)
+
+    def progress(self, obj):
+        if not obj.total:
+            return f"{obj.processed}"
+        return f"{obj.processed} / {obj.total} ({obj.processed * 100 // obj.total}%)"
+    progress.short_description = 'پیشرفت'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
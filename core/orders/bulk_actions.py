@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from stats.reports import DASHBOARD_KEY
+
+from .models import BulkActionJob, Order, Payment
+from .services import settle_payments
+
+
+# action -> (model selected in the admin, whether the payments end up paid)
+ACTIONS = {
+    "cancel_orders": (Order, False),
+    "complete_orders": (Order, True),
+    "mark_payments_failed": (Payment, False),
+    "mark_payments_paid": (Payment, True),
+}
+
+
+def enqueue_bulk_action(action, queryset, user=None):
+    """
+    Queue ``action`` over the rows of ``queryset`` that exist now, or return
+    None when it is empty. Reading the ids is one index scan, the writes are
+    what the request must not wait for.
+    """
+    ids = list(queryset.order_by("pk").values_list("pk", flat=True))
+    if not ids:
+        return None
+    return BulkActionJob.objects.create(
+        action=action, ids=ids, total=len(ids), created_by=user
+    )
+
+
+def claim_job(lease_seconds):
+    """
+    Lease the oldest due job. A job whose worker died becomes due again once
+    its lease runs out and resumes after its last finished chunk.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            BulkActionJob.objects.select_for_update(skip_locked=True)
+            .filter(status__in=["PENDING", "RUNNING"], available_at__lte=now)
+            .order_by("available_at")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = "RUNNING"
+        job.attempts += 1
+        job.available_at = now + timedelta(seconds=lease_seconds)
+        job.save(update_fields=["status", "attempts", "available_at", "updated"])
+    return job
+
+
+def _settle(payment_ids, paid, job):
+    if paid:
+        result = {"ref_id": None, "raw_response": {"bulk_action_job": job.id}}
+        return sum(settle_payments(dict.fromkeys(payment_ids, result), []))
+    return sum(settle_payments({}, payment_ids))
+
+
+def apply_chunk(job, ids):
+    """
+    Move one chunk of the selection through the same transitions as the
+    payment callback and reconciliation, returns the rows changed. Only
+    pending payments and orders change, like a callback never overrides a
+    settled payment.
+    """
+    model, paid = ACTIONS[job.action]
+    if model is Payment:
+        return _settle(ids, paid, job)
+
+    payment_ids = list(
+        Payment.objects.filter(order_id__in=ids, status="PENDING").values_list(
+            "id", flat=True
+        )
+    )
+    changed = _settle(payment_ids, paid, job)
+    # orders that never got a payment have nothing else to update
+    changed += Order.objects.filter(id__in=ids, status="PENDING").update(
+        status="COMPLETED" if paid else "CANCELED", updated=timezone.now()
+    )
+    return changed
+
+
+def run_job(job, chunk_size, lease_seconds, max_attempts):
+    """
+    Work through a claimed job one chunk per transaction, so row locks are
+    held for one chunk only and progress survives a crash.
+    """
+    try:
+        remaining = [pk for pk in job.ids if pk > job.last_id]
+        for start in range(0, len(remaining), chunk_size):
+            ids = remaining[start : start + chunk_size]
+            with transaction.atomic():
+                job.changed += apply_chunk(job, ids)
+                job.processed += len(ids)
+                job.last_id = ids[-1]
+                now = timezone.now()
+                BulkActionJob.objects.filter(pk=job.pk).update(
+                    last_id=job.last_id,
+                    processed=job.processed,
+                    changed=job.changed,
+                    # still alive, keep the lease
+                    available_at=now + timedelta(seconds=lease_seconds),
+                    updated=now,
+                )
+    except Exception as e:
+        _handle_failure(job, str(e), max_attempts)
+        return False
+
+    BulkActionJob.objects.filter(pk=job.pk).update(
+        status="DONE", last_error="", finished=timezone.now(), updated=timezone.now()
+    )
+    # entitlements are invalidated per chunk by settle_payments
+    cache.delete(DASHBOARD_KEY)
+    return True
+
+
+def _handle_failure(job, error, max_attempts):
+    now = timezone.now()
+    if job.attempts < max_attempts:
+        BulkActionJob.objects.filter(pk=job.pk).update(
+            status="PENDING",
+            available_at=now + timedelta(seconds=2**job.attempts),
+            last_error=error,
+            updated=now,
+        )
+        return
+    BulkActionJob.objects.filter(pk=job.pk).update(
+        status="FAILED", last_error=error, finished=now, updated=now
+    )
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+from contextlib import ExitStack
+from datetime import timedelta
+from http import HTTPStatus
+from pathlib import Path
+import statistics
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from products.models import Plan
+
+from orders.models import Order, Payment
+
+
+User = get_user_model()
+
+# the changelist options before the scaling work, to compare against
+LEGACY = {
+    Order: {
+        "list_filter": ("status", "created", "updated", "plan", "city", "user"),
+        "list_select_related": ("user", "plan", "payment"),
+        "show_full_result_count": True,
+        "paginator": Paginator,
+    },
+    Payment: {
+        "list_filter": ("status", "created", "payment_date", "order__plan", "user"),
+        "list_select_related": ("order", "user"),
+        "show_full_result_count": True,
+        "paginator": Paginator,
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database with orders and payments spread over a "
+        "period and time the Order and Payment admin changelists, with the "
+        "current options and the legacy ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows", type=int, default=50000, help="Orders to seed, one payment each."
+        )
+        parser.add_argument("--users", type=int, default=5000)
+        parser.add_argument(
+            "--days", type=int, default=365, help="Days the orders are spread over."
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Renders per changelist, the median is reported.",
+        )
+
+    def handle(self, *args, **options):
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        old_name = connection.settings_dict["NAME"]
+        with tempfile.TemporaryDirectory() as tmp:
+            if connection.vendor == "sqlite":
+                test_settings["NAME"] = str(Path(tmp) / "bench_admin.sqlite3")
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                self.seed(options)
+                self.bench(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, options):
+        started = time.monotonic()
+        plans = [
+            Plan.objects.create(duration_days=days, price=days * 1000)
+            for days in (30, 90, 360)
+        ]
+        users = User.objects.bulk_create(
+            User(phone=f"0935{i:07d}", password="!") for i in range(options["users"])
+        )
+        self.admin = User.objects.create_superuser(
+            phone="09100000000", password="password"
+        )
+        self.user = users[0]
+
+        per_day = max(1, options["rows"] // options["days"])
+        now = timezone.now()
+        seeded = 0
+        for day in range(options["days"]):
+            count = min(per_day, options["rows"] - seeded)
+            if count <= 0:
+                break
+            orders = Order.objects.bulk_create(
+                Order(
+                    user=users[(seeded + i) % len(users)],
+                    plan=plans[(seeded + i) % len(plans)],
+                    first_name="bench",
+                    last_name="bench",
+                    phone="09350000000",
+                    city=f"city {(seeded + i) % 30}",
+                    address="bench",
+                    status="COMPLETED",
+                )
+                for i in range(count)
+            )
+            Payment.objects.bulk_create(
+                Payment(
+                    user_id=order.user_id,
+                    order=order,
+                    status="PAID",
+                    amount=order.plan.price,
+                )
+                for order in orders
+            )
+            # created is auto_now_add, move the whole day's batch back at once
+            created = now - timedelta(days=day)
+            Order.objects.filter(id__gte=orders[0].id, id__lte=orders[-1].id).update(
+                created=created
+            )
+            Payment.objects.filter(
+                order_id__gte=orders[0].id, order_id__lte=orders[-1].id
+            ).update(created=created)
+            seeded += count
+        self.stdout.write(
+            f"seeded {seeded} orders and payments in {time.monotonic() - started:.1f}s"
+        )
+
+    def scenarios(self):
+        by_user = {"user__id__exact": self.user.id}
+        return [
+            ("order changelist", "admin:orders_order_changelist", {}),
+            ("order whole history", "admin:orders_order_changelist", {"period": "all"}),
+            (
+                "order by user",
+                "admin:orders_order_changelist",
+                {"period": "all", **by_user},
+            ),
+            ("payment changelist", "admin:orders_payment_changelist", {}),
+            (
+                "payment whole history",
+                "admin:orders_payment_changelist",
+                {"period": "all"},
+            ),
+            (
+                "payment by user",
+                "admin:orders_payment_changelist",
+                {"period": "all", **by_user},
+            ),
+        ]
+
+    def bench(self, options):
+        client = Client()
+        client.force_login(self.admin)
+        self.stdout.write(f"{'changelist':<24}{'legacy':>22}{'current':>22}")
+        for name, url_name, params in self.scenarios():
+            with self.legacy():
+                # the legacy changelist has no period, it always shows everything
+                legacy = self.measure(
+                    client,
+                    url_name,
+                    {k: v for k, v in params.items() if k != "period"},
+                    options,
+                )
+            current = self.measure(client, url_name, params, options)
+            self.stdout.write(
+                f"{name:<24}{self.format(legacy):>22}{self.format(current):>22}"
+            )
+
+    def legacy(self):
+        stack = ExitStack()
+        for model, options in LEGACY.items():
+            stack.enter_context(
+                mock.patch.multiple(admin.site._registry[model], **options)
+            )
+        return stack
+
+    def measure(self, client, url_name, params, options):
+        url = reverse(url_name)
+        client.get(url, params)  # warm up
+        timings = []
+        for _ in range(options["repeat"]):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(url, params)
+                timings.append(time.perf_counter() - started)
+            assert response.status_code == HTTPStatus.OK, response.status_code
+        return statistics.median(timings), len(queries)
+
+    @staticmethod
+    def format(result):
+        elapsed, queries = result
+        return f"{elapsed * 1000:.0f}ms {queries:>3}q"
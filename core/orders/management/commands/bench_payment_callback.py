@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from products.models import Plan
+from utils.zarinpal_stub import StubGateway
+
+from orders.models import Order, Payment
+from orders.services import PAYMENT_SUCCESS_URL
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare payment callback throughput through the sync WSGI view and the "
+        "async ASGI view against a throwaway database and a local gateway stub "
+        "with added latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=8,
+            help="WSGI worker threads, the sync path can only wait on this many.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=200,
+            help="In-flight requests for the ASGI path.",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.5,
+            help="Seconds the stub gateway waits before answering.",
+        )
+
+    def handle(self, *args, **options):
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        old_name = connection.settings_dict["NAME"]
+        with tempfile.TemporaryDirectory() as tmp:
+            if connection.vendor == "sqlite":
+                # a file database so worker threads share it
+                test_settings["NAME"] = str(
+                    Path(tmp) / "bench_payment_callback.sqlite3"
+                )
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                self.bench(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def bench(self, options):
+        total = options["requests"]
+        user = User.objects.create(phone="09000000000")
+        plan = Plan.objects.create(
+            duration_days=30, price=1000, description="callback benchmark"
+        )
+
+        with (
+            StubGateway(latency=options["latency"]) as stub,
+            override_settings(
+                ZARINPAL={
+                    **settings.ZARINPAL,
+                    "API_URL": stub.api_url,
+                    "POOL_SIZE": options["concurrency"],
+                },
+            ),
+        ):
+            wsgi_authorities = self.seed(user, plan, "WSGI", total)
+            asgi_authorities = self.seed(user, plan, "ASGI", total)
+
+            self.report(
+                f"WSGI sync ({options['threads']} threads)",
+                *self.run_wsgi(wsgi_authorities, options["threads"]),
+            )
+            self.report(
+                f"ASGI async ({options['concurrency']} in flight)",
+                *asyncio.run(self.run_asgi(asgi_authorities, options["concurrency"])),
+            )
+
+    def seed(self, user, plan, prefix, total):
+        orders = Order.objects.bulk_create(
+            Order(
+                user=user,
+                plan=plan,
+                first_name="bench",
+                last_name="bench",
+                phone=user.phone,
+                city="bench",
+                address="bench",
+            )
+            for _ in range(total)
+        )
+        payments = Payment.objects.bulk_create(
+            Payment(
+                user=user,
+                order=order,
+                status="PENDING",
+                amount=plan.price,
+                authority=f"{prefix}{order.id:032d}",
+            )
+            for order in orders
+        )
+        return [payment.authority for payment in payments]
+
+    def run_wsgi(self, authorities, threads):
+        url = reverse("payments:callback")
+
+        def call(authority):
+            started = time.perf_counter()
+            response = Client().get(url, {"Authority": authority, "Status": "OK"})
+            return time.perf_counter() - started, response.url == PAYMENT_SUCCESS_URL
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(call, authorities))
+        return results, time.perf_counter() - started
+
+    async def run_asgi(self, authorities, concurrency):
+        url = reverse("payments:callback-async")
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call(authority):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(
+                    url, {"Authority": authority, "Status": "OK"}
+                )
+                return (
+                    time.perf_counter() - started,
+                    response.url == PAYMENT_SUCCESS_URL,
+                )
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(call(authority) for authority in authorities))
+        return results, time.perf_counter() - started
+
+    def report(self, label, results, elapsed):
+        # a failed callback returns early, counting it would flatter the throughput
+        latencies = sorted(latency for latency, ok in results if ok)
+        failed = len(results) - len(latencies)
+        if not latencies:
+            self.stderr.write(f"{label}: all {failed} callbacks failed")
+            return
+        p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+        line = (
+            f"{label}: {len(latencies) / elapsed:.1f} paid req/s, "
+            f"p50 {statistics.median(latencies) * 1000:.0f}ms, p95 {p95 * 1000:.0f}ms"
+        )
+        if failed:
+            self.stderr.write(f"{line}, {failed}/{len(results)} failed and left out")
+        else:
+            self.stdout.write(line)
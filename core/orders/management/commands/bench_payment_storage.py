@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+import statistics
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from products.models import Plan
+
+from orders.models import Order, Payment, PaymentEvent
+
+
+User = get_user_model()
+
+# the last migration with Payment.gateway_response still in the table
+LEGACY_MIGRATION = "0013"
+
+
+def verify_response(i):
+    # the shape of a ZarinPal verify response, what gateway_response held for
+    # a paid payment
+    return {
+        "data": {
+            "code": 100,
+            "message": "Verified",
+            "card_hash": f"{i:064x}",
+            "card_pan": "502229******5995",
+            "ref_id": 201000000 + i,
+            "fee_type": "Merchant",
+            "fee": 2500,
+        },
+        "errors": [],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database with payments whose gateway responses sit "
+        "in the old Payment.gateway_response column, then report the table "
+        "and index sizes and the time to list payments with their orders, "
+        "before move_gateway_payloads and after it and the column drop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=50000,
+            help="Orders to seed, one paid payment each.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Scans per measurement, the median is reported.",
+        )
+
+    def handle(self, *args, **options):
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        old_name = connection.settings_dict["NAME"]
+        with tempfile.TemporaryDirectory() as tmp:
+            if connection.vendor == "sqlite":
+                test_settings["NAME"] = str(Path(tmp) / "bench_payment_storage.sqlite3")
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                # back to before the column was dropped
+                call_command("migrate", "orders", LEGACY_MIGRATION, verbosity=0)
+                self.seed(options)
+                before = self.measure(options)
+                call_command(
+                    "move_gateway_payloads", "--chunk-size", "5000", stdout=self.stdout
+                )
+                call_command("migrate", "orders", verbosity=0)
+                self.compact()
+                after = self.measure(options)
+                self.report(before, after)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, options):
+        started = time.monotonic()
+        plan = Plan.objects.create(duration_days=30, price=30000)
+        user = User.objects.create(phone="09350000000", password="!")
+        orders = Order.objects.bulk_create(
+            Order(
+                user=user,
+                plan=plan,
+                first_name="bench",
+                last_name="bench",
+                phone="09350000000",
+                city="city",
+                address="bench",
+                status="COMPLETED",
+            )
+            for _ in range(options["rows"])
+        )
+        payments = Payment.objects.bulk_create(
+            Payment(
+                user=user,
+                order=order,
+                status="PAID",
+                amount=plan.price,
+                authority=f"A{order.id:035d}",
+            )
+            for order in orders
+        )
+        qn = connection.ops.quote_name
+        table, column = qn(Payment._meta.db_table), qn("gateway_response")
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE {table} SET {column} = %s WHERE id = %s",
+                [
+                    (json.dumps(verify_response(payment.id)), payment.id)
+                    for payment in payments
+                ],
+            )
+        self.compact()
+        self.stdout.write(
+            f"seeded {len(payments)} payments in {time.monotonic() - started:.1f}s"
+        )
+
+    def compact(self):
+        # rewrite the tables so the sizes show what the rows take, not free space
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                for model in (Payment, PaymentEvent):
+                    table = connection.ops.quote_name(model._meta.db_table)
+                    cursor.execute(f"VACUUM FULL ANALYZE {table}")
+            elif connection.vendor == "sqlite":
+                cursor.execute("VACUUM")
+
+    def sizes(self, table):
+        """(table, indexes) bytes, TOAST included in the table on PostgreSQL."""
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    "SELECT pg_table_size(%s), pg_indexes_size(%s)", [table, table]
+                )
+                return cursor.fetchone()
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s",
+                [table],
+            )
+            indexes = [name for (name,) in cursor.fetchall()]
+            cursor.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")
+            pages = dict(cursor.fetchall())
+            return pages.get(table, 0), sum(pages.get(name, 0) for name in indexes)
+
+    def measure(self, options):
+        timings = []
+        for _ in range(options["repeat"]):
+            started = time.perf_counter()
+            # the UserOrderPaymentListView read, over every row
+            for _payment in Payment.objects.select_related("order__plan").iterator(
+                chunk_size=2000
+            ):
+                pass
+            timings.append(time.perf_counter() - started)
+        return {
+            "payment": self.sizes(Payment._meta.db_table),
+            "event": self.sizes(PaymentEvent._meta.db_table),
+            "scan": statistics.median(timings),
+        }
+
+    def report(self, before, after):
+        def mb(size):
+            return f"{size / 2**20:.1f}MB"
+
+        self.stdout.write(f"{'':<24}{'before':>12}{'after':>12}")
+        for label, key, index in (
+            ("payment table", "payment", 0),
+            ("payment indexes", "payment", 1),
+            ("payment event table", "event", 0),
+            ("payment event indexes", "event", 1),
+        ):
+            self.stdout.write(
+                f"{label:<24}{mb(before[key][index]):>12}{mb(after[key][index]):>12}"
+            )
+        self.stdout.write(
+            f"{'payment list scan':<24}"
+            f"{before['scan'] * 1000:>10.0f}ms{after['scan'] * 1000:>10.0f}ms"
+        )
@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+import os
+from pathlib import Path
+import runpy
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from accounts.tokens import RefreshToken
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from products.models import Plan
+import requests
+from utils.loadtest import percentile
+from utils.zarinpal_stub import StubGateway
+
+from orders.models import Order, Payment
+
+
+User = get_user_model()
+
+GUNICORN_CONF = Path(settings.BASE_DIR) / "gunicorn.conf.py"
+SERVERS = ("runserver", "gthread", "uvicorn")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            msg = (
+                f"Server exited with {process.returncode} before accepting "
+                "connections."
+            )
+            raise CommandError(msg)
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    msg = f"Server did not listen on {port} within {timeout}s."
+    raise CommandError(msg)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput of runserver and the gunicorn serving profile on "
+        "the existing endpoints against a throwaway database, with the payment "
+        "gateway stubbed at a given latency, and measure the I/O wait "
+        "GUNICORN_IO_WAIT should be set to."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=300,
+            help="Requests per endpoint and server.",
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=32, help="Client threads."
+        )
+        parser.add_argument(
+            "--gateway-latency",
+            type=float,
+            default=0.1,
+            help="Seconds the stub gateway waits before answering.",
+        )
+        parser.add_argument(
+            "--servers", nargs="+", choices=SERVERS, default=list(SERVERS)
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="GUNICORN_WORKERS, default is the auto-tuned count.",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            help="GUNICORN_THREADS, default is the auto-tuned count.",
+        )
+
+    def handle(self, *args, **options):
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        old_name = connection.settings_dict["NAME"]
+        with tempfile.TemporaryDirectory() as tmp:
+            if connection.vendor == "sqlite":
+                # a file database the server processes can open too
+                test_settings["NAME"] = str(Path(tmp) / "bench_serving.sqlite3")
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                self.user = User.objects.create(phone="09000000001")
+                self.plan = Plan.objects.create(
+                    duration_days=30, price=1000, description="serving benchmark"
+                )
+                self.token = str(RefreshToken.for_user(self.user).access_token)
+
+                with StubGateway(latency=options["gateway_latency"]) as stub:
+                    io_wait = self.measure_io_wait(stub)
+                    for server in options["servers"]:
+                        self.bench(server, stub, io_wait, options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed_payments(self, count):
+        orders = Order.objects.bulk_create(
+            Order(
+                user=self.user,
+                plan=self.plan,
+                first_name="bench",
+                last_name="bench",
+                phone=self.user.phone,
+                city="bench",
+                address="bench",
+            )
+            for _ in range(count)
+        )
+        payments = Payment.objects.bulk_create(
+            Payment(
+                user=self.user,
+                order=order,
+                status="PENDING",
+                amount=self.plan.price,
+                authority=f"V{order.id:035d}",
+            )
+            for order in orders
+        )
+        return [payment.authority for payment in payments]
+
+    def scenarios(self, count):
+        auth = {"Authorization": f"Bearer {self.token}"}
+        sync_authorities = self.seed_payments(count)
+        async_authorities = self.seed_payments(count)
+        # every scenario is a GET of (path, query, headers)
+        return [
+            ("plan-list", lambda _: (reverse("products:plans"), {}, {})),
+            ("order-history", lambda _: (reverse("payments:orders-user"), {}, auth)),
+            (
+                "payment-callback",
+                lambda i: (
+                    reverse("payments:callback"),
+                    {"Authority": sync_authorities[i], "Status": "OK"},
+                    {},
+                ),
+            ),
+            (
+                "payment-callback-async",
+                lambda i: (
+                    reverse("payments:callback-async"),
+                    {"Authority": async_authorities[i], "Status": "OK"},
+                    {},
+                ),
+            ),
+        ]
+
+    def measure_io_wait(self, stub):
+        """
+        Share of wall time the request thread spends off the CPU, from a few
+        sequential in-process requests per endpoint.
+        """
+        client = Client()
+        wall = cpu = 0.0
+        with override_settings(ZARINPAL={**settings.ZARINPAL, "API_URL": stub.api_url}):
+            for _, build in self.scenarios(20):
+                for i in range(20):
+                    path, params, headers = build(i)
+                    started, started_cpu = time.perf_counter(), time.thread_time()
+                    client.get(path, params, headers=headers)
+                    wall += time.perf_counter() - started
+                    cpu += time.thread_time() - started_cpu
+        io_wait = round(1 - cpu / wall, 2) if wall else 0.0
+
+        tuning = runpy.run_path(str(GUNICORN_CONF))
+        workers = tuning["auto_workers"](os.cpu_count())
+        threads = tuning["auto_threads"](io_wait)
+        self.stdout.write(
+            f"measured I/O wait {io_wait:.2f}: GUNICORN_IO_WAIT={io_wait} gives "
+            f"{workers} workers x {threads} threads on {os.cpu_count()} CPUs"
+        )
+        return io_wait
+
+    def command(self, server, port):
+        if server == "runserver":
+            return [
+                sys.executable,
+                "manage.py",
+                "runserver",
+                "--noreload",
+                f"127.0.0.1:{port}",
+            ]
+        return [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-c",
+            str(GUNICORN_CONF),
+            "--bind",
+            f"127.0.0.1:{port}",
+        ]
+
+    def bench(self, server, stub, io_wait, options):
+        port = free_port()
+        env = {
+            **os.environ,
+            # the servers read the throwaway database, not the configured one
+            "DB_NAME": connection.settings_dict["NAME"],
+            "ZARINPAL_API_URL": stub.api_url,
+            "GUNICORN_IO_WAIT": str(io_wait),
+            "GUNICORN_LOG_LEVEL": "warning",
+        }
+        for name in (
+            "PROMETHEUS_MULTIPROC_DIR",
+            "GUNICORN_ACCESS_LOG",
+            "GUNICORN_BIND",
+        ):
+            env.pop(name, None)
+        if server != "runserver":
+            env["GUNICORN_WORKER_CLASS"] = server
+        for option in ("workers", "threads"):
+            if options[option]:
+                env[f"GUNICORN_{option.upper()}"] = str(options[option])
+
+        scenarios = self.scenarios(options["requests"])
+        process = subprocess.Popen(
+            self.command(server, port),
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_for_port(port, process)
+            for name, build in scenarios:
+                self.report(server, name, *self.run(port, build, options))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    def run(self, port, build, options):
+        local = threading.local()
+
+        def call(i):
+            session = getattr(local, "session", None)
+            if session is None:
+                session = local.session = requests.Session()
+            path, params, headers = build(i)
+            started = time.perf_counter()
+            try:
+                response = session.get(
+                    f"http://127.0.0.1:{port}{path}",
+                    params=params,
+                    headers=headers,
+                    allow_redirects=False,
+                    timeout=60,
+                )
+                ok = response.status_code < HTTPStatus.BAD_REQUEST
+            except requests.RequestException:
+                ok = False
+            return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            results = list(pool.map(call, range(options["requests"])))
+        return results, time.perf_counter() - started
+
+    def report(self, server, name, results, elapsed):
+        latencies = [latency for latency, _ in results]
+        errors = sum(1 for _, ok in results if not ok)
+        self.stdout.write(
+            f"{server:<10}{name:<24}{len(results) / elapsed:>8.1f} req/s  "
+            f"p50 {percentile(latencies, 50) * 1000:>6.0f}ms  "
+            f"p95 {percentile(latencies, 95) * 1000:>6.0f}ms  "
+            f"{errors} errors"
+        )
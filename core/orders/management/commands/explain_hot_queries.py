@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+from datetime import timedelta
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from products.entitlements import active_subscriptions
+from products.models import ACTIVE_STATUSES, Subscription
+
+from orders.models import Order, Payment
+from orders.outbox import due_entries
+
+
+def hot_queries():
+    """
+    (name, queryset) for every hot path, shaped exactly like the code that
+    runs them. Sample values do not need to exist, only the plan matters.
+    """
+    now = timezone.now()
+    return [
+        (
+            "entitlement",
+            active_subscriptions(1).values("plan_id", "end_date", "status")[:1],
+        ),
+        (
+            "order-create active check",
+            Subscription.objects.filter(user_id=1, status="ACTIVE").values("id")[:1],
+        ),
+        ("payment callback", Payment.objects.filter(authority="A" * 36)),
+        (
+            "payment history",
+            Payment.objects.filter(user_id=1).order_by("-created", "-id")[:21],
+        ),
+        ("order history", Order.objects.filter(user_id=1)[:20]),
+        ("order admin changelist", Order.objects.all()[:100]),
+        (
+            "expire sweeper",
+            Subscription.objects.filter(
+                status__in=ACTIVE_STATUSES, end_date__lte=now, id__gt=0
+            )
+            .order_by("id")
+            .values_list("id", "user_id")[:1000],
+        ),
+        (
+            "reconcile pending payments",
+            Payment.objects.filter(
+                status="PENDING", created__lt=now - timedelta(minutes=15), id__gt=0
+            )
+            .exclude(authority="")
+            .order_by("id")
+            .only("id", "authority", "amount")[:500],
+        ),
+        ("payment outbox claim", due_entries(now).values_list("id", flat=True)[:100]),
+    ]
+
+
+def full_scans(plan, vendor):
+    """
+    Plan lines that read a whole table. Sorts are left alone, every hot path
+    sorts at most the handful of rows its index range returns.
+    """
+    # "SCAN table USING INDEX" walks an index in order and is fine
+    pattern = r"Seq Scan on" if vendor == "postgresql" else r"SCAN (TABLE )?\w+$"
+    return [
+        line.strip() for line in plan.splitlines() if re.search(pattern, line.strip())
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the query plan of every hot query path. With --check, exit "
+        "non-zero when one of them scans a whole table, for CI."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--only", nargs="+", metavar="NAME", help="Only explain these paths."
+        )
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Run the queries and show actual timings (PostgreSQL only).",
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Fail on full table scans. On PostgreSQL sequential scans are "
+            "disabled for the check, so small test tables still show which index "
+            "would be used.",
+        )
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if options["analyze"] and vendor != "postgresql":
+            msg = "--analyze needs PostgreSQL."
+            raise CommandError(msg)
+
+        failures = []
+        for name, queryset in hot_queries():
+            if options["only"] and name not in options["only"]:
+                continue
+            plan = self.explain(queryset, vendor, options)
+            self.stdout.write(f"== {name}\n{plan}\n")
+            scans = full_scans(plan, vendor)
+            if scans:
+                failures.append(name)
+                self.stdout.write(f"!! full scan: {'; '.join(scans)}\n")
+
+        if failures and options["check"]:
+            msg = f"Hot queries without a usable index: {', '.join(failures)}"
+            raise CommandError(msg)
+
+    def explain(self, queryset, vendor, options):
+        explain_options = {"analyze": True} if options["analyze"] else {}
+        if vendor != "postgresql" or not options["check"]:
+            return queryset.explain(**explain_options)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            return queryset.explain(**explain_options)
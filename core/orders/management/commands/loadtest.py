@@ -0,0 +1,350 @@
+from __future__ import annotations
+
+from datetime import timedelta
+from http import HTTPStatus
+from pathlib import Path
+import tempfile
+from types import SimpleNamespace
+
+from accounts.models import Profile
+from accounts.otp import get_otp_store
+from accounts.tokens import RefreshToken
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from products.models import Plan, Subscription
+from products.permissions import HasValidSubscription
+from rest_framework.test import APIClient, APIRequestFactory
+from utils.loadtest import (
+    Scenario,
+    cache_settings,
+    diff_baseline,
+    format_table,
+    load_baseline,
+    run_scenario,
+    save_baseline,
+)
+from utils.zarinpal_stub import StubGateway
+
+from orders.models import Order, Payment
+from orders.services import PAYMENT_SUCCESS_URL
+
+
+User = get_user_model()
+
+BASELINE_PATH = Path(settings.BASE_DIR) / "loadtest_baseline.json"
+PASSWORD = "Load-test-1!"
+NEW_PASSWORD = "Load-test-2!"
+
+
+def issued_otp(phone):
+    return get_otp_store().current_code(phone)
+
+
+class Funnel:
+    """
+    Seeded dataset and one Scenario per endpoint of the
+    OTP -> verify -> order -> callback -> gated access funnel.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.trial_plan = Plan.objects.create(
+            duration_days=3, price=0, description="trial"
+        )
+        self.plan = Plan.objects.create(
+            duration_days=30, price=1000, description="monthly"
+        )
+        self.admin = User.objects.create_superuser(
+            phone="09100000000", password=PASSWORD
+        )
+        self.password_hash = make_password(PASSWORD)
+        self.pools = {}
+
+    def users(self, tag):
+        """
+        ``size`` fresh users (with profiles) per tag, so mutating scenarios
+        never step on each other's data.
+        """
+        if tag not in self.pools:
+            prefix = 920 + len(self.pools)
+            users = User.objects.bulk_create(
+                User(phone=f"0{prefix}{i:07d}", password=self.password_hash)
+                for i in range(self.size)
+            )
+            Profile.objects.bulk_create(Profile(user=user) for user in users)
+            self.pools[tag] = users
+        return self.pools[tag]
+
+    def paid_orders(self, tag):
+        users = self.users(tag)
+        orders = Order.objects.bulk_create(
+            Order(
+                user=user,
+                plan=self.plan,
+                first_name="load",
+                last_name="test",
+                phone=user.phone,
+                city="Tehran",
+                address="load test",
+            )
+            for user in users
+        )
+        Subscription.objects.bulk_create(
+            Subscription(
+                user=user,
+                plan=self.plan,
+                status="CANCELED",
+                end_date=timezone.now() + timedelta(days=self.plan.duration_days),
+            )
+            for user in users
+        )
+        return Payment.objects.bulk_create(
+            Payment(
+                user=order.user,
+                order=order,
+                status="PENDING",
+                amount=self.plan.price,
+                authority=f"L{tag[:3].upper()}{order.id:032d}",
+            )
+            for order in orders
+        )
+
+    @staticmethod
+    def client(user=None):
+        client = APIClient()
+        if user is not None:
+            # with the claims the stateless authentication reads, like a login
+            token = RefreshToken.for_user(user).access_token
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        return client
+
+    def scenarios(self):
+        otp_phones = [f"0930{i:07d}" for i in range(self.size)]
+        signup, profile, password, jwt, orders = (
+            self.users(tag)
+            for tag in ("signup", "profile", "password", "jwt", "orders")
+        )
+        refresh_tokens = [str(RefreshToken.for_user(user)) for user in jwt]
+        sync_payments = self.paid_orders("callback")
+        async_payments = self.paid_orders("async")
+        paid_users = [payment.user for payment in sync_payments]
+        factory = APIRequestFactory()
+
+        def create_order(i):
+            return self.client(orders[i]).post(
+                reverse("payments:orders"),
+                {
+                    "plan": self.plan.id,
+                    "first_name": "load",
+                    "last_name": "test",
+                    "phone": orders[i].phone,
+                    "city": "Tehran",
+                    "address": "load test",
+                },
+                format="json",
+            )
+
+        def gated_access(i):
+            request = factory.get("/")
+            request.user = paid_users[i]
+            allowed = HasValidSubscription().has_permission(request, None)
+            return SimpleNamespace(status_code=200 if allowed else 403)
+
+        def callback(url_name, payments):
+            return lambda i: self.client().get(
+                reverse(url_name),
+                {"Authority": payments[i].authority, "Status": "OK"},
+            )
+
+        def paid(response):
+            return (
+                response.status_code == HTTPStatus.FOUND
+                and response.url == PAYMENT_SUCCESS_URL
+            )
+
+        return [
+            # accounts
+            Scenario("otp-request", lambda i: self.client().post(
+                reverse("accounts:login-signup"),
+                {"phone": otp_phones[i]},
+                format="json",
+            )),
+            Scenario("otp-verify", lambda i: self.client().post(
+                reverse("accounts:login-signup-verify"),
+                {"phone": otp_phones[i], "otp": issued_otp(otp_phones[i]) or "000000"},
+                format="json",
+            )),
+            Scenario("complete-signup", lambda i: self.client(signup[i]).post(
+                reverse("accounts:complete-signup"),
+                {
+                    "email": f"user{i}@example.com",
+                    "password": PASSWORD,
+                    "password1": PASSWORD,
+                },
+                format="json",
+            )),
+            Scenario("profile-get", lambda i: self.client(profile[i]).get(
+                reverse("accounts:profile"),
+            )),
+            Scenario("profile-patch", lambda i: self.client(profile[i]).patch(
+                reverse("accounts:profile"), {"first_name": f"user {i}"}, format="json",
+            )),
+            Scenario("change-password", lambda i: self.client(password[i]).put(
+                reverse("accounts:change-password"),
+                {
+                    "old_password": PASSWORD,
+                    "new_password": NEW_PASSWORD,
+                    "new_password1": NEW_PASSWORD,
+                },
+                format="json",
+            )),
+            Scenario("jwt-login", lambda i: self.client().post(
+                reverse("accounts:jwt-login"),
+                {"phone": jwt[i].phone, "password": PASSWORD},
+                format="json",
+            )),
+            Scenario("jwt-refresh", lambda i: self.client().post(
+                reverse("accounts:jwt-refresh"),
+                {"refresh": refresh_tokens[i]},
+                format="json",
+            )),
+            Scenario("jwt-verify", lambda i: self.client().post(
+                reverse("accounts:jwt-verify"),
+                {"token": str(RefreshToken.for_user(jwt[i]).access_token)},
+                format="json",
+            )),
+            # orders
+            Scenario("order-create", create_order),
+            Scenario("order-payment", lambda i: self.client(paid_users[i]).get(
+                reverse("payments:order-payment", args=[sync_payments[i].order_id]),
+            )),
+            Scenario(
+                "payment-callback",
+                callback("payments:callback", sync_payments),
+                ok=paid,
+            ),
+            Scenario(
+                "payment-callback-async",
+                callback("payments:callback-async", async_payments),
+                ok=paid,
+            ),
+            Scenario("order-history", lambda i: self.client(paid_users[i]).get(
+                reverse("payments:orders-user"),
+            )),
+            # products
+            Scenario("plan-list", lambda _: self.client().get(
+                reverse("products:plans"),
+            )),
+            Scenario("plan-create", lambda i: self.client(self.admin).post(
+                reverse("products:plans"),
+                {"duration_days": 90, "price": 3000 + i},
+                format="json",
+            )),
+            Scenario("gated-access", gated_access),
+        ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test every endpoint of the subscription funnel against a throwaway "
+        "database, a stub gateway and an in-memory cache, and diff the results "
+        "against a stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations", type=int, default=100, help="Requests per endpoint."
+        )
+        parser.add_argument("--concurrency", type=int, default=1)
+        parser.add_argument(
+            "--gateway-latency",
+            type=float,
+            default=0.0,
+            help="Seconds the stub gateway waits before answering.",
+        )
+        parser.add_argument(
+            "--cache", choices=["locmem", "fakeredis"], default="locmem"
+        )
+        parser.add_argument(
+            "--only", nargs="+", metavar="ENDPOINT", help="Run only these scenarios."
+        )
+        parser.add_argument(
+            "--baseline",
+            default=str(BASELINE_PATH),
+            help="Baseline file to diff against.",
+        )
+        parser.add_argument(
+            "--save-baseline",
+            action="store_true",
+            help="Overwrite the baseline with this run.",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.25,
+            help="Allowed slowdown before a metric counts as a regression.",
+        )
+
+    def handle(self, *args, **options):
+        caches = cache_settings(options["cache"])
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        old_name = connection.settings_dict["NAME"]
+        with tempfile.TemporaryDirectory() as tmp:
+            if connection.vendor == "sqlite":
+                # a file database so worker threads share it
+                test_settings["NAME"] = str(Path(tmp) / "loadtest.sqlite3")
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                results = self.run(options, caches)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(format_table(results))
+        self.compare(results, options)
+
+    def run(self, options, caches):
+        with StubGateway(latency=options["gateway_latency"]) as stub, override_settings(
+            CACHES=caches,
+            RATELIMIT_ENABLE=False,
+            ZARINPAL={**settings.ZARINPAL, "API_URL": stub.api_url},
+            # measure the enqueue, not the provider, whatever the cache
+            OTP_DELIVERY={**settings.OTP_DELIVERY, "LOCAL_QUEUE": True},
+        ):
+            cache.clear()
+            funnel = Funnel(options["iterations"])
+            results = {}
+            for scenario in funnel.scenarios():
+                if options["only"] and scenario.name not in options["only"]:
+                    continue
+                results[scenario.name] = run_scenario(
+                    scenario, options["iterations"], options["concurrency"],
+                )
+            return results
+
+    def compare(self, results, options):
+        path = Path(options["baseline"])
+        if options["save_baseline"]:
+            save_baseline(path, results)
+            self.stdout.write(f"Baseline saved to {path}")
+            return
+        if not path.exists():
+            self.stdout.write(
+                f"No baseline at {path}, run with --save-baseline to create one."
+            )
+            return
+
+        lines, regressions = diff_baseline(
+            load_baseline(path), results, options["tolerance"]
+        )
+        self.stdout.write("\n".join(lines))
+        if regressions:
+            names = ", ".join(f"{name}.{metric}" for name, metric in regressions)
+            msg = f"Regressions against baseline: {names}"
+            raise CommandError(msg)
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from orders.models import Payment, PaymentEvent
+
+
+COLUMN = "gateway_response"
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the payloads left in the old Payment.gateway_response column "
+        "into PaymentEvent, one transaction per chunk of payments. Moved rows "
+        "get a NULL column, so the command can be stopped and run again. Run "
+        "it before migrating past orders 0013, 0014 drops the column."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--after-id", type=int, default=0, help="Resume after this payment id."
+        )
+
+    def handle(self, *args, **options):
+        table = Payment._meta.db_table
+        with connection.cursor() as cursor:
+            columns = {
+                column.name
+                for column in connection.introspection.get_table_description(
+                    cursor, table
+                )
+            }
+        if COLUMN not in columns:
+            msg = f"{table}.{COLUMN} is already gone, nothing to move."
+            raise CommandError(msg)
+
+        qn = connection.ops.quote_name
+        select = (
+            f"SELECT id, {qn(COLUMN)} FROM {qn(table)} "
+            f"WHERE id > %s AND {qn(COLUMN)} IS NOT NULL ORDER BY id LIMIT %s"
+        )
+        clear = f"UPDATE {qn(table)} SET {qn(COLUMN)} = NULL WHERE id IN (%s)"
+
+        started = time.monotonic()
+        payments = moved = 0
+        last_id = options["after_id"]
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(select, [last_id, options["chunk_size"]])
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                ids = [row[0] for row in rows]
+                # the rest through the ORM, which converts the dates per database
+                payments_by_id = {
+                    payment.id: payment
+                    for payment in Payment.objects.filter(id__in=ids).only(
+                        "id", "status", "payment_date", "updated"
+                    )
+                }
+                events = []
+                for pk, payload in rows:
+                    # jsonb comes back decoded, SQLite's JSON as text
+                    data = json.loads(payload) if isinstance(payload, str) else payload
+                    if data:
+                        payment = payments_by_id[pk]
+                        # the column only kept the latest exchange
+                        kind = "REQUEST" if payment.status == "PENDING" else "VERIFY"
+                        events.append(
+                            PaymentEvent.build(
+                                pk, kind, data, payment.payment_date or payment.updated
+                            )
+                        )
+                PaymentEvent.objects.bulk_create(events)
+                cursor.execute(clear % ", ".join(["%s"] * len(ids)), ids)
+            payments += len(rows)
+            moved += len(events)
+            last_id = ids[-1]
+            self.stdout.write(
+                f"moved {moved} payloads from {payments} payments, up to id {last_id}"
+            )
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"Moved {moved} payloads from {payments} payments in {elapsed:.2f}s"
+        )
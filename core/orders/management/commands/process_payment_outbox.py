@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from orders.outbox import claim_batch, process_entry
+
+
+class Command(BaseCommand):
+    help = "Send queued payment requests to the gateway."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--max-attempts", type=int, default=5)
+        parser.add_argument(
+            "--lease",
+            type=int,
+            default=60,
+            help="Seconds a claimed entry stays invisible to other workers.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the outbox every --interval seconds.",
+        )
+        parser.add_argument("--interval", type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        while True:
+            entries = claim_batch(options["batch_size"], options["lease"])
+            sent = sum(
+                self.process(entry, options["max_attempts"]) for entry in entries
+            )
+            if entries:
+                self.stdout.write(f"Processed {len(entries)} entries, {sent} sent")
+            if not options["loop"]:
+                break
+            if not entries:
+                time.sleep(options["interval"])
+
+    def process(self, entry, max_attempts):
+        try:
+            return process_entry(entry, max_attempts)
+        except DatabaseError as e:
+            # the entry is retried once its lease runs out, keep the worker going
+            self.stderr.write(f"Outbox entry {entry.id} not written back: {e}")
+            close_old_connections()
+            return False
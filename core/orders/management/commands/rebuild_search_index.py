@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from orders.models import Order
+from orders.search import index_orders
+
+
+class Command(BaseCommand):
+    help = "Write the search document of every order, one transaction per chunk of ids."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument(
+            "--after-id", type=int, default=0, help="Resume after this order id."
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        indexed = 0
+        last_id = options["after_id"]
+        while True:
+            ids = list(
+                Order.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)[: options["chunk_size"]]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                index_orders(ids)
+            indexed += len(ids)
+            last_id = ids[-1]
+            self.stdout.write(f"indexed {indexed} orders, up to id {last_id}")
+
+        self.stdout.write(
+            f"Indexed {indexed} orders in {time.monotonic() - started:.2f}s"
+        )
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from utils.zarinpal_client import UNPAID_CODES, ZarinpalError, get_client
+
+from orders.models import Payment
+from orders.services import settle_payments
+
+
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Command(BaseCommand):
+    help = "Verify stale pending payments whose callback never arrived."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            default=30,
+            help="Only payments pending for at least this many minutes.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=200)
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=8,
+            help="Verify calls in flight at once.",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=0,
+            help="Max verify calls per second, 0 for no limit.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="List the payments a run would verify, without calling the gateway.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=options["older_than"])
+        if options["dry_run"]:
+            # verifying captures the payment at the gateway, a dry run must not
+            self.list_candidates(cutoff, options)
+            return
+
+        client = get_client()
+        limiter = RateLimiter(options["rate"])
+        totals = {"scanned": 0, "paid": 0, "failed": 0, "errors": 0}
+        started = time.monotonic()
+
+        def verify(payment):
+            limiter.wait()
+            try:
+                return (
+                    payment,
+                    client.verify_payment(payment.authority, payment.amount),
+                    None,
+                )
+            except ZarinpalError as e:
+                return payment, None, e
+
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            for payments in self.candidates(cutoff, options):
+                verified, unpaid = {}, []
+                for payment, result, error in pool.map(verify, payments):
+                    if result is not None:
+                        verified[payment.id] = result
+                    elif error.code in UNPAID_CODES:
+                        unpaid.append(payment.id)
+                    else:
+                        # transport, merchant or configuration errors leave it pending
+                        totals["errors"] += 1
+                        self.stderr.write(f"payment {payment.id} left pending: {error}")
+
+                paid, failed = settle_payments(verified, unpaid)
+
+                totals["scanned"] += len(payments)
+                totals["paid"] += paid
+                totals["failed"] += failed
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    "scanned {scanned} paid {paid} failed {failed} "
+                    "errors {errors}".format(**totals)
+                    + f" ({totals['scanned'] / elapsed:.1f} verifies/sec)"
+                )
+
+        self.stdout.write(
+            "Reconciled {scanned} payments: {paid} paid, {failed} failed, "
+            "{errors} errors".format(**totals)
+        )
+
+    def candidates(self, cutoff, options):
+        last_id = 0
+        while True:
+            payments = list(
+                Payment.objects.filter(
+                    status="PENDING", created__lt=cutoff, id__gt=last_id
+                )
+                .exclude(authority="")
+                .order_by("id")
+                .only("id", "authority", "amount")[: options["chunk_size"]]
+            )
+            if not payments:
+                return
+            last_id = payments[-1].id
+            yield payments
+
+    def list_candidates(self, cutoff, options):
+        scanned = 0
+        for payments in self.candidates(cutoff, options):
+            for payment in payments:
+                self.stdout.write(
+                    f"payment {payment.id} authority {payment.authority} "
+                    f"amount {payment.amount}"
+                )
+            scanned += len(payments)
+        self.stdout.write(f"[dry run] {scanned} payments would be verified")
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.bulk_actions import claim_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Run queued admin bulk actions, one chunk per transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument("--max-attempts", type=int, default=3)
+        parser.add_argument(
+            "--lease",
+            type=int,
+            default=60,
+            help=(
+                "Seconds a claimed job stays invisible to other workers after "
+                "each chunk."
+            ),
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling for jobs every --interval seconds.",
+        )
+        parser.add_argument("--interval", type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_job(options["lease"])
+            if job is not None:
+                done = run_job(
+                    job,
+                    options["chunk_size"],
+                    options["lease"],
+                    options["max_attempts"],
+                )
+                job.refresh_from_db()
+                state = "done" if done else job.status.lower()
+                self.stdout.write(
+                    f"Job {job.id} {job.action}: {job.processed}/{job.total} "
+                    f"processed, {job.changed} changed, {state}"
+                )
+            elif not options["loop"]:
+                break
+            else:
+                time.sleep(options["interval"])
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+from utils.zarinpal_stub import StubGateway
+
+
+class Command(BaseCommand):
+    help = "Run a local stub of the ZarinPal payment API."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.0,
+            help="Seconds to wait before answering each call.",
+        )
+
+    def handle(self, *args, **options):
+        stub = StubGateway(options["host"], options["port"], options["latency"])
+        self.stdout.write(f"Stub gateway listening on {stub.api_url}")
+        try:
+            stub.serve_forever()
+        except KeyboardInterrupt:
+            stub.stop()
@@ -0,0 +1,32 @@
+# Generated by Django 4.2 on 2026-10-18 13:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_payment_payment_date_payment_ref_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('PENDING', 'pending'), ('PROCESSING', 'processing'), ('DONE', 'done'), ('FAILED', 'failed')], default='PENDING', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('payment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='orders.payment')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='paymentoutbox',
+            index=models.Index(fields=['status', 'available_at'], name='orders_paym_status_2ce89d_idx'),
+        ),
+    ]
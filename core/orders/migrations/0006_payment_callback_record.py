@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-18 13:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_payment_outbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='authority',
+            field=models.CharField(blank=True, db_index=True, max_length=100),
+        ),
+        migrations.CreateModel(
+            name='PaymentCallbackRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('authority', models.CharField(max_length=100, unique=True)),
+                ('paid', models.BooleanField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('payment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='callback_records', to='orders.payment')),
+            ],
+        ),
+    ]
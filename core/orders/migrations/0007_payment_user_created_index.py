@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_payment_callback_record'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', '-created', '-id'], name='orders_paym_user_id_19648d_idx'),
+        ),
+    ]
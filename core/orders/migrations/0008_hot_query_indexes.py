@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-18 13:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_payment_user_created_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-created'], name='orders_orde_created_743fca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created'], name='orders_orde_user_id_710475_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('status', 'PENDING')), fields=['id'], name='payment_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentoutbox',
+            index=models.Index(condition=models.Q(('status__in', ['PENDING', 'PROCESSING'])), fields=['available_at'], name='payment_outbox_due_idx'),
+        ),
+    ]
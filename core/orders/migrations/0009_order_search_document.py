@@ -0,0 +1,67 @@
+# Generated by Django 4.2 on 2026-10-18 14:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# The search index depends on the database, orders.search queries whichever
+# of the two exists. Documents of existing orders come from
+# manage.py rebuild_search_index.
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX orders_search_document_trgm ON orders_ordersearchdocument USING gin (document gin_trgm_ops)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS orders_search_document_trgm",
+]
+
+# an external content FTS5 table, the triggers keep it in step with the documents
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE orders_ordersearch_fts USING fts5("
+    "document, content='orders_ordersearchdocument', content_rowid='order_id', tokenize='trigram')",
+    "CREATE TRIGGER orders_ordersearch_ai AFTER INSERT ON orders_ordersearchdocument BEGIN "
+    "INSERT INTO orders_ordersearch_fts(rowid, document) VALUES (new.order_id, new.document); END",
+    "CREATE TRIGGER orders_ordersearch_ad AFTER DELETE ON orders_ordersearchdocument BEGIN "
+    "INSERT INTO orders_ordersearch_fts(orders_ordersearch_fts, rowid, document) "
+    "VALUES ('delete', old.order_id, old.document); END",
+    "CREATE TRIGGER orders_ordersearch_au AFTER UPDATE ON orders_ordersearchdocument BEGIN "
+    "INSERT INTO orders_ordersearch_fts(orders_ordersearch_fts, rowid, document) "
+    "VALUES ('delete', old.order_id, old.document); "
+    "INSERT INTO orders_ordersearch_fts(rowid, document) VALUES (new.order_id, new.document); END",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS orders_ordersearch_au",
+    "DROP TRIGGER IF EXISTS orders_ordersearch_ad",
+    "DROP TRIGGER IF EXISTS orders_ordersearch_ai",
+    "DROP TABLE IF EXISTS orders_ordersearch_fts",
+]
+
+
+def run_for_vendor(postgres, sqlite):
+    def run(apps, schema_editor):
+        statements = {"postgresql": postgres, "sqlite": sqlite}.get(schema_editor.connection.vendor, [])
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderSearchDocument',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search', serialize=False, to='orders.order')),
+                ('document', models.TextField()),
+            ],
+        ),
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARD, SQLITE_FORWARD),
+            run_for_vendor(POSTGRES_BACKWARD, SQLITE_BACKWARD),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-18 14:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+# gateway_response leaves the model here but its column stays until
+# manage.py move_gateway_payloads has copied it into PaymentEvent,
+# 0014_drop_payment_gateway_response drops it then.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_bulk_action_job'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveField(
+                    model_name='payment',
+                    name='gateway_response',
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('REQUEST', 'request'), ('VERIFY', 'verify')], max_length=10)),
+                ('payload', models.BinaryField()),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('payment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='orders.payment')),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-18 14:47
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fail_unfinished_jobs(apps, schema_editor):
+    # their selection was a pickled query, it does not carry over to ids
+    BulkActionJob = apps.get_model('orders', 'BulkActionJob')
+    BulkActionJob.objects.filter(status__in=['PENDING', 'RUNNING']).update(
+        status='FAILED',
+        last_error='Queued before selections were stored as ids, run the action again.',
+        finished=timezone.now(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_payment_event'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_unfinished_jobs, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='bulkactionjob',
+            name='max_id',
+        ),
+        migrations.RemoveField(
+            model_name='bulkactionjob',
+            name='query',
+        ),
+        migrations.AddField(
+            model_name='bulkactionjob',
+            name='ids',
+            field=models.JSONField(default=list),
+        ),
+    ]
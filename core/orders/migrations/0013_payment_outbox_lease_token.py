@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 15:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_bulk_action_job_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentoutbox',
+            name='lease_token',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+def check_payloads_moved(apps, schema_editor):
+    Payment = apps.get_model('orders', 'Payment')
+    if Payment.objects.filter(gateway_response__isnull=False).exists():
+        raise RuntimeError(
+            'orders_payment.gateway_response still holds payloads, run '
+            'manage.py move_gateway_payloads before migrating past 0013.'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_payment_outbox_lease_token'),
+    ]
+
+    operations = [
+        # back into the state for a moment, 0011 only took it out of the model
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='payment',
+                    name='gateway_response',
+                    field=models.JSONField(blank=True, default=dict, null=True),
+                ),
+            ],
+        ),
+        migrations.RunPython(check_payloads_moved, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='payment',
+            name='gateway_response',
+        ),
+    ]
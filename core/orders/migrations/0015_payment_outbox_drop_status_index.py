@@ -0,0 +1,19 @@
+# Generated by Django 4.2 on 2026-10-18 15:27
+
+from django.db import migrations
+
+
+# payment_outbox_due_idx from 0008 serves the one query this index was for.
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0014_drop_payment_gateway_response'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='paymentoutbox',
+            name='orders_paym_status_2ce89d_idx',
+        ),
+    ]
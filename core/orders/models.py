@@ -1,9 +1,13 @@
 from __future__ import annotations
 
+import json
+import zlib
+
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 from django.db import models
+from django.utils import timezone
 from products.models import Plan
 
 
@@ -34,6 +38,10 @@ class Order(models.Model):
 
     class Meta:
         ordering = ("-created",)
+        indexes = (
+            models.Index(fields=["-created"]),
+            models.Index(fields=["user", "-created"]),
+        )
 
     def __str__(self):
         return f"Order {self.id}"
@@ -50,15 +58,25 @@ class Payment(models.Model):
     order = models.OneToOneField(Order, on_delete=models.PROTECT, related_name="payment")
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
     amount = models.PositiveIntegerField()
-    authority = models.CharField(max_length=100, blank=True)
+    authority = models.CharField(max_length=100, blank=True, db_index=True)
     ref_id = models.CharField(max_length=100, blank=True, null=True)
     payment_url = models.URLField(blank=True, null=True)
-    gateway_response = models.JSONField(default=dict, blank=True, null=True)
     payment_date = models.DateTimeField(blank=True, null=True)
 
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = (
+            models.Index(fields=["user", "-created", "-id"]),
+            # reconcile_payments walks the pending rows by id
+            models.Index(
+                fields=["id"],
+                condition=models.Q(status="PENDING"),
+                name="payment_pending_idx",
+            ),
+        )
+
     def clean(self):
         if self.amount != self.order.plan.price:
             raise ValidationError("Payment amount does not match plan price.")
@@ -68,4 +86,160 @@ class Payment(models.Model):
         super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"Payment {self.id} for order {self.order.id}"
+        return f"Payment {self.id} for order {self.order_id}"
+
+
+class PaymentEvent(models.Model):
+    """
+    A raw gateway response for a payment, zlib compressed. Append-only and
+    kept off the Payment row, which every order and payment listing reads;
+    the payloads are only loaded by the payment admin page.
+    """
+
+    KIND_CHOICES = (
+        ("REQUEST", "request"),
+        ("VERIFY", "verify"),
+    )
+
+    payment = models.ForeignKey(
+        Payment, on_delete=models.CASCADE, related_name="events"
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    payload = models.BinaryField()
+    created = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} event {self.id} of payment {self.payment_id}"
+
+    @classmethod
+    def build(cls, payment_id, kind, data, created=None):
+        payload = zlib.compress(json.dumps(data, separators=(",", ":")).encode())
+        return cls(
+            payment_id=payment_id,
+            kind=kind,
+            payload=payload,
+            created=created or timezone.now(),
+        )
+
+    @property
+    def data(self):
+        return json.loads(zlib.decompress(bytes(self.payload)))
+
+
+class PaymentCallbackRecord(models.Model):
+
+    authority = models.CharField(max_length=100, unique=True)
+    payment = models.ForeignKey(
+        Payment, on_delete=models.CASCADE, related_name="callback_records"
+    )
+    paid = models.BooleanField()
+
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Callback {self.authority} ({'paid' if self.paid else 'failed'})"
+
+# entries claim_batch may pick up, the condition of payment_outbox_due_idx
+OUTBOX_DUE_STATUSES = ["PENDING", "PROCESSING"]
+
+
+class PaymentOutbox(models.Model):
+
+    STATUS_CHOICES = (
+        ("PENDING", "pending"),
+        ("PROCESSING", "processing"),
+        ("DONE", "done"),
+        ("FAILED", "failed"),
+    )
+
+    payment = models.OneToOneField(
+        Payment, on_delete=models.CASCADE, related_name="outbox"
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="PENDING")
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    # set by each claim, a worker only writes back while its claim is the current one
+    lease_token = models.UUIDField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = (
+            # claim_batch takes the due entries oldest first
+            models.Index(
+                fields=["available_at"],
+                condition=models.Q(status__in=OUTBOX_DUE_STATUSES),
+                name="payment_outbox_due_idx",
+            ),
+        )
+
+    def __str__(self):
+        return f"Outbox {self.id} for payment {self.payment_id}"
+
+class OrderSearchDocument(models.Model):
+    """
+    Searchable text of an order, its user and payment, kept by orders.search.
+    Indexed with pg_trgm on PostgreSQL and mirrored into an FTS5 table on
+    SQLite, see migration 0009.
+    """
+
+    order = models.OneToOneField(
+        Order, on_delete=models.CASCADE, primary_key=True, related_name="search"
+    )
+    document = models.TextField()
+
+    def __str__(self):
+        return f"Search document of order {self.order_id}"
+
+class BulkActionJob(models.Model):
+    """
+    An admin bulk action run in the background by run_bulk_actions, over the
+    selected rows in chunks of increasing id.
+    """
+
+    ACTION_CHOICES = (
+        ("cancel_orders", "cancel orders"),
+        ("complete_orders", "complete orders"),
+        ("mark_payments_failed", "mark payments failed"),
+        ("mark_payments_paid", "mark payments paid"),
+    )
+    STATUS_CHOICES = (
+        ("PENDING", "pending"),
+        ("RUNNING", "running"),
+        ("DONE", "done"),
+        ("FAILED", "failed"),
+    )
+
+    action = models.CharField(max_length=30, choices=ACTION_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="PENDING")
+    # the primary keys selected in the admin, in increasing order. Plain data
+    # that a deploy between enqueue and run cannot invalidate.
+    ids = models.JSONField(default=list)
+    last_id = models.BigIntegerField(default=0)
+    total = models.PositiveIntegerField(blank=True, null=True)
+    processed = models.PositiveIntegerField(default=0)
+    changed = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, blank=True, null=True, related_name="+"
+    )
+    available_at = models.DateTimeField(default=timezone.now)
+
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=["available_at"],
+                condition=models.Q(status__in=["PENDING", "RUNNING"]),
+                name="bulk_action_job_due_idx",
+            ),
+        )
+
+    def __str__(self):
+        return f"Bulk action {self.id}: {self.get_action_display()}"
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from datetime import timedelta
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, F
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from stats.rollups import record_payments
+from utils.zarinpal_client import get_client
+
+from .models import OUTBOX_DUE_STATUSES, Order, Payment, PaymentEvent, PaymentOutbox
+from .search import index_orders
+
+
+def enqueue_payment_request(payment):
+    return PaymentOutbox.objects.create(payment=payment)
+
+
+def due_entries(now):
+    """
+    Entries due at ``now``, oldest first. The status condition goes in as
+    literals: SQLite only matches a partial index against constants, with
+    bound parameters payment_outbox_due_idx would go unused.
+    """
+    statuses = ", ".join(f"'{status}'" for status in OUTBOX_DUE_STATUSES)
+    due = RawSQL(f"status IN ({statuses})", [], output_field=BooleanField())
+    return PaymentOutbox.objects.filter(due, available_at__lte=now).order_by(
+        "available_at"
+    )
+
+
+def claim_batch(batch_size, lease_seconds):
+    """
+    Lease up to ``batch_size`` due entries. Rows stuck in PROCESSING (crashed
+    worker) become due again once their lease runs out, a new claim replaces
+    the lease token so the old worker can no longer write them back.
+    """
+    now = timezone.now()
+    token = uuid.uuid4()
+    with transaction.atomic():
+        ids = list(
+            due_entries(now)
+            .select_for_update(skip_locked=True)
+            .values_list("id", flat=True)[:batch_size]
+        )
+        PaymentOutbox.objects.filter(id__in=ids).update(
+            status="PROCESSING",
+            attempts=F("attempts") + 1,
+            available_at=now + timedelta(seconds=lease_seconds),
+            lease_token=token,
+        )
+    return list(
+        PaymentOutbox.objects.select_related("payment__order").filter(id__in=ids)
+    )
+
+
+def _leased(entry):
+    return PaymentOutbox.objects.filter(
+        pk=entry.pk, status="PROCESSING", lease_token=entry.lease_token
+    )
+
+
+def process_entry(entry, max_attempts, client=None):
+    """
+    Request the payment of a claimed entry. Returns whether it was sent; an
+    entry whose lease ran out is left to the worker that claimed it next.
+    """
+    if entry.available_at <= timezone.now():
+        # the lease ran out while earlier entries of the batch were sent
+        return False
+    payment = entry.payment
+    order = payment.order
+    client = client or get_client()
+
+    try:
+        response = client.request_payment(
+            amount=payment.amount,
+            callback_url=settings.ZARINPAL["CALLBACK_URL"],
+            mobile=order.phone,
+            description=f"Payment for order {order.id}",
+        )
+    except Exception as e:
+        _handle_failure(entry, str(e), max_attempts)
+        return False
+
+    with transaction.atomic():
+        finished = _leased(entry).update(
+            status="DONE",
+            last_error="",
+            updated=timezone.now(),
+        )
+        if not finished:
+            # another worker holds the entry now, its answer is the one that counts
+            return False
+        Payment.objects.filter(pk=payment.pk).update(
+            authority=response.get("authority"),
+            payment_url=response.get("payment_url"),
+            updated=timezone.now(),
+        )
+        PaymentEvent.build(payment.pk, "REQUEST", response["raw_response"]).save()
+        index_orders([order.id])
+    return True
+
+
+def _handle_failure(entry, error, max_attempts):
+    now = timezone.now()
+    if entry.attempts < max_attempts:
+        _leased(entry).update(
+            status="PENDING",
+            available_at=now + timedelta(seconds=2**entry.attempts),
+            last_error=error,
+            updated=now,
+        )
+        return
+
+    with transaction.atomic():
+        if not _leased(entry).update(status="FAILED", last_error=error, updated=now):
+            return
+        failed = Payment.objects.filter(pk=entry.payment_id, status="PENDING").update(
+            status="FAILED", payment_date=now, updated=now
+        )
+        Order.objects.filter(pk=entry.payment.order_id, status="PENDING").update(
+            status="CANCELED", updated=now
+        )
+        if failed:
+            payment = entry.payment
+            payment.status = "FAILED"
+            payment.payment_date = now
+            record_payments([(payment, payment.order.plan_id, payment.order.city)])
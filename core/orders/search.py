@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Order, OrderSearchDocument
+
+
+# Support staff look orders up by any fragment of a name, phone, address or
+# payment reference, so the index works on character trigrams, not words:
+# pg_trgm's GIN operator class on PostgreSQL, an FTS5 table with the trigram
+# tokenizer on SQLite. Neither can look up fewer than three characters.
+MIN_QUERY_LENGTH = 3
+
+FTS_TABLE = "orders_ordersearch_fts"
+
+# ids are bigints, a longer number can only be a text match
+MAX_ID = 2**63 - 1
+
+
+def normalize(text):
+    return " ".join(str(text).lower().split())
+
+
+def build_document(order):
+    user = order.user
+    payment = getattr(order, "payment", None)
+    parts = [
+        order.id,
+        order.first_name,
+        order.last_name,
+        order.phone,
+        order.city,
+        order.address,
+        user.phone,
+        user.email,
+        payment and payment.authority,
+        payment and payment.ref_id,
+    ]
+    return normalize(" ".join(str(part) for part in parts if part))
+
+
+def index_orders(order_ids):
+    """
+    Write the search documents of ``order_ids``, one read and one upsert.
+    Call it from every write that changes a searched field.
+    """
+    orders = Order.objects.filter(id__in=list(order_ids)).select_related(
+        "user", "payment"
+    )
+    OrderSearchDocument.objects.bulk_create(
+        [
+            OrderSearchDocument(order_id=order.id, document=build_document(order))
+            for order in orders
+        ],
+        update_conflicts=True,
+        unique_fields=["order"],
+        update_fields=["document"],
+    )
+
+
+def as_id(query):
+    """
+    ``query`` as an id to look up, or None. isdecimal() rather than isdigit(),
+    which passes superscripts like "²" that int() refuses.
+    """
+    query = query.strip()
+    if not query.isdecimal():
+        return None
+    value = int(query)
+    return value if value <= MAX_ID else None
+
+
+def _vendor(queryset):
+    return connections[queryset.db].vendor
+
+
+def _fts_phrase(query):
+    # one quoted phrase, so FTS5 syntax in the query is matched literally
+    return '"%s"' % query.replace('"', '""')
+
+
+def search(queryset, query, path=""):
+    """
+    Narrow ``queryset`` to the orders matching ``query``. ``path`` leads from
+    its model to Order, "order__" for payments. A number also matches the
+    order id exactly, the only lookup shorter queries get. An empty query
+    matches everything, like an empty admin search box.
+    """
+    query = normalize(query)
+    if not query:
+        return queryset
+    pk = as_id(query)
+    by_id = Q(**{f"{path}id": pk}) if pk is not None else Q()
+    if len(query) < MIN_QUERY_LENGTH:
+        return queryset.filter(by_id) if by_id else queryset.none()
+
+    if _vendor(queryset) == "postgresql":
+        # LIKE '%q%' on the document, answered by the trigram index
+        matches = Q(**{f"{path}search__document__contains": query})
+    else:
+        matches = Q(
+            **{
+                f"{path}id__in": RawSQL(
+                    f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+                    (_fts_phrase(query),),
+                )
+            }
+        )
+    return queryset.filter(matches | by_id)
+
+
+def ranked(queryset, query):
+    """
+    search() over Order with a ``rank`` annotation, best match first and
+    newest first among equals.
+    """
+    query = normalize(query)
+    if len(query) < MIN_QUERY_LENGTH:
+        queryset = search(queryset, query).annotate(
+            rank=Value(1.0, output_field=FloatField())
+        )
+    elif _vendor(queryset) == "postgresql":
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        queryset = search(queryset, query).annotate(
+            rank=TrigramWordSimilarity(query, "search__document")
+        )
+    else:
+        # joined, not a subquery per row, so FTS5 scores every match in one
+        # pass. The document holds the order id, a number needs no other lookup.
+        queryset = queryset.extra(
+            select={"rank": f"-bm25({FTS_TABLE})"},
+            tables=[FTS_TABLE],
+            where=[
+                f"{FTS_TABLE}.rowid = {Order._meta.db_table}.id",
+                f"{FTS_TABLE} MATCH %s",
+            ],
+            params=[_fts_phrase(query)],
+        )
+    return queryset.order_by("-rank", "-created", "-id")
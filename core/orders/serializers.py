@@ -43,7 +43,6 @@ class PaymentSerializer(serializers.ModelSerializer):
             "amount",
             "authority",
             "payment_url",
-            "gateway_response",
             "created",
             "updated"
         ]
@@ -88,3 +87,34 @@ class UserOrderPaymentListSerializer(serializers.ModelSerializer):
             "order",
         ]
         read_only_fields = fields
+
+class OrderSearchPaymentSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Payment
+        fields = ("id", "status", "amount", "authority", "ref_id", "payment_date")
+        read_only_fields = fields
+
+class OrderSearchResultSerializer(serializers.ModelSerializer):
+
+    payment = OrderSearchPaymentSerializer(read_only=True, allow_null=True)
+    user = UserRelatedSerializer(read_only=True)
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Order
+        fields = (
+            "id",
+            "rank",
+            "user",
+            "plan",
+            "first_name",
+            "last_name",
+            "phone",
+            "city",
+            "address",
+            "status",
+            "payment",
+            "created",
+        )
+        read_only_fields = fields
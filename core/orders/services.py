@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from products.entitlements import invalidate_entitlement, invalidate_entitlements
+from products.models import ACTIVE_STATUSES, Subscription
+from stats.rollups import record_payments, record_subscriptions
+from utils.zarinpal_client import get_async_client, get_client
+
+from .models import Order, Payment, PaymentCallbackRecord, PaymentEvent
+from .search import index_orders
+
+
+PAYMENT_SUCCESS_URL = "http://bahoosh360.ir/payment/success/"
+PAYMENT_FAILED_URL = "http://bahoosh360.ir/payment/failed/"
+
+VERIFY_CLAIM_KEY = "payment-verify:{authority}"
+
+
+def pending_subscription(payment):
+    return (
+        Subscription.objects.filter(
+            user_id=payment.user_id,
+            plan_id=payment.order.plan_id,
+            is_trial=False,
+        )
+        .order_by("-id")
+        .first()
+    )
+
+
+def apply_verification(payment, result):
+    """
+    Store a gateway verify result on the payment and move its order and
+    subscription to the matching state. Returns whether the payment is paid.
+    """
+    payment.status = (
+        "PAID" if result["raw_response"]["data"]["code"] in [100, 101] else "FAILED"
+    )
+    payment.ref_id = result.get("ref_id")
+    payment.payment_date = timezone.now()
+    payment.save()
+    PaymentEvent.build(
+        payment.id, "VERIFY", result["raw_response"], payment.payment_date
+    ).save()
+    order = payment.order
+    record_payments([(payment, order.plan_id, order.city)])
+
+    if payment.status == "PAID":
+        payment.order.status = "COMPLETED"
+        payment.order.save(update_fields=["status", "updated"])
+        subscription = pending_subscription(payment)
+        if subscription:
+            activated = subscription.status not in ACTIVE_STATUSES
+            subscription.status = "ACTIVE"
+            subscription.save()
+            if activated:
+                record_subscriptions([subscription])
+        user_id = payment.user_id
+        transaction.on_commit(lambda: invalidate_entitlement(user_id))
+        return True
+    payment.order.status = "CANCELED"
+    payment.order.save(update_fields=["status", "updated"])
+    return False
+
+
+def _locked_payment(authority):
+    payments = Payment.objects.filter(authority=authority)
+    if not connection.features.has_select_for_update:
+        # SQLite: a transaction that reads before it writes fails with "database
+        # is locked" instead of waiting for another writer, write first
+        payments.update(updated=F("updated"))
+    return payments.select_for_update(of=("self",)).select_related("order").get()
+
+
+def _recorded_result(payment):
+    record = PaymentCallbackRecord.objects.filter(authority=payment.authority).first()
+    if record is not None:
+        return record.paid
+    if payment.status != "PENDING":
+        # settled by another path (reconciliation, admin), remember it for next time
+        paid = payment.status == "PAID"
+        PaymentCallbackRecord.objects.create(
+            authority=payment.authority, payment=payment, paid=paid
+        )
+        return paid
+    return None
+
+
+def process_callback(authority, client=None):
+    """
+    Verify and settle the payment for ``authority`` once. The gateway is
+    called outside any transaction; duplicate callbacks wait for the first
+    one's record instead of calling it again.
+    """
+    paid = recorded_callback_result(authority)
+    if paid is not None:
+        return paid
+
+    claimed = claim_verification(authority)
+    if not claimed:
+        paid = wait_for_callback_result(authority)
+        if paid is not None:
+            return paid
+        # the first callback is stuck, verifying again is safe on the gateway side
+    try:
+        # read under the claim, a callback that finished meanwhile has settled it
+        payment = Payment.objects.only("amount", "status").get(authority=authority)
+        if payment.status != "PENDING":
+            return settle_callback(authority, None)
+        result = (client or get_client()).verify_payment(authority, payment.amount)
+        return settle_callback(authority, result)
+    finally:
+        if claimed:
+            release_verification(authority)
+
+
+def claim_verification(authority):
+    """
+    Whether this callback may verify ``authority``. Shared through the cache,
+    so it covers every worker process and both callback views.
+    """
+    return cache.add(
+        VERIFY_CLAIM_KEY.format(authority=authority),
+        1,
+        timeout=settings.PAYMENT_CALLBACK["CLAIM_TIMEOUT"],
+    )
+
+
+def release_verification(authority):
+    cache.delete(VERIFY_CLAIM_KEY.format(authority=authority))
+
+
+def _claimed_result(authority):
+    """
+    ``(finished, paid)`` for a callback waiting on another one's claim.
+    """
+    paid = recorded_callback_result(authority)
+    if paid is not None:
+        return True, paid
+    if cache.get(VERIFY_CLAIM_KEY.format(authority=authority)) is None:
+        # released without a record, the verify call failed
+        return True, recorded_callback_result(authority)
+    return False, None
+
+
+def wait_for_callback_result(authority):
+    config = settings.PAYMENT_CALLBACK
+    deadline = time.monotonic() + config["WAIT_TIMEOUT"]
+    while time.monotonic() < deadline:
+        finished, paid = _claimed_result(authority)
+        if finished:
+            return paid
+        time.sleep(config["POLL_INTERVAL"])
+    return None
+
+
+async def aprocess_callback(authority, client=None):
+    """
+    process_callback for the async view, the gateway call and the waits do
+    not hold a thread.
+    """
+    paid = await sync_to_async(recorded_callback_result)(authority)
+    if paid is not None:
+        return paid
+
+    claimed = await sync_to_async(claim_verification)(authority)
+    if not claimed:
+        paid = await await_callback_result(authority)
+        if paid is not None:
+            return paid
+    try:
+        payment = await Payment.objects.only("amount", "status").aget(
+            authority=authority
+        )
+        if payment.status != "PENDING":
+            return await sync_to_async(settle_callback)(authority, None)
+        result = await (client or get_async_client()).verify_payment(
+            authority, payment.amount
+        )
+        return await sync_to_async(settle_callback)(authority, result)
+    finally:
+        if claimed:
+            await sync_to_async(release_verification)(authority)
+
+
+async def await_callback_result(authority):
+    config = settings.PAYMENT_CALLBACK
+    deadline = time.monotonic() + config["WAIT_TIMEOUT"]
+    while time.monotonic() < deadline:
+        finished, paid = await sync_to_async(_claimed_result)(authority)
+        if finished:
+            return paid
+        await asyncio.sleep(config["POLL_INTERVAL"])
+    return None
+
+
+def recorded_callback_result(authority):
+    return (
+        PaymentCallbackRecord.objects.filter(authority=authority)
+        .values_list("paid", flat=True)
+        .first()
+    )
+
+
+def settle_callback(authority, result):
+    """
+    Apply a verify ``result`` obtained without a lock held: re-check the
+    record and the payment status under the lock first. ``result`` may be
+    None for a payment already settled by another path.
+    """
+    with transaction.atomic():
+        payment = _locked_payment(authority)
+        paid = _recorded_result(payment)
+        if paid is not None:
+            return paid
+
+        paid = apply_verification(payment, result)
+        PaymentCallbackRecord.objects.create(
+            authority=authority, payment=payment, paid=paid
+        )
+        return paid
+
+
+def settle_payments(verified, unpaid):
+    """
+    Bulk counterpart of apply_verification. ``verified`` maps payment id to
+    its verify result, ``unpaid`` holds ids the gateway reported as not paid.
+    Only rows still PENDING under the lock are touched, so a callback that won
+    the race is left alone. Returns the (paid, failed) counts applied.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        pending = {
+            payment.id: payment
+            for payment in Payment.objects.select_for_update()
+            .filter(id__in=[*verified, *unpaid], status="PENDING")
+            .only("id", "user_id", "order_id", "authority", "amount")
+        }
+        paid = [pending[pk] for pk in verified if pk in pending]
+        failed = [pending[pk] for pk in unpaid if pk in pending]
+
+        for payment in paid:
+            result = verified[payment.id]
+            payment.status = "PAID"
+            payment.ref_id = result.get("ref_id")
+            payment.payment_date = now
+            payment.updated = now
+        Payment.objects.bulk_update(
+            paid, ["status", "ref_id", "payment_date", "updated"]
+        )
+        PaymentEvent.objects.bulk_create(
+            PaymentEvent.build(
+                payment.id, "VERIFY", verified[payment.id]["raw_response"], now
+            )
+            for payment in paid
+        )
+        index_orders(payment.order_id for payment in paid)
+        for payment in failed:
+            payment.status = "FAILED"
+            payment.payment_date = now
+        Payment.objects.filter(id__in=[payment.id for payment in failed]).update(
+            status="FAILED", payment_date=now, updated=now
+        )
+
+        Order.objects.filter(id__in=[payment.order_id for payment in paid]).update(
+            status="COMPLETED", updated=now
+        )
+        Order.objects.filter(id__in=[payment.order_id for payment in failed]).update(
+            status="CANCELED", updated=now
+        )
+
+        orders = {
+            order_id: (plan_id, city)
+            for order_id, plan_id, city in Order.objects.filter(
+                id__in=[payment.order_id for payment in (*paid, *failed)]
+            ).values_list("id", "plan_id", "city")
+        }
+        record_payments(
+            (payment, *orders[payment.order_id]) for payment in (*paid, *failed)
+        )
+        plans = {payment.order_id: orders[payment.order_id][0] for payment in paid}
+        latest = {}
+        for subscription in Subscription.objects.filter(
+            user_id__in={payment.user_id for payment in paid},
+            plan_id__in=set(plans.values()),
+            is_trial=False,
+        ).values("id", "user_id", "plan_id"):
+            key = (subscription["user_id"], subscription["plan_id"])
+            latest[key] = max(latest.get(key, 0), subscription["id"])
+        activate = [
+            latest[key]
+            for key in {(payment.user_id, plans[payment.order_id]) for payment in paid}
+            if key in latest
+        ]
+        activated = list(
+            Subscription.objects.filter(id__in=activate)
+            .exclude(status__in=ACTIVE_STATUSES)
+            .only("id", "plan_id", "start_date", "end_date", "is_trial")
+        )
+        Subscription.objects.filter(
+            id__in=[subscription.id for subscription in activated]
+        ).update(status="ACTIVE")
+        for subscription in activated:
+            subscription.status = "ACTIVE"
+        record_subscriptions(activated)
+
+        # payments settled before the gateway issued an authority get no callback
+        PaymentCallbackRecord.objects.bulk_create(
+            [
+                *(
+                    PaymentCallbackRecord(
+                        authority=payment.authority, payment=payment, paid=True
+                    )
+                    for payment in paid
+                    if payment.authority
+                ),
+                *(
+                    PaymentCallbackRecord(
+                        authority=payment.authority, payment=payment, paid=False
+                    )
+                    for payment in failed
+                    if payment.authority
+                ),
+            ],
+            ignore_conflicts=True,
+        )
+
+        user_ids = [payment.user_id for payment in paid]
+        transaction.on_commit(lambda: invalidate_entitlements(user_ids))
+    return len(paid), len(failed)
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+
+from .models import Order, Payment
+from .search import index_orders
+
+
+User = get_user_model()
+
+# fields that end up in the search document, saves of other fields skip the reindex
+ORDER_FIELDS = {"user", "first_name", "last_name", "phone", "city", "address"}
+PAYMENT_FIELDS = {"order", "authority", "ref_id"}
+USER_FIELDS = {"phone", "email"}
+
+
+def _touches(update_fields, fields):
+    return update_fields is None or bool(fields & set(update_fields))
+
+
+@receiver(post_save, sender=Order)
+def index_order(sender, instance, update_fields=None, **kwargs):
+    if _touches(update_fields, ORDER_FIELDS):
+        index_orders([instance.id])
+
+
+@receiver(post_save, sender=Payment)
+def index_payment_order(sender, instance, created, update_fields=None, **kwargs):
+    # a new payment without a reference adds nothing, its order was indexed on save
+    if created and not (instance.authority or instance.ref_id):
+        return
+    if _touches(update_fields, PAYMENT_FIELDS):
+        index_orders([instance.order_id])
+
+
+def _user_fields(instance):
+    # from __dict__, a deferred field must not cost a query per instance
+    return tuple(instance.__dict__.get(field) for field in sorted(USER_FIELDS))
+
+
+@receiver(post_init, sender=User)
+def remember_user_fields(sender, instance, **kwargs):
+    instance._indexed_fields = _user_fields(instance)
+
+
+@receiver(post_save, sender=User)
+def index_user_orders(sender, instance, created, update_fields=None, **kwargs):
+    # a new user has no orders, a login or password change leaves phone and email alone
+    changed = instance._indexed_fields != _user_fields(instance)
+    instance._indexed_fields = _user_fields(instance)
+    if not created and changed and _touches(update_fields, USER_FIELDS):
+        index_orders(
+            Order.objects.filter(user_id=instance.pk).values_list("id", flat=True)
+        )
@@ -0,0 +1,7 @@
+'use strict';
+{
+    // apply an autocomplete list filter as soon as an option is picked
+    django.jQuery(document).on('change', 'select.autocomplete-filter', function() {
+        this.form.submit();
+    });
+}
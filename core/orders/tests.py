@@ -1,2 +1,989 @@
+from __future__ import annotations
 
-# Create your tests here.
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+import json
+import threading
+import time
+from unittest import mock
+
+from accounts.tokens import RefreshToken
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.test import (
+    Client,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from products.models import Plan, Subscription
+from prometheus_client import REGISTRY
+from rest_framework.test import APIClient
+from utils.loadtest import diff_baseline
+from utils.pagination import EstimatedCountPaginator
+from utils.testing import QueryBudgetMixin
+from utils.zarinpal_client import (
+    AsyncZarinpalClient,
+    CircuitBreaker,
+    CircuitOpenError,
+    ZarinpalClient,
+    ZarinpalError,
+    get_async_client,
+)
+from utils.zarinpal_stub import StubGateway
+
+from .bulk_actions import apply_chunk
+from .models import (
+    BulkActionJob,
+    Order,
+    OrderSearchDocument,
+    Payment,
+    PaymentCallbackRecord,
+    PaymentEvent,
+    PaymentOutbox,
+)
+from .outbox import claim_batch, enqueue_payment_request, process_entry
+from .services import PAYMENT_FAILED_URL, PAYMENT_SUCCESS_URL
+
+
+User = get_user_model()
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class FakeGateway:
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def verify_payment(self, authority, amount):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return {"ref_id": 1234, "raw_response": {"data": {"code": 100, "ref_id": 1234}}}
+
+
+class FakeAsyncGateway(FakeGateway):
+
+    async def verify_payment(self, authority, amount):
+        with self._lock:
+            self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {"ref_id": 1234, "raw_response": {"data": {"code": 100, "ref_id": 1234}}}
+
+
+def connection_samples(client):
+    return tuple(
+        REGISTRY.get_sample_value("zarinpal_connections_total", {"client": client, "connection": kind}) or 0
+        for kind in ("new", "reused")
+    )
+
+
+def breaker_sample(client):
+    return REGISTRY.get_sample_value("zarinpal_circuit_state", {"client": client})
+
+
+def create_order(user, plan, authority=""):
+    order = Order.objects.create(
+        user=user,
+        plan=plan,
+        first_name="first",
+        last_name="last",
+        phone=user.phone,
+        city="city",
+        address="address",
+    )
+    return Payment.objects.create(
+        user=user,
+        order=order,
+        status="PENDING",
+        amount=plan.price,
+        authority=authority,
+    )
+
+
+def create_pending_payment(phone="09120000000", authority="A0000000000000000000000000000000001"):
+    user = User.objects.create(phone=phone)
+    plan = Plan.objects.create(duration_days=30, price=1000)
+    order = Order.objects.create(
+        user=user,
+        plan=plan,
+        first_name="first",
+        last_name="last",
+        phone=phone,
+        city="city",
+        address="address",
+    )
+    Subscription.objects.create(user=user, plan=plan, status="CANCELED")
+    return Payment.objects.create(
+        user=user,
+        order=order,
+        status="PENDING",
+        amount=plan.price,
+        authority=authority,
+    )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PaymentCallbackTests(TestCase):
+
+    def setUp(self):
+        self.payment = create_pending_payment()
+        self.url = reverse("payments:callback")
+        self.gateway = FakeGateway()
+        patcher = mock.patch("orders.services.get_client", return_value=self.gateway)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def callback(self, authority=None):
+        return self.client.get(self.url, {"Authority": authority or self.payment.authority, "Status": "OK"})
+
+    def test_paid_callback_settles_payment_order_and_subscription(self):
+        response = self.callback()
+
+        self.assertRedirects(response, PAYMENT_SUCCESS_URL, fetch_redirect_response=False)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "PAID")
+        self.assertEqual(self.payment.order.status, "COMPLETED")
+        self.assertTrue(
+            Subscription.objects.filter(user=self.payment.user, status="ACTIVE").exists()
+        )
+
+    def test_repeated_callback_is_answered_from_the_record(self):
+        self.callback()
+        response = self.callback()
+
+        self.assertRedirects(response, PAYMENT_SUCCESS_URL, fetch_redirect_response=False)
+        self.assertEqual(self.gateway.calls, 1)
+        self.assertEqual(PaymentCallbackRecord.objects.filter(authority=self.payment.authority).count(), 1)
+
+    def test_unknown_authority_fails_without_calling_gateway(self):
+        response = self.callback("UNKNOWN")
+
+        self.assertRedirects(response, PAYMENT_FAILED_URL, fetch_redirect_response=False)
+        self.assertEqual(self.gateway.calls, 0)
+
+    def test_authority_lookup_uses_an_index(self):
+        out = StringIO()
+        call_command("explain_hot_queries", "--check", "--only", "payment callback", stdout=out)
+        self.assertIn("authority", out.getvalue())
+
+    def test_gateway_is_called_outside_a_transaction(self):
+        # only the test case's own atomic blocks may be open
+        depth = len(connection.atomic_blocks)
+
+        def verify(authority, amount):
+            self.assertEqual(len(connection.atomic_blocks), depth)
+            return FakeGateway().verify_payment(authority, amount)
+
+        with mock.patch.object(self.gateway, "verify_payment", side_effect=verify):
+            response = self.callback()
+        self.assertRedirects(response, PAYMENT_SUCCESS_URL, fetch_redirect_response=False)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncPaymentCallbackTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.payment = create_pending_payment()
+        self.url = reverse("payments:callback-async")
+        self.gateway = FakeAsyncGateway()
+        patcher = mock.patch("orders.services.get_async_client", return_value=self.gateway)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def callback(self):
+        return await self.async_client.get(self.url, {"Authority": self.payment.authority, "Status": "OK"})
+
+    async def test_paid_callback_settles_the_payment(self):
+        response = await self.callback()
+
+        self.assertEqual(response.url, PAYMENT_SUCCESS_URL)
+        payment = await Payment.objects.select_related("order").aget(pk=self.payment.pk)
+        self.assertEqual((payment.status, payment.order.status), ("PAID", "COMPLETED"))
+        self.assertTrue(
+            await Subscription.objects.filter(user_id=payment.user_id, status="ACTIVE").aexists()
+        )
+
+    async def test_gateway_error_leaves_the_payment_pending(self):
+        with mock.patch.object(self.gateway, "verify_payment", side_effect=ZarinpalError("rejected", code=-51)):
+            response = await self.callback()
+
+        self.assertEqual(response.url, PAYMENT_FAILED_URL)
+        payment = await Payment.objects.aget(pk=self.payment.pk)
+        self.assertEqual(payment.status, "PENDING")
+        self.assertFalse(await PaymentCallbackRecord.objects.filter(authority=payment.authority).aexists())
+        # the claim was released, a retried callback verifies again
+        self.assertEqual((await self.callback()).url, PAYMENT_SUCCESS_URL)
+
+    async def test_gateway_timeout_fails_the_callback(self):
+        with StubGateway(latency=0.5) as stub, override_settings(
+            ZARINPAL={**settings.ZARINPAL, "API_URL": stub.api_url, "READ_TIMEOUT": 0.1, "VERIFY_RETRIES": 0},
+        ), mock.patch("orders.services.get_async_client", side_effect=get_async_client):
+            response = await self.callback()
+
+        self.assertEqual(response.url, PAYMENT_FAILED_URL)
+        payment = await Payment.objects.aget(pk=self.payment.pk)
+        self.assertEqual(payment.status, "PENDING")
+
+    async def test_duplicate_callbacks_verify_once(self):
+        self.gateway.delay = 0.1
+
+        responses = await asyncio.gather(*(self.callback() for _ in range(5)))
+
+        self.assertEqual({response.url for response in responses}, {PAYMENT_SUCCESS_URL})
+        self.assertEqual(self.gateway.calls, 1)
+        self.assertEqual(await PaymentCallbackRecord.objects.filter(authority=self.payment.authority).acount(), 1)
+
+    async def test_repeated_callback_is_answered_from_the_record(self):
+        await self.callback()
+        response = await self.callback()
+
+        self.assertEqual(response.url, PAYMENT_SUCCESS_URL)
+        self.assertEqual(self.gateway.calls, 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PaymentCallbackConcurrencyTests(TransactionTestCase):
+
+    def test_concurrent_callbacks_verify_once(self):
+        payment = create_pending_payment()
+        gateway = FakeGateway(delay=0.05)
+        url = reverse("payments:callback")
+
+        def callback(_):
+            try:
+                if connection.vendor == "sqlite":
+                    # threads share the in-memory test database's cache, where a table lock
+                    # fails at once instead of waiting like it does on a database file
+                    connection.ensure_connection()
+                    connection.connection.execute("PRAGMA read_uncommitted = 1")
+                response = Client().get(url, {"Authority": payment.authority, "Status": "OK"})
+                return response.url
+            finally:
+                connection.close()
+
+        with mock.patch("orders.services.get_client", return_value=gateway), ThreadPoolExecutor(16) as pool:
+            results = list(pool.map(callback, range(64)))
+
+        self.assertEqual(set(results), {PAYMENT_SUCCESS_URL})
+        self.assertEqual(gateway.calls, 1)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, "PAID")
+        self.assertEqual(PaymentCallbackRecord.objects.filter(authority=payment.authority).count(), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PaymentOutboxTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(phone="09120000000")
+        plan = Plan.objects.create(duration_days=30, price=1000)
+        self.payment = create_order(user, plan)
+        self.entry = enqueue_payment_request(self.payment)
+        self.gateway = mock.Mock()
+        self.gateway.request_payment.side_effect = ZarinpalError("gateway down")
+
+    def make_due(self):
+        PaymentOutbox.objects.filter(pk=self.entry.pk).update(available_at=timezone.now() - timedelta(seconds=1))
+
+    def claim(self):
+        entries = claim_batch(10, lease_seconds=60)
+        self.assertEqual([entry.pk for entry in entries], [self.entry.pk])
+        return entries[0]
+
+    def test_claim_leases_due_entries(self):
+        later = enqueue_payment_request(create_order(self.payment.user, self.payment.order.plan))
+        PaymentOutbox.objects.filter(pk=later.pk).update(available_at=timezone.now() + timedelta(hours=1))
+
+        entry = self.claim()
+        self.assertEqual(entry.status, "PROCESSING")
+        self.assertEqual(entry.attempts, 1)
+        self.assertGreater(entry.available_at, timezone.now() + timedelta(seconds=50))
+        self.assertEqual(claim_batch(10, lease_seconds=60), [])
+
+        # a worker that died mid-entry loses its lease
+        self.make_due()
+        self.assertEqual(self.claim().attempts, 2)
+
+    def test_failures_back_off_exponentially(self):
+        for attempt in (1, 2, 3):
+            self.make_due()
+            entry = self.claim()
+            before = timezone.now()
+            self.assertFalse(process_entry(entry, max_attempts=5, client=self.gateway))
+
+            entry.refresh_from_db()
+            self.assertEqual(entry.status, "PENDING")
+            self.assertEqual(entry.last_error, "gateway down")
+            delay = (entry.available_at - before).total_seconds()
+            self.assertAlmostEqual(delay, 2 ** attempt, delta=1)
+            self.assertEqual(claim_batch(10, lease_seconds=60), [])
+
+    def test_gives_up_after_max_attempts(self):
+        for _ in range(2):
+            self.make_due()
+            process_entry(self.claim(), max_attempts=2, client=self.gateway)
+
+        self.entry.refresh_from_db()
+        self.payment.refresh_from_db()
+        self.assertEqual(self.entry.status, "FAILED")
+        self.assertEqual(self.entry.attempts, 2)
+        self.assertEqual(self.payment.status, "FAILED")
+        self.assertEqual(self.payment.order.status, "CANCELED")
+        self.make_due()
+        self.assertEqual(claim_batch(10, lease_seconds=60), [])
+
+    def test_completed_order_is_not_canceled(self):
+        Order.objects.filter(pk=self.payment.order_id).update(status="COMPLETED")
+        process_entry(self.claim(), max_attempts=1, client=self.gateway)
+
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.status, "FAILED")
+        self.assertEqual(Order.objects.get(pk=self.payment.order_id).status, "COMPLETED")
+
+    def test_expired_lease_skips_the_gateway(self):
+        entry = self.claim()
+        entry.available_at = timezone.now() - timedelta(seconds=1)
+
+        self.assertFalse(process_entry(entry, max_attempts=5, client=self.gateway))
+        self.gateway.request_payment.assert_not_called()
+
+    def test_lost_lease_is_not_written_back(self):
+        self.gateway.request_payment.side_effect = None
+        self.gateway.request_payment.return_value = {
+            "authority": "A0000000000000000000000000000000002",
+            "payment_url": "https://gateway/StartPay/A0000000000000000000000000000000002",
+            "raw_response": {"data": {"code": 100}},
+        }
+        stale = self.claim()
+        # the lease ran out and another worker claimed the entry
+        self.make_due()
+        self.claim()
+
+        self.assertFalse(process_entry(stale, max_attempts=5, client=self.gateway))
+        self.entry.refresh_from_db()
+        self.payment.refresh_from_db()
+        self.assertEqual(self.entry.status, "PROCESSING")
+        self.assertEqual(self.payment.authority, "")
+
+        # a failure of the stale worker does not reschedule the entry either
+        self.gateway.request_payment.side_effect = ZarinpalError("gateway down")
+        self.assertFalse(process_entry(stale, max_attempts=5, client=self.gateway))
+        self.entry.refresh_from_db()
+        self.assertEqual((self.entry.status, self.entry.last_error), ("PROCESSING", ""))
+
+    def test_worker_survives_database_errors(self):
+        enqueue_payment_request(create_order(self.payment.user, self.payment.order.plan))
+        out, err = StringIO(), StringIO()
+        with mock.patch(
+            "orders.management.commands.process_payment_outbox.process_entry",
+            side_effect=[DatabaseError("connection lost"), True],
+        ):
+            call_command("process_payment_outbox", stdout=out, stderr=err)
+
+        self.assertIn("Processed 2 entries, 1 sent", out.getvalue())
+        self.assertIn(f"Outbox entry {self.entry.pk} not written back: connection lost", err.getvalue())
+
+    def test_success_stores_the_authority(self):
+        self.gateway.request_payment.side_effect = None
+        self.gateway.request_payment.return_value = {
+            "authority": "A0000000000000000000000000000000001",
+            "payment_url": "https://gateway/StartPay/A0000000000000000000000000000000001",
+            "raw_response": {"data": {"code": 100}},
+        }
+
+        self.assertTrue(process_entry(self.claim(), max_attempts=5, client=self.gateway))
+
+        self.entry.refresh_from_db()
+        self.payment.refresh_from_db()
+        self.assertEqual(self.entry.status, "DONE")
+        self.assertEqual(self.payment.authority, "A0000000000000000000000000000000001")
+        self.assertEqual(self.payment.status, "PENDING")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OrderQueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(phone="09129999999", password="password")
+        self.user = User.objects.create(phone="09121111111")
+        self.plan = Plan.objects.create(duration_days=30, price=1000)
+        self.seeded = 0
+
+    def seed_orders(self, count):
+        for _ in range(count):
+            self.seeded += 1
+            user = User.objects.create(phone=f"0913{self.seeded:07d}")
+            payment = create_order(user, self.plan, authority=f"A{self.seeded:035d}")
+            PaymentOutbox.objects.create(payment=payment)
+
+    def seed_user_orders(self, count):
+        for _ in range(count):
+            create_order(self.user, self.plan)
+
+    def admin_get(self, url_name):
+        self.client.force_login(self.admin)
+        return lambda: self.client.get(reverse(url_name))
+
+    def test_user_order_payment_list(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = reverse("payments:orders-user")
+        self.assertConstantQueries(self.seed_user_orders, lambda: client.get(url))
+
+    def test_order_admin_changelist(self):
+        self.assertConstantQueries(self.seed_orders, self.admin_get("admin:orders_order_changelist"))
+
+    def test_payment_admin_changelist(self):
+        self.assertConstantQueries(self.seed_orders, self.admin_get("admin:orders_payment_changelist"))
+
+    def test_payment_outbox_admin_changelist(self):
+        self.assertConstantQueries(self.seed_orders, self.admin_get("admin:orders_paymentoutbox_changelist"))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class UserOrderPaymentPaginationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(phone="09121111111")
+        self.plan = Plan.objects.create(duration_days=30, price=1000)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_walks_whole_history_newest_first(self):
+        payments = [create_order(self.user, self.plan) for _ in range(7)]
+        # identical timestamps must still page deterministically on id
+        Payment.objects.filter(pk__in=[p.pk for p in payments[2:5]]).update(created=payments[2].created)
+
+        seen = []
+        url = reverse("payments:orders-user") + "?page_size=3"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [row["id"] for row in response.data["results"]]
+            url = response.data["next"]
+
+        expected = list(
+            Payment.objects.filter(user=self.user).order_by("-created", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    @override_settings(DATABASE_REPLICAS=["replica1"])
+    def test_history_reads_the_primary(self):
+        payment = create_order(self.user, self.plan)
+        Payment.objects.filter(pk=payment.pk).update(status="PAID")
+
+        # outside the test transaction a read marked for the replica would go to replica1
+        with mock.patch.object(connection, "in_atomic_block", False):
+            response = self.client.get(reverse("payments:orders-user"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["status"], "PAID")
+
+
+class LoadtestBaselineTests(TestCase):
+
+    def test_any_new_error_is_a_regression(self):
+        row = {"errors": 0, "p50_ms": 10.0, "p95_ms": 20.0, "p99_ms": 30.0, "rps": 100.0, "queries": 2.0}
+        _, regressions = diff_baseline({"plan-create": row}, {"plan-create": {**row, "errors": 1}}, 0.25)
+        self.assertEqual(regressions, [("plan-create", "errors")])
+        _, regressions = diff_baseline({"plan-create": row}, {"plan-create": {**row, "p50_ms": 12.0}}, 0.25)
+        self.assertEqual(regressions, [])
+
+
+class HotQueryPlanTests(TestCase):
+
+    def test_hot_queries_use_an_index(self):
+        out = StringIO()
+        call_command("explain_hot_queries", "--check", stdout=out)
+        self.assertIn("payment_pending_idx", out.getvalue())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AdminChangelistScalingTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(phone="09129999999", password="password")
+        self.plan = Plan.objects.create(duration_days=30, price=1000)
+        self.recent = create_order(User.objects.create(phone="09121111111"), self.plan).order
+        self.old = create_order(User.objects.create(phone="09122222222"), self.plan).order
+        Order.objects.filter(pk=self.old.pk).update(created=timezone.now() - timedelta(days=90))
+        self.client.force_login(self.admin)
+
+    def changelist(self, **params):
+        response = self.client.get(reverse("admin:orders_order_changelist"), params)
+        self.assertEqual(response.status_code, 200)
+        return {order.pk for order in response.context["cl"].result_list}
+
+    def test_default_view_is_date_bounded(self):
+        self.assertEqual(self.changelist(), {self.recent.pk})
+        self.assertEqual(self.changelist(period="all"), {self.recent.pk, self.old.pk})
+        # looking something up searches the whole history
+        self.assertEqual(self.changelist(q=self.old.user.phone), {self.old.pk})
+
+    def test_user_and_city_filters_do_not_list_values(self):
+        Order.objects.filter(pk=self.old.pk).update(city="shiraz")
+        self.assertEqual(self.changelist(period="all", city="shiraz"), {self.old.pk})
+
+        response = self.client.get(
+            reverse("admin:orders_order_changelist"), {"period": "all", "user__id__exact": self.old.user_id}
+        )
+        self.assertEqual({order.pk for order in response.context["cl"].result_list}, {self.old.pk})
+        self.assertContains(response, f'<option value="{self.old.user_id}" selected>')
+        self.assertNotContains(response, self.recent.user.phone)
+
+    def test_user_filter_autocompletes(self):
+        response = self.client.get(
+            reverse("admin:autocomplete"),
+            {"app_label": "orders", "model_name": "payment", "field_name": "user", "term": "0912222"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["id"] for row in response.json()["results"]], [str(self.old.user_id)])
+
+    def test_paginator_uses_planner_estimate_for_large_results(self):
+        queryset = Order.objects.order_by("-created")
+        self.assertEqual(EstimatedCountPaginator(queryset, 25).count, 2)
+        with mock.patch("utils.pagination.planner_estimate", return_value=50_000_000):
+            with self.assertNumQueries(0):
+                self.assertEqual(EstimatedCountPaginator(queryset, 25).count, 50_000_000)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OrderSearchTests(TestCase):
+
+    def setUp(self):
+        self.staff = User.objects.create_superuser(phone="09129999999", password="password")
+        self.plan = Plan.objects.create(duration_days=30, price=1000)
+        self.payment = create_order(User.objects.create(phone="09121111111", email="reza@example.com"), self.plan)
+        self.order = self.payment.order
+        self.order.first_name, self.order.last_name = "Reza", "Karimi"
+        self.order.save()
+        Order.objects.filter(pk=self.order.pk).update(address="Valiasr street, Tehran")
+        self.other = create_order(User.objects.create(phone="09122222222"), self.plan).order
+
+    def search(self, user, q, **params):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+        return client.get(reverse("payments:orders-search"), {"q": q, **params})
+
+    def found(self, q):
+        response = self.search(self.staff, q)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [row["id"] for row in response.data["results"]]
+
+    def test_matches_fragments_of_any_searched_field(self):
+        for q in ("karim", "REZA", "09121111", "example.com"):
+            self.assertEqual(self.found(q), [self.order.pk], q)
+        self.assertEqual(self.found("nobody"), [])
+
+    def test_payment_writes_update_the_document(self):
+        self.assertEqual(self.found("abcdef"), [])
+        self.payment.authority = "A00000ABCDEF"
+        self.payment.save(update_fields=["authority"])
+        self.assertEqual(self.found("abcdef"), [self.order.pk])
+
+    def test_user_saves_reindex_only_on_phone_or_email_changes(self):
+        user = User.objects.get(pk=self.order.user_id)
+        user.set_password("New-password-1!")
+        with self.assertNumQueries(1):
+            user.save()
+
+        user.email = "karimi@example.org"
+        user.save()
+        self.assertEqual(self.found("example.org"), [self.order.pk])
+
+    def test_update_without_signal_needs_a_rebuild(self):
+        # queryset.update() skips the signals, the address set in setUp is not indexed yet
+        self.assertEqual(self.found("valiasr"), [])
+        OrderSearchDocument.objects.all().delete()
+        call_command("rebuild_search_index", "--chunk-size", "1", stdout=StringIO())
+        self.assertEqual(self.found("valiasr"), [self.order.pk])
+        self.assertEqual(self.found("karimi"), [self.order.pk])
+
+    def test_numbers_match_the_order_id(self):
+        self.assertIn(self.other.pk, self.found(str(self.other.pk)))
+
+    def test_numbers_that_are_not_ids_fall_back_to_text(self):
+        self.client.force_login(self.staff)
+        for q in ("12345678901234567890123", "²²²"):
+            self.assertEqual(self.found(q), [], q)
+            for url_name in ("admin:orders_order_changelist", "admin:orders_payment_changelist"):
+                response = self.client.get(reverse(url_name), {"q": q})
+                self.assertEqual(response.status_code, 200, (url_name, q))
+                self.assertEqual(len(response.context["cl"].result_list), 0)
+
+    def test_results_are_ranked_and_paginated(self):
+        for _ in range(3):
+            create_order(User.objects.create(phone=f"0912333333{_}"), self.plan)
+        response = self.search(self.staff, "0912", page_size=2)
+        self.assertEqual(response.data["count"], 5)
+        ranks = [row["rank"] for row in response.data["results"]]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+        self.assertIsNotNone(response.data["next"])
+
+    def test_staff_only_and_query_length(self):
+        self.assertEqual(self.search(self.order.user, "reza").status_code, 403)
+        self.assertEqual(self.search(self.staff, "re").status_code, 400)
+
+    def test_admin_search_uses_the_index(self):
+        self.client.force_login(self.staff)
+        for url_name in ("admin:orders_order_changelist", "admin:orders_payment_changelist"):
+            response = self.client.get(reverse(url_name), {"q": "karimi"})
+            self.assertEqual(len(response.context["cl"].result_list), 1)
+            self.assertNotIn("LIKE", response.context["cl"].queryset.query.__str__())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BulkActionJobTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(phone="09129999999", password="password")
+        self.plan = Plan.objects.create(duration_days=30, price=1000)
+        self.payments = []
+        for i in range(5):
+            user = User.objects.create(phone=f"0912111111{i}")
+            Subscription.objects.create(user=user, plan=self.plan, status="CANCELED")
+            self.payments.append(create_order(user, self.plan))
+        # already settled, the action leaves it alone
+        Payment.objects.filter(pk=self.payments[0].pk).update(status="FAILED")
+        self.client.force_login(self.admin)
+
+    def run_action(self, url_name, action, ids):
+        response = self.client.post(
+            reverse(url_name), {"action": action, "_selected_action": ids, "period": "all"}, follow=True
+        )
+        self.assertEqual(response.status_code, 200)
+        return BulkActionJob.objects.get()
+
+    def run_jobs(self, *args):
+        call_command("run_bulk_actions", "--chunk-size", "2", *args, stdout=StringIO())
+
+    def test_status_only_changes_through_the_actions(self):
+        payment = self.payments[1]
+        for url_name, obj in (("orders_order", payment.order), ("orders_payment", payment)):
+            response = self.client.get(reverse(f"admin:{url_name}_changelist"), {"period": "all"})
+            self.assertNotContains(response, 'name="form-0-status"')
+            response = self.client.get(reverse(f"admin:{url_name}_change", args=[obj.pk]))
+            self.assertNotIn("status", response.context["adminform"].form.fields)
+
+    def test_admin_action_only_enqueues(self):
+        job = self.run_action("admin:orders_payment_changelist", "mark_as_paid", [p.pk for p in self.payments])
+        self.assertEqual((job.action, job.status, job.created_by), ("mark_payments_paid", "PENDING", self.admin))
+        self.assertEqual(Payment.objects.filter(status="PENDING").count(), 4)
+
+        response = self.client.get(reverse("admin:orders_bulkactionjob_changelist"))
+        self.assertContains(response, "mark payments paid")
+
+    def test_paid_job_settles_pending_rows_in_chunks(self):
+        job = self.run_action("admin:orders_payment_changelist", "mark_as_paid", [p.pk for p in self.payments])
+        self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.total, job.processed, job.changed), ("DONE", 5, 5, 4))
+        self.assertEqual(job.last_id, max(p.pk for p in self.payments))
+        self.assertEqual(
+            list(Payment.objects.order_by("pk").values_list("status", flat=True)),
+            ["FAILED", "PAID", "PAID", "PAID", "PAID"],
+        )
+        self.assertEqual(Order.objects.filter(status="COMPLETED").count(), 4)
+        self.assertEqual(Subscription.objects.filter(status="ACTIVE").count(), 4)
+
+    def test_cancel_job_fails_payments_and_orders_without_one(self):
+        Payment.objects.filter(pk=self.payments[1].pk).delete()
+        orders = [p.order_id for p in self.payments]
+        job = self.run_action("admin:orders_order_changelist", "cancel_orders", orders)
+        self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.changed), ("DONE", 5, 5))
+        self.assertEqual(Order.objects.filter(status="CANCELED").count(), 5)
+        self.assertEqual(Payment.objects.filter(status="FAILED").count(), 4)
+        self.assertFalse(Subscription.objects.filter(status="ACTIVE").exists())
+
+    def test_failed_chunk_resumes_after_the_last_finished_one(self):
+        job = self.run_action("admin:orders_payment_changelist", "mark_as_failed", [p.pk for p in self.payments])
+        calls = []
+
+        def flaky(job, ids):
+            calls.append(ids)
+            if len(calls) == 2:
+                raise RuntimeError("database went away")
+            return apply_chunk(job, ids)
+
+        with mock.patch("orders.bulk_actions.apply_chunk", side_effect=flaky):
+            self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.last_error), ("PENDING", 2, "database went away"))
+
+        BulkActionJob.objects.filter(pk=job.pk).update(available_at=timezone.now())
+        self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.attempts), ("DONE", 5, 2))
+        self.assertEqual(Payment.objects.filter(status="FAILED").count(), 5)
+
+    def test_selection_is_the_ids_at_enqueue_time(self):
+        job = self.run_action("admin:orders_payment_changelist", "mark_as_paid", [self.payments[1].pk])
+        self.assertEqual((job.ids, job.total), ([self.payments[1].pk], 1))
+        self.run_jobs()
+        self.assertEqual(Payment.objects.filter(status="PAID").count(), 1)
+
+    def test_unrunnable_job_fails_after_max_attempts(self):
+        job = self.run_action("admin:orders_payment_changelist", "mark_as_paid", [self.payments[1].pk])
+        BulkActionJob.objects.filter(pk=job.pk).update(action="removed_action")
+        for _ in range(3):
+            BulkActionJob.objects.filter(pk=job.pk).update(available_at=timezone.now())
+            self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("FAILED", 3))
+        self.assertIsNotNone(job.finished)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PaymentEventTests(TestCase):
+
+    def setUp(self):
+        self.payment = create_pending_payment()
+        patcher = mock.patch("orders.services.get_client", return_value=FakeGateway())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_callback_appends_a_compressed_event(self):
+        self.client.get(reverse("payments:callback"), {"Authority": self.payment.authority, "Status": "OK"})
+
+        event = PaymentEvent.objects.get(payment=self.payment)
+        self.assertEqual(event.kind, "VERIFY")
+        self.assertEqual(event.data, {"data": {"code": 100, "ref_id": 1234}})
+        self.assertNotIn(b"ref_id", bytes(event.payload))
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.payment.user).access_token}")
+        response = client.get(reverse("payments:order-payment", args=[self.payment.order_id]))
+        self.assertNotIn("gateway_response", response.data)
+
+    def test_payloads_load_on_the_admin_change_page_only(self):
+        PaymentEvent.build(self.payment.id, "REQUEST", {"data": {"authority": "A0001"}}).save()
+        self.client.force_login(User.objects.create_superuser(phone="09129999999", password="password"))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("admin:orders_payment_changelist"), {"period": "all"})
+        self.assertFalse(any(PaymentEvent._meta.db_table in query["sql"] for query in queries))
+
+        response = self.client.get(reverse("admin:orders_payment_change", args=[self.payment.id]))
+        self.assertContains(response, "A0001")
+
+    def test_legacy_payloads_are_moved_in_chunks(self):
+        other = create_pending_payment(phone="09121111111", authority="A0000000000000000000000000000000002")
+        Payment.objects.filter(pk=other.pk).update(status="PAID", payment_date=timezone.now())
+        with connection.cursor() as cursor:
+            # the column of a database still at orders 0013, rolled back with the test
+            cursor.execute("ALTER TABLE orders_payment ADD COLUMN gateway_response text NULL")
+            for payment, payload in ((self.payment, {"data": {"code": 100}}), (other, {"data": {"code": 101}})):
+                cursor.execute(
+                    "UPDATE orders_payment SET gateway_response = %s WHERE id = %s", [json.dumps(payload), payment.id]
+                )
+
+        call_command("move_gateway_payloads", "--chunk-size", "1", stdout=StringIO())
+        call_command("move_gateway_payloads", stdout=StringIO())
+
+        events = {event.payment_id: (event.kind, event.data) for event in PaymentEvent.objects.all()}
+        self.assertEqual(events, {
+            self.payment.id: ("REQUEST", {"data": {"code": 100}}),
+            other.id: ("VERIFY", {"data": {"code": 101}}),
+        })
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM orders_payment WHERE gateway_response IS NOT NULL")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_nothing_to_move_once_the_column_is_dropped(self):
+        with self.assertRaisesMessage(CommandError, "already gone"):
+            call_command("move_gateway_payloads", stdout=StringIO())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReconcilePaymentsTests(TestCase):
+
+    def setUp(self):
+        self.stub = StubGateway().start()
+        self.addCleanup(self.stub.stop)
+        zarinpal = {**settings.ZARINPAL, "API_URL": self.stub.api_url, "VERIFY_RETRIES": 0, "BREAKER_FAILURES": 100}
+        settings_override = override_settings(ZARINPAL=zarinpal)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.paid, self.unpaid, self.misconfigured, self.down = (
+            create_pending_payment(phone=f"0912000000{i}", authority=f"A{i:035d}") for i in range(4)
+        )
+        self.stub.verify_codes = {self.unpaid.authority: -51, self.misconfigured.authority: -11}
+        self.stub.server_errors = {self.down.authority}
+
+    def reconcile(self, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command("reconcile_payments", "--older-than", "0", *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def statuses(self):
+        return {
+            payment.authority: (payment.status, payment.order.status)
+            for payment in Payment.objects.select_related("order")
+        }
+
+    def test_only_the_not_paid_code_fails_a_payment(self):
+        stdout, stderr = self.reconcile()
+
+        self.assertEqual(self.statuses(), {
+            self.paid.authority: ("PAID", "COMPLETED"),
+            self.unpaid.authority: ("FAILED", "CANCELED"),
+            self.misconfigured.authority: ("PENDING", "PENDING"),
+            self.down.authority: ("PENDING", "PENDING"),
+        })
+        self.assertIn("1 paid, 1 failed, 2 errors", stdout)
+        self.assertIn(f"payment {self.misconfigured.id} left pending", stderr)
+        self.assertIn(f"payment {self.down.id} left pending", stderr)
+
+    def test_dry_run_lists_candidates_without_calling_the_gateway(self):
+        stdout, _ = self.reconcile("--dry-run")
+
+        self.assertEqual(self.stub.requests, 0)
+        self.assertEqual({status for status, _ in self.statuses().values()}, {"PENDING"})
+        self.assertIn(f"payment {self.paid.id} authority {self.paid.authority}", stdout)
+        self.assertIn("[dry run] 4 payments would be verified", stdout)
+
+
+class ZarinpalClientTests(SimpleTestCase):
+
+    def setUp(self):
+        self.stub = StubGateway().start()
+        self.addCleanup(self.stub.stop)
+        self.stub.server_errors = {"DOWN"}
+        zarinpal = {
+            **settings.ZARINPAL,
+            "API_URL": self.stub.api_url,
+            "VERIFY_RETRIES": 0,
+            "BREAKER_FAILURES": 2,
+            "BREAKER_RESET": 30.0,
+        }
+        settings_override = override_settings(ZARINPAL=zarinpal)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.gateway = ZarinpalClient()
+        self.now = time.monotonic()
+        patcher = mock.patch("utils.zarinpal_client.time.monotonic", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fail_verify(self, times=1):
+        for _ in range(times):
+            with self.assertRaises(ZarinpalError):
+                self.gateway.verify_payment("DOWN", 1000)
+
+    def test_breaker_opens_after_consecutive_failures(self):
+        self.fail_verify(2)
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.OPEN)
+
+        requests = self.stub.requests
+        with self.assertRaises(CircuitOpenError):
+            self.gateway.verify_payment("A1", 1000)
+        self.assertEqual(self.stub.requests, requests)
+
+    def test_half_open_probe_closes_or_reopens(self):
+        self.fail_verify(2)
+        self.now += 30
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.HALF_OPEN)
+        # a failed probe opens it for another reset period
+        self.fail_verify()
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.OPEN)
+
+        self.now += 30
+        self.assertEqual(self.gateway.verify_payment("A1", 1000)["raw_response"]["data"]["code"], 100)
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.gateway.breaker.failures, 0)
+
+    def test_half_open_lets_one_probe_through(self):
+        self.fail_verify(2)
+        self.now += 30
+        self.assertTrue(self.gateway.breaker.allow())
+        self.assertFalse(self.gateway.breaker.allow())
+
+    def test_calls_reuse_one_connection(self):
+        new, reused = connection_samples("sync")
+        for i in range(5):
+            self.gateway.verify_payment(f"A{i}", 1000)
+        self.assertEqual((self.stub.requests, self.stub.connections), (5, 1))
+        self.assertEqual(connection_samples("sync"), (new + 1, reused + 4))
+
+    def test_breaker_state_is_exported(self):
+        self.assertEqual(breaker_sample("sync"), 0)
+        self.fail_verify(2)
+        self.assertEqual(breaker_sample("sync"), 2)
+        self.now += 30
+        self.gateway.verify_payment("A1", 1000)
+        self.assertEqual(breaker_sample("sync"), 0)
+
+
+class AsyncZarinpalClientTests(SimpleTestCase):
+
+    def setUp(self):
+        self.stub = StubGateway().start()
+        self.addCleanup(self.stub.stop)
+        zarinpal = {**settings.ZARINPAL, "API_URL": self.stub.api_url, "VERIFY_RETRIES": 0, "READ_TIMEOUT": 0.2}
+        settings_override = override_settings(ZARINPAL=zarinpal)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    async def verify(self, authority):
+        gateway = AsyncZarinpalClient()
+        try:
+            return await gateway.verify_payment(authority, 1000)
+        finally:
+            await gateway.aclose()
+
+    async def test_verify_success(self):
+        result = await self.verify("A1")
+        self.assertEqual(result["raw_response"]["data"]["code"], 100)
+        self.assertEqual(result["ref_id"], result["raw_response"]["data"]["ref_id"])
+
+    async def test_verify_failure_carries_the_code(self):
+        self.stub.verify_codes["A1"] = -51
+        with self.assertRaises(ZarinpalError) as raised:
+            await self.verify("A1")
+        self.assertEqual(raised.exception.code, -51)
+
+    async def test_verify_timeout(self):
+        self.stub.latency = 0.5
+        with self.assertRaisesMessage(ZarinpalError, "timed out") as raised:
+            await self.verify("A1")
+        self.assertIsNone(raised.exception.code)
+
+    async def test_calls_reuse_one_connection(self):
+        new, reused = connection_samples("async")
+        gateway = AsyncZarinpalClient()
+        try:
+            for i in range(3):
+                await gateway.verify_payment(f"A{i}", 1000)
+        finally:
+            await gateway.aclose()
+        self.assertEqual(self.stub.connections, 1)
+        self.assertEqual(connection_samples("async"), (new + 1, reused + 2))
+
+    async def test_server_errors_open_the_breaker(self):
+        self.stub.server_errors = {"DOWN"}
+        gateway = AsyncZarinpalClient()
+        try:
+            for _ in range(gateway.breaker.failure_threshold):
+                with self.assertRaises(ZarinpalError):
+                    await gateway.verify_payment("DOWN", 1000)
+            with self.assertRaises(CircuitOpenError):
+                await gateway.verify_payment("A1", 1000)
+            self.assertEqual(breaker_sample("async"), 2)
+        finally:
+            await gateway.aclose()
@@ -9,6 +9,13 @@ app_name = "orders"
 
 urlpatterns = [
     path("orders/", views.CreateListOrderView.as_view(), name="orders"),
+    path("orders/search/", views.OrderSearchView.as_view(), name="orders-search"),
+    path(
+        "orders/<int:pk>/payment/",
+        views.OrderPaymentView.as_view(),
+        name="order-payment",
+    ),
     path("callback/", views.PaymentCallbackView.as_view(), name="callback"),
+    path("callback/async/", views.payment_callback_async, name="callback-async"),
     path("orders/user/", views.UserOrderPaymentListView.as_view(), name="orders-user")
 ]
@@ -1,22 +1,37 @@
 from __future__ import annotations
 
+from accounts.authentication import StatelessJWTAuthentication
 from django.db import transaction
 from django.shortcuts import redirect
-from django.utils import timezone
-from django_ratelimit.decorators import ratelimit
+from django.utils.decorators import method_decorator
 from drf_spectacular.utils import extend_schema
 from products.models import Plan, Subscription
 from rest_framework import generics, status
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
-from utils.zarinpal_client import ZarinpalClient
+from stats.rollups import record_order
+from utils.metrics import ratelimit
+from utils.pagination import CreatedCursorPagination, RankedPagination
+
+from core.db_router import use_replica
 
 from .models import Order, Payment
+from .outbox import enqueue_payment_request
+from .search import MIN_QUERY_LENGTH, normalize, ranked
 from .serializers import (
     OrderDetailSerializer,
+    OrderSearchResultSerializer,
     OrderSerializer,
+    PaymentSerializer,
     UserOrderPaymentListSerializer,
 )
+from .services import (
+    PAYMENT_FAILED_URL,
+    PAYMENT_SUCCESS_URL,
+    aprocess_callback,
+    process_callback,
+)
 
 
 # Create your views here.
@@ -26,8 +41,9 @@ class CreateListOrderView(generics.GenericAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
 
-    @ratelimit(key='user_or_ip', rate='5/m', method='POST', block=True)
-    @transaction.atomic()
+    @method_decorator(
+        ratelimit(key='user_or_ip', rate='5/m', method='POST', block=True)
+    )
     def post(self, request, *args, **kwargs):
 
         serializer = self.serializer_class(data=request.data)
@@ -42,44 +58,58 @@ class CreateListOrderView(generics.GenericAPIView):
             if not plan:
                 return Response({"detail":"this plan is not exist"}, status=status.HTTP_400_BAD_REQUEST)
 
-            order = Order.objects.create(
-                user=request.user,
-                plan=plan,
-                first_name=validated_data["first_name"],
-                last_name=validated_data["last_name"],
-                phone=validated_data["phone"],
-                city=validated_data["city"],
-                address=validated_data["address"],
-                status="PENDING",
-            )
-
-            payment = Payment.objects.create(
-                user=request.user,
-                order=order,
-                status="PENDING",
-                amount=plan.price
+            with transaction.atomic():
+                order = Order.objects.create(
+                    user=request.user,
+                    plan=plan,
+                    first_name=validated_data["first_name"],
+                    last_name=validated_data["last_name"],
+                    phone=validated_data["phone"],
+                    city=validated_data["city"],
+                    address=validated_data["address"],
+                    status="PENDING",
                 )
-            zarinpal = ZarinpalClient()
-            response = zarinpal.request_payment(
-                            amount=plan.price,
-                            callback_url="http://127.0.0.1:8000/api/v1/payments/callback/",
-                            mobile=validated_data["phone"],
-                            description=f"Payment for order {order.id}"
-                        )
-            payment.authority = response.get("authority")
-            payment.payment_url = response.get("payment_url")
-            payment.gateway_response = response["raw_response"]
-            payment.save()
-
-            Subscription.objects.create(user=request.user, plan=plan, status="CANCELED", is_trial=False)
-
-            return Response(OrderDetailSerializer(order).data, status=status.HTTP_200_OK)
+                record_order(order)
+
+                payment = Payment.objects.create(
+                    user=request.user,
+                    order=order,
+                    status="PENDING",
+                    amount=plan.price
+                    )
+                enqueue_payment_request(payment)
+
+                Subscription.objects.create(user=request.user, plan=plan, status="CANCELED", is_trial=False)
+
+            return Response(
+                OrderDetailSerializer(order).data, status=status.HTTP_202_ACCEPTED
+            )
 
         except Plan.DoesNotExist:
             return Response({"detail": "This plan does not exist"}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"detail": f"Error creating order: {e!s}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class OrderPaymentView(generics.RetrieveAPIView):
+
+    permission_classes = [IsAuthenticated]
+    authentication_classes = (StatelessJWTAuthentication,)
+    serializer_class = PaymentSerializer
+    lookup_field = "order_id"
+    lookup_url_kwarg = "pk"
+
+    def get_queryset(self):
+        return Payment.objects.filter(user_id=self.request.user.id)
+
+    def retrieve(self, request, *args, **kwargs):
+        payment = self.get_object()
+        data = self.get_serializer(payment).data
+        if payment.status == "PENDING" and not payment.payment_url:
+            return Response(
+                data, status=status.HTTP_202_ACCEPTED, headers={"Retry-After": "1"}
+            )
+        return Response(data, status=status.HTTP_200_OK)
+
 
 @extend_schema(exclude=True)
 class PaymentCallbackView(generics.GenericAPIView):
@@ -91,44 +121,79 @@ class PaymentCallbackView(generics.GenericAPIView):
         status = request.query_params.get("Status")
 
         if not authority or status != "OK":
-            return redirect("http://bahoosh360.ir/payment/failed/")
+            return redirect(PAYMENT_FAILED_URL)
 
         try:
-            payment = Payment.objects.get(authority=authority)
-            zarinpal = ZarinpalClient()
-            result = zarinpal.verify_payment(authority, payment.amount)
-
-            payment.status = "PAID" if result["raw_response"]["data"]["code"] in [100, 101] else "FAILED"
-            payment.ref_id = result.get("ref_id")
-            payment.payment_date = timezone.now()
-            payment.gateway_response = result["raw_response"]
-            payment.save()
-
-            if payment.status == "PAID":
-                payment.order.status = "COMPLETED"
-                payment.order.save()
-                subscription = Subscription.objects.get(user=payment.user)
-                subscription.status = "ACTIVE"
-                subscription.save()
-                return redirect("http://bahoosh360.ir/payment/success/")
-            payment.order.status = "CANCELED"
-            payment.order.save()
-            return redirect("http://bahoosh360.ir/payment/failed/")
+            if process_callback(authority):
+                return redirect(PAYMENT_SUCCESS_URL)
+            return redirect(PAYMENT_FAILED_URL)
         except Payment.DoesNotExist:
-            return redirect("http://bahoosh360.ir/payment/failed/")
+            return redirect(PAYMENT_FAILED_URL)
         except Exception:
-            return redirect("http://bahoosh360.ir/payment/failed/")
+            return redirect(PAYMENT_FAILED_URL)
+
+
+async def payment_callback_async(request):
+    """
+    Same flow as PaymentCallbackView without holding a worker thread while the
+    gateway verifies, meant to be served through core.asgi.
+    """
+    authority = request.GET.get("Authority")
+    status = request.GET.get("Status")
+
+    if not authority or status != "OK":
+        return redirect(PAYMENT_FAILED_URL)
+
+    try:
+        if await aprocess_callback(authority):
+            return redirect(PAYMENT_SUCCESS_URL)
+        return redirect(PAYMENT_FAILED_URL)
+    except Payment.DoesNotExist:
+        return redirect(PAYMENT_FAILED_URL)
+    except Exception:
+        return redirect(PAYMENT_FAILED_URL)
 
 class UserOrderPaymentListView(generics.ListAPIView):
 
-    permission_classes = [IsAuthenticated]
+    permission_classes = (IsAuthenticated,)
+    authentication_classes = (StatelessJWTAuthentication,)
     serializer_class = UserOrderPaymentListSerializer
+    pagination_class = CreatedCursorPagination
 
     def get_queryset(self):
-            return Payment.objects.select_related("order__plan").filter(user=self.request.user)
+        return Payment.objects.select_related("order__plan").filter(
+            user_id=self.request.user.id
+        )
 
     def list(self, request, *args, **kwargs):
         try:
+            # from the primary, right after paying a lagging replica would show
+            # the order unpaid
             return super().list(request, *args, **kwargs)
         except Exception:
             return Response({"error": "An error occurred while fetching payments."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class OrderSearchView(generics.ListAPIView):
+    """
+    Staff lookup of orders by any fragment of a name, phone, email, address
+    or payment reference in ``?q=``, best matches first. A number also
+    matches the order id.
+    """
+
+    permission_classes = (IsAdminUser,)
+    authentication_classes = (StatelessJWTAuthentication,)
+    serializer_class = OrderSearchResultSerializer
+    pagination_class = RankedPagination
+
+    def get_queryset(self):
+        query = normalize(self.request.query_params.get("q", ""))
+        if len(query) < MIN_QUERY_LENGTH and not query.isdigit():
+            msg = f"Enter at least {MIN_QUERY_LENGTH} characters or an order id."
+            raise ValidationError({"q": msg})
+        return ranked(Order.objects.select_related("user", "payment"), query)
+
+    def list(self, request, *args, **kwargs):
+        # support lookups tolerate replication lag
+        with use_replica():
+            return super().list(request, *args, **kwargs)
@@ -8,4 +8,7 @@ from .models import Plan, Subscription
 # Register your models here.
 
 admin.site.register(Plan)
-admin.site.register(Subscription)
+
+@admin.register(Subscription)
+class SubscriptionAdmin(admin.ModelAdmin):
+    list_select_related = ('user', 'plan')
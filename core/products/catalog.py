@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from datetime import timedelta
+import hashlib
+import threading
+import time
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from utils.metrics import cache_lookup
+
+from .models import Plan, Subscription
+from .serializers import PlanSerializer
+
+
+GENERATION_KEY = "plan-catalog:generation"
+BODY_KEY = "plan-catalog:{generation}"
+TRIAL_PLAN_KEY = "plan-catalog:trial"
+
+
+class Catalog(NamedTuple):
+    generation: int
+    body: bytes
+    etag: str
+
+
+# latest rendered catalog of this process, replaced whenever the generation moves
+_local = {}
+_lock = threading.Lock()
+
+
+def _new_generation():
+    # time based, so a lost counter never comes back at a generation an old
+    # body was stored under
+    return time.time_ns() // 1000
+
+
+def current_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, _new_generation(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    try:
+        return cache.incr(GENERATION_KEY)
+    except ValueError:
+        generation = _new_generation()
+        cache.set(GENERATION_KEY, generation, timeout=None)
+        return generation
+
+
+def render_catalog(generation):
+    # from the primary: the generation moves on its commit, and a lagging
+    # replica would get its old plans cached under the new generation
+    data = PlanSerializer(Plan.objects.order_by("id"), many=True).data
+    body = JSONRenderer().render(data)
+    etag = '"%s"' % hashlib.sha1(body).hexdigest()[:20]
+    return Catalog(generation, body, etag)
+
+
+def get_catalog():
+    """
+    Pre-rendered plan catalog for the current generation, served from process
+    memory, then the shared cache, rendering from the database only on a miss.
+    """
+    generation = current_generation()
+
+    catalog = _local.get("catalog")
+    if catalog is not None and catalog.generation == generation:
+        return catalog
+
+    key = BODY_KEY.format(generation=generation)
+    cached = cache.get(key)
+    cache_lookup("plan_catalog", cached is not None)
+    if cached is not None:
+        catalog = Catalog(generation, *cached)
+    else:
+        catalog = render_catalog(generation)
+        cache.set(
+            key, (catalog.body, catalog.etag), timeout=settings.PLAN_CATALOG["TIMEOUT"]
+        )
+
+    with _lock:
+        latest = _local.get("catalog")
+        if latest is None or latest.generation != generation:
+            _local["catalog"] = catalog
+    return catalog
+
+
+def get_trial_plan():
+    """
+    ``(id, duration_days)`` of the free trial plan, or None when there is
+    none. Cached until a plan changes.
+    """
+    cached = cache.get(TRIAL_PLAN_KEY)
+    cache_lookup("trial_plan", cached is not None)
+    if cached is None:
+        plan = (
+            Plan.objects.filter(duration_days=3, price=0)
+            .values_list("id", "duration_days")
+            .first()
+        )
+        # an empty tuple caches "no trial plan" as well
+        cached = tuple(plan) if plan else ()
+        cache.set(TRIAL_PLAN_KEY, cached, timeout=settings.PLAN_CATALOG["TIMEOUT"])
+    return cached or None
+
+
+def invalidate_trial_plan():
+    cache.delete(TRIAL_PLAN_KEY)
+
+
+def trial_subscriptions(users):
+    """
+    Unsaved trial Subscriptions for ``users``, none when there is no trial plan.
+    """
+    trial = get_trial_plan()
+    if trial is None:
+        return []
+    plan_id, duration_days = trial
+    start = timezone.now()
+    end = start + timedelta(days=duration_days)
+    return [
+        Subscription(
+            user=user, plan_id=plan_id, start_date=start, end_date=end, is_trial=True
+        )
+        for user in users
+    ]
+
+
+def trial_subscription(user):
+    subscriptions = trial_subscriptions([user])
+    return subscriptions[0] if subscriptions else None
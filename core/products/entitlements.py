@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import threading
+import time
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from utils.metrics import cache_lookup
+
+from .models import ACTIVE_STATUSES, Subscription
+
+
+CACHE_KEY = "entitlement:{user_id}"
+
+
+class Entitlement(NamedTuple):
+    plan_id: int | None
+    end_date: float | None
+    status: str | None
+
+    @property
+    def is_active(self):
+        return (
+            self.status in ACTIVE_STATUSES
+            and self.end_date is not None
+            and self.end_date > time.time()
+        )
+
+
+NO_ENTITLEMENT = Entitlement(None, None, None)
+
+
+class _LocalLRU:
+    """
+    Small per-process LRU in front of the shared cache, entries carry their own
+    monotonic deadline so another process' invalidation is picked up quickly.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, deadline = item
+            if deadline <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local = _LocalLRU(settings.ENTITLEMENT_CACHE["LOCAL_MAXSIZE"])
+
+
+def _cache_key(user_id):
+    return CACHE_KEY.format(user_id=user_id)
+
+
+def _timeout(entitlement):
+    config = settings.ENTITLEMENT_CACHE
+    if not entitlement.is_active:
+        return config["NEGATIVE_TIMEOUT"]
+    remaining = int(entitlement.end_date - time.time())
+    return max(1, min(remaining, config["TIMEOUT"]))
+
+
+def active_subscriptions(user_id):
+    return Subscription.objects.filter(
+        user_id=user_id,
+        status__in=ACTIVE_STATUSES,
+        end_date__gt=timezone.now(),
+    ).order_by("-end_date")
+
+
+def load_entitlement(user_id):
+    subscription = (
+        active_subscriptions(user_id).values("plan_id", "end_date", "status").first()
+    )
+    if subscription is None:
+        return NO_ENTITLEMENT
+    return Entitlement(
+        subscription["plan_id"],
+        subscription["end_date"].timestamp(),
+        subscription["status"],
+    )
+
+
+def get_entitlement(user_id):
+    key = _cache_key(user_id)
+
+    entitlement = _local.get(key)
+    cache_lookup("entitlement_local", entitlement is not None)
+    if entitlement is not None:
+        return entitlement
+
+    cached = cache.get(key)
+    cache_lookup("entitlement", cached is not None)
+    if cached is not None:
+        entitlement = Entitlement(*cached)
+    else:
+        entitlement = load_entitlement(user_id)
+        cache.set(key, tuple(entitlement), timeout=_timeout(entitlement))
+
+    _local.set(
+        key,
+        entitlement,
+        min(_timeout(entitlement), settings.ENTITLEMENT_CACHE["LOCAL_TIMEOUT"]),
+    )
+    return entitlement
+
+
+def invalidate_entitlement(user_id):
+    key = _cache_key(user_id)
+    _local.delete(key)
+    cache.delete(key)
+
+
+def invalidate_entitlements(user_ids):
+    keys = [_cache_key(user_id) for user_id in set(user_ids)]
+    if not keys:
+        return
+    for key in keys:
+        _local.delete(key)
+    cache.delete_many(keys)
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from stats.rollups import record_expirations
+
+from products.entitlements import ACTIVE_STATUSES, invalidate_entitlements
+from products.models import Subscription
+
+
+class Command(BaseCommand):
+    help = "Mark active subscriptions whose end_date has passed as expired."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep sweeping every --interval seconds.",
+        )
+        parser.add_argument("--interval", type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        while True:
+            self.sweep(options["chunk_size"])
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+    def sweep(self, chunk_size):
+        now = timezone.now()
+        started = time.monotonic()
+        expired = 0
+        last_id = 0
+
+        while True:
+            with transaction.atomic():
+                # locked, so the rows counted are exactly the rows updated
+                rows = list(
+                    Subscription.objects.select_for_update()
+                    .filter(
+                        status__in=ACTIVE_STATUSES,
+                        end_date__lte=now,
+                        id__gt=last_id,
+                    )
+                    .order_by("id")
+                    .values_list("id", "user_id", "plan_id", "end_date")[:chunk_size]
+                )
+                if not rows:
+                    break
+
+                ids = [row[0] for row in rows]
+                expired += Subscription.objects.filter(id__in=ids).update(
+                    status="expired"
+                )
+                record_expirations(
+                    (plan_id, end_date) for _, _, plan_id, end_date in rows
+                )
+            invalidate_entitlements(row[1] for row in rows)
+            last_id = ids[-1]
+
+        elapsed = time.monotonic() - started
+        rate = expired / elapsed if elapsed else 0
+        self.stdout.write(
+            f"Expired {expired} subscriptions in {elapsed:.2f}s ({rate:.0f} rows/sec)"
+        )
+        return expired
@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-18 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_alter_subscription_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(condition=models.Q(('status__in', ('active', 'ACTIVE'))), fields=['user', '-end_date'], name='subscription_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(condition=models.Q(('status__in', ('active', 'ACTIVE'))), fields=['end_date', 'id'], name='subscription_active_end_idx'),
+        ),
+    ]
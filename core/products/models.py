@@ -9,6 +9,9 @@ from django.utils import timezone
 
 User = get_user_model()
 
+# "ACTIVE" is what the order views have always written, "active" is the field default
+ACTIVE_STATUSES = ("active", "ACTIVE")
+
 # Create your models here.
 
 class Plan(models.Model):
@@ -44,6 +47,18 @@ class Subscription(models.Model):
         indexes = [
             models.Index(fields=["status"]),
             models.Index(fields=["end_date"]),
+            # entitlement lookups and the "already subscribed" check on order create
+            models.Index(
+                fields=["user", "-end_date"],
+                condition=models.Q(status__in=ACTIVE_STATUSES),
+                name="subscription_user_active_idx",
+            ),
+            # the expiry sweeper
+            models.Index(
+                fields=["end_date", "id"],
+                condition=models.Q(status__in=ACTIVE_STATUSES),
+                name="subscription_active_end_idx",
+            ),
         ]
 
     def save(self, *args, **kwargs):
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
 from django.contrib.auth import get_user_model
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from stats.rollups import record_subscriptions
 
+from .catalog import bump_generation, invalidate_trial_plan, trial_subscription
+from .entitlements import invalidate_entitlement
 from .models import Plan, Subscription
 
 
@@ -11,7 +15,22 @@ User = get_user_model()
 
 @receiver(post_save, sender=User)
 def create_welcome_subscription(sender, instance, created, **kwargs):
-    if created:
-        plan = Plan.objects.filter(duration_days=3, price=0).first()
-        if plan:
-            Subscription.objects.create(user=instance, plan=plan, is_trial=True)
+    # accounts.services.signup creates the trial itself
+    if created and not getattr(instance, "_skip_bootstrap", False):
+        subscription = trial_subscription(instance)
+        if subscription:
+            with transaction.atomic():
+                subscription.save()
+                record_subscriptions([subscription])
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def clear_entitlement_cache(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_entitlement(user_id))
+
+@receiver(post_save, sender=Plan)
+@receiver(post_delete, sender=Plan)
+def bump_catalog_generation(sender, **kwargs):
+    transaction.on_commit(bump_generation)
+    transaction.on_commit(invalidate_trial_plan)
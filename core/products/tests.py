@@ -1,2 +1,348 @@
+from __future__ import annotations
 
-# Create your tests here.
+from datetime import timedelta
+from io import StringIO
+import json
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from orders.models import Order, Payment
+from orders.services import apply_verification
+from prometheus_client import REGISTRY
+from rest_framework.test import APIClient
+from stats.models import PlanSubscriberCount
+from utils.testing import QueryBudgetMixin
+
+from core.db_router import ReplicaRouter, use_replica
+
+from . import entitlements
+from .catalog import current_generation, render_catalog
+from .entitlements import get_entitlement
+from .models import Plan, Subscription
+from .permissions import HasValidSubscription
+
+
+User = get_user_model()
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductQueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(phone="09129999999", password="password")
+        self.seeded = 0
+
+    def seed_plans(self, count):
+        Plan.objects.bulk_create(Plan(duration_days=30, price=1000) for _ in range(count))
+
+    def seed_subscriptions(self, count):
+        plan = Plan.objects.create(duration_days=30, price=1000)
+        for _ in range(count):
+            self.seeded += 1
+            user = User.objects.create(phone=f"0913{self.seeded:07d}")
+            Subscription.objects.create(user=user, plan=plan)
+
+    def test_plan_list(self):
+        url = reverse("products:plans")
+        self.assertConstantQueries(self.seed_plans, lambda: self.client.get(url))
+
+    def test_subscription_admin_changelist(self):
+        self.client.force_login(self.admin)
+        url = reverse("admin:products_subscription_changelist")
+        self.assertConstantQueries(self.seed_subscriptions, lambda: self.client.get(url))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PlanCatalogTests(TestCase):
+
+    def setUp(self):
+        # locmem outlives the test transaction, start from a fresh generation
+        cache.clear()
+        self.url = reverse("products:plans")
+        Plan.objects.create(duration_days=30, price=1000)
+
+    def test_warm_catalog_skips_the_database(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("max-age", first["Cache-Control"])
+
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+    @override_settings(DATABASE_REPLICAS=["replica1"])
+    def test_catalog_renders_from_the_primary(self):
+        # outside the test transaction a read marked for the replica would go to replica1
+        with mock.patch.object(connection, "in_atomic_block", False):
+            catalog = render_catalog(current_generation())
+        self.assertEqual(len(json.loads(catalog.body)), 1)
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+    def test_plan_change_bumps_the_generation(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Plan.objects.create(duration_days=90, price=2500)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(len(response.json()), 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class EntitlementTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        entitlements._local.clear()
+        self.addCleanup(entitlements._local.clear)
+        self.plan = Plan.objects.create(duration_days=30, price=1000)
+        self.user = User.objects.create(phone="09120000000")
+
+    def subscribe(self, status="ACTIVE"):
+        return Subscription.objects.create(
+            user=self.user,
+            plan=self.plan,
+            status=status,
+            end_date=timezone.now() + timedelta(days=30),
+        )
+
+    def test_repeated_lookups_skip_the_database(self):
+        self.subscribe()
+        with self.assertNumQueries(1):
+            self.assertTrue(get_entitlement(self.user.pk).is_active)
+        with self.assertNumQueries(0):
+            self.assertTrue(get_entitlement(self.user.pk).is_active)
+
+        # another process only sees the shared cache
+        entitlements._local.clear()
+        with self.assertNumQueries(0):
+            entitlement = get_entitlement(self.user.pk)
+        self.assertEqual(entitlement.plan_id, self.plan.pk)
+
+    def test_missing_subscription_is_cached_as_well(self):
+        self.assertFalse(get_entitlement(self.user.pk).is_active)
+        with self.assertNumQueries(0):
+            self.assertFalse(get_entitlement(self.user.pk).is_active)
+
+    def test_subscription_changes_invalidate_after_commit(self):
+        self.assertFalse(get_entitlement(self.user.pk).is_active)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            subscription = self.subscribe()
+        self.assertTrue(get_entitlement(self.user.pk).is_active)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            subscription.status = "expired"
+            subscription.save()
+        self.assertFalse(get_entitlement(self.user.pk).is_active)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subscribe().delete()
+        self.assertFalse(get_entitlement(self.user.pk).is_active)
+
+    def test_paid_payment_invalidates_after_commit(self):
+        self.subscribe(status="CANCELED")
+        order = Order.objects.create(
+            user=self.user,
+            plan=self.plan,
+            first_name="first",
+            last_name="last",
+            phone=self.user.phone,
+            city="city",
+            address="address",
+        )
+        payment = Payment.objects.create(
+            user=self.user, order=order, status="PENDING", amount=self.plan.price, authority="A1"
+        )
+        self.assertFalse(get_entitlement(self.user.pk).is_active)
+
+        result = {"ref_id": 1234, "raw_response": {"data": {"code": 100, "ref_id": 1234}}}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(apply_verification(payment, result))
+        self.assertTrue(get_entitlement(self.user.pk).is_active)
+
+    def test_permission_reads_the_entitlement(self):
+        request = mock.Mock(user=self.user)
+        self.assertFalse(HasValidSubscription().has_permission(request, None))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subscribe()
+        self.assertTrue(HasValidSubscription().has_permission(request, None))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class WelcomeSubscriptionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_new_user_gets_the_trial(self):
+        trial = Plan.objects.create(duration_days=3, price=0)
+        user = User.objects.create(phone="09120000000")
+
+        subscription = Subscription.objects.get(user=user)
+        self.assertTrue(subscription.is_trial)
+        self.assertEqual(subscription.plan, trial)
+        self.assertEqual(subscription.end_date - subscription.start_date, timedelta(days=3))
+
+    def test_no_trial_without_a_trial_plan(self):
+        Plan.objects.create(duration_days=30, price=1000)
+        user = User.objects.create(phone="09120000000")
+        self.assertFalse(Subscription.objects.filter(user=user).exists())
+
+    def test_signup_bootstrap_skips_the_signal(self):
+        Plan.objects.create(duration_days=3, price=0)
+        user = User(phone="09120000000")
+        user._skip_bootstrap = True
+        user.save()
+        self.assertFalse(Subscription.objects.filter(user=user).exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ExpireSubscriptionsTests(TestCase):
+
+    def setUp(self):
+        self.plan = Plan.objects.create(duration_days=30, price=1000)
+        now = timezone.now()
+        self.expired = [self.subscribe(now - timedelta(days=1)) for _ in range(5)]
+        self.current = self.subscribe(now + timedelta(days=1))
+        self.canceled = self.subscribe(now - timedelta(days=1), status="canceled")
+
+    def subscribe(self, end_date, status="active"):
+        user = User.objects.create(phone=f"0912{User.objects.count():07d}")
+        return Subscription.objects.create(user=user, plan=self.plan, end_date=end_date, status=status)
+
+    def sweep(self, *args):
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command("expire_subscriptions", *args, stdout=out)
+        updates = [q for q in queries.captured_queries if q["sql"].startswith('UPDATE "products_subscription"')]
+        return out.getvalue(), len(updates)
+
+    def test_expires_past_due_rows_in_chunks(self):
+        out, updates = self.sweep("--chunk-size", "2")
+
+        self.assertIn("Expired 5 subscriptions", out)
+        self.assertEqual(updates, 3)
+        self.assertEqual(
+            set(Subscription.objects.filter(status="expired").values_list("id", flat=True)),
+            {subscription.id for subscription in self.expired},
+        )
+        self.current.refresh_from_db()
+        self.canceled.refresh_from_db()
+        self.assertEqual(self.current.status, "active")
+        self.assertEqual(self.canceled.status, "canceled")
+
+    def test_second_run_changes_nothing(self):
+        self.sweep()
+        counts = list(PlanSubscriberCount.objects.values_list("plan_id", "active"))
+
+        out, updates = self.sweep()
+
+        self.assertIn("Expired 0 subscriptions", out)
+        self.assertEqual(updates, 0)
+        self.assertEqual(list(PlanSubscriberCount.objects.values_list("plan_id", "active")), counts)
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"])
+class ReplicaRouterTests(SimpleTestCase):
+
+    def test_only_marked_reads_go_to_replica(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Plan))
+        with use_replica():
+            self.assertEqual(router.db_for_read(Plan), "replica1")
+            self.assertEqual(router.db_for_write(Plan), "default")
+        self.assertIsNone(router.db_for_read(Plan))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_reads_stay_on_primary(self):
+        with use_replica():
+            self.assertIsNone(ReplicaRouter().db_for_read(Plan))
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"])
+class ReplicaRouterTransactionTests(TestCase):
+
+    def test_reads_inside_a_transaction_stay_on_primary(self):
+        # TestCase wraps every test in a transaction on the primary
+        with use_replica():
+            self.assertIsNone(ReplicaRouter().db_for_read(Plan))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, METRICS={"TOKEN": "secret"})
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_latency_queries_and_cache_lookups(self):
+        Plan.objects.create(duration_days=30, price=1000)
+        with self.captureOnCommitCallbacks(execute=True):
+            Plan.objects.create(duration_days=90, price=2500)
+        view = {"view": "products:plans"}
+        requests = self.sample("http_request_duration_seconds_count", method="GET", status="200", **view)
+        queries = self.sample("http_request_db_queries_sum", **view)
+        misses = self.sample("cache_lookups_total", cache="plan_catalog", result="miss")
+
+        self.client.get(reverse("products:plans"))
+
+        self.assertEqual(
+            self.sample("http_request_duration_seconds_count", method="GET", status="200", **view),
+            requests + 1,
+        )
+        self.assertGreater(self.sample("http_request_db_queries_sum", **view), queries)
+        self.assertEqual(self.sample("cache_lookups_total", cache="plan_catalog", result="miss"), misses + 1)
+
+    def test_metrics_endpoint_needs_the_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"http_request_duration_seconds_bucket", response.content)
+
+    @override_settings(METRICS={"TOKEN": None, "ALLOWED_NETWORKS": []})
+    def test_metrics_endpoint_is_closed_by_default(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer ").status_code, 403)
+
+    @override_settings(METRICS={"TOKEN": None, "ALLOWED_NETWORKS": ["10.0.0.0/8"]})
+    def test_metrics_endpoint_allows_internal_networks(self):
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.1.2.3").status_code, 200)
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="203.0.113.7").status_code, 403)
+
+    @override_settings(RATELIMIT_ENABLE=True)
+    def test_rate_limit_counts_passed_and_blocked(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(phone="09121111111"))
+        view = {"view": "payments:orders"}
+        passed = self.sample("ratelimit_requests_total", result="passed", **view)
+        blocked = self.sample("ratelimit_requests_total", result="blocked", **view)
+
+        client.get(reverse("payments:orders"))
+        for _ in range(6):
+            client.post(reverse("payments:orders"), {}, format="json")
+
+        self.assertEqual(self.sample("ratelimit_requests_total", result="passed", **view), passed + 5)
+        self.assertEqual(self.sample("ratelimit_requests_total", result="blocked", **view), blocked + 1)
@@ -1,8 +1,14 @@
 from __future__ import annotations
 
+from accounts.authentication import StatelessJWTAuthentication
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
 from rest_framework import generics
 from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAdminUser
 
+from .catalog import get_catalog
 from .models import Plan
 from .serializers import PlanSerializer
 
@@ -13,8 +19,22 @@ class CreatePlanView(generics.ListCreateAPIView):
 
     serializer_class = PlanSerializer
     queryset = Plan.objects.all()
+    authentication_classes = (StatelessJWTAuthentication,)
 
     def get_permissions(self):
         if self.request.method in SAFE_METHODS:
             return [AllowAny()]
         return [IsAdminUser()]
+
+    def list(self, request, *args, **kwargs):
+        catalog = get_catalog()
+        etags = parse_etags(request.headers.get("If-None-Match", ""))
+        if catalog.etag in etags or "*" in etags:
+            response = HttpResponse(status=304)
+        else:
+            response = HttpResponse(catalog.body, content_type="application/json")
+        response["ETag"] = catalog.etag
+        patch_cache_control(
+            response, public=True, max_age=settings.PLAN_CATALOG["MAX_AGE"]
+        )
+        return response
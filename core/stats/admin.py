@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from django.contrib import admin
+from django.template.response import TemplateResponse
+from django.urls import path
+
+from .models import DailyOrderStats, DailySubscriptionStats, PlanSubscriberCount
+from .reports import get_dashboard
+
+
+class RollupAdmin(admin.ModelAdmin):
+    """
+    Rollups are written by stats.rollups and rebuild_rollups only.
+    """
+
+    list_select_related = ("plan",)
+    date_hierarchy = "day"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DailyOrderStats)
+class DailyOrderStatsAdmin(RollupAdmin):
+    list_display = ("day", "plan", "city", "orders", "paid", "failed", "revenue")
+    list_filter = ("plan",)
+    search_fields = ("city",)
+
+    def get_urls(self):
+        return [
+            path(
+                "dashboard/",
+                self.admin_site.admin_view(self.dashboard_view),
+                name="stats_dashboard",
+            ),
+            *super().get_urls(),
+        ]
+
+    def dashboard_view(self, request):
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Stats dashboard",
+            "opts": self.model._meta,
+            "dashboard": get_dashboard(),
+        }
+        return TemplateResponse(request, "admin/stats/dashboard.html", context)
+
+
+@admin.register(DailySubscriptionStats)
+class DailySubscriptionStatsAdmin(RollupAdmin):
+    list_display = ("day", "plan", "started", "trials", "expired")
+    list_filter = ("plan",)
+
+
+@admin.register(PlanSubscriberCount)
+class PlanSubscriberCountAdmin(RollupAdmin):
+    list_display = ("plan", "active")
+    date_hierarchy = None
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from argparse import ArgumentTypeError
+from datetime import date, timedelta
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from orders.models import Order
+from products.models import Subscription
+
+from stats.rollups import rebuild_days, rebuild_subscriber_counts
+
+
+def parse_day(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        msg = f"not a YYYY-MM-DD date: {value}"
+        raise ArgumentTypeError(msg)
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the daily stats rollups from the orders, payments and "
+        "subscriptions tables, one transaction per chunk of days, then the "
+        "active subscriber counts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            type=parse_day,
+            help="First day, default is the oldest order or subscription.",
+        )
+        parser.add_argument(
+            "--until", type=parse_day, help="Last day, default is today."
+        )
+        parser.add_argument("--chunk-days", type=int, default=31)
+
+    def handle(self, *args, **options):
+        since = options["since"] or self.first_day()
+        until = options["until"] or timezone.localdate()
+        if since is None:
+            self.stdout.write("Nothing to rebuild.")
+            return
+        if since > until:
+            msg = "--since is after --until."
+            raise CommandError(msg)
+
+        started = time.monotonic()
+        day = since
+        while day <= until:
+            last = min(day + timedelta(days=options["chunk_days"] - 1), until)
+            order_rows, subscription_rows = rebuild_days(day, last)
+            self.stdout.write(
+                f"{day} .. {last}: {order_rows} order rows, "
+                f"{subscription_rows} subscription rows"
+            )
+            day = last + timedelta(days=1)
+
+        rebuild_subscriber_counts()
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"Rebuilt rollups of {since} .. {until} in {elapsed:.2f}s")
+
+    def first_day(self):
+        oldest = [
+            Order.objects.aggregate(first=Min("created"))["first"],
+            Subscription.objects.aggregate(first=Min("start_date"))["first"],
+        ]
+        oldest = [value for value in oldest if value is not None]
+        return timezone.localdate(min(oldest)) if oldest else None
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from django.db import models
+from products.models import Plan
+
+
+# Rollups are maintained by stats.rollups in the same transaction as the
+# state transition they count, rebuild_rollups recomputes them from scratch.
+
+
+class DailyOrderStats(models.Model):
+    """
+    Orders placed and payments settled per day, plan and city.
+    """
+
+    ROLLUP_KEY = ("day", "plan_id", "city")
+
+    day = models.DateField()
+    plan = models.ForeignKey(Plan, on_delete=models.CASCADE, related_name="+")
+    city = models.CharField(max_length=100)
+    orders = models.PositiveIntegerField(default=0)
+    paid = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    revenue = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "daily order stats"
+        constraints = (
+            models.UniqueConstraint(
+                fields=["day", "plan", "city"], name="daily_order_stats_key"
+            ),
+        )
+
+    def __str__(self):
+        return f"{self.day} {self.plan_id} {self.city}"
+
+
+class DailySubscriptionStats(models.Model):
+    """
+    Subscriptions started (paid and trial) and expired per day and plan.
+    """
+
+    ROLLUP_KEY = ("day", "plan_id")
+
+    day = models.DateField()
+    plan = models.ForeignKey(Plan, on_delete=models.CASCADE, related_name="+")
+    started = models.PositiveIntegerField(default=0)
+    trials = models.PositiveIntegerField(default=0)
+    expired = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "daily subscription stats"
+        constraints = (
+            models.UniqueConstraint(
+                fields=["day", "plan"], name="daily_subscription_stats_key"
+            ),
+        )
+
+    def __str__(self):
+        return f"{self.day} {self.plan_id}"
+
+
+class PlanSubscriberCount(models.Model):
+    """
+    Subscriptions of a plan that are active right now.
+    """
+
+    ROLLUP_KEY = ("plan_id",)
+
+    plan = models.OneToOneField(
+        Plan, on_delete=models.CASCADE, primary_key=True, related_name="+"
+    )
+    active = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.plan_id}: {self.active}"
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+from utils.metrics import cache_lookup
+
+from core.db_router import use_replica
+
+from .models import DailyOrderStats, DailySubscriptionStats, PlanSubscriberCount
+
+
+# Reports only read the rollups, so their cost follows the days, plans and
+# cities asked for, never the number of orders behind them.
+
+DASHBOARD_KEY = "stats:dashboard"
+
+
+def revenue(since, until):
+    """
+    Orders, settled payments and revenue per day and plan.
+    """
+    return list(
+        DailyOrderStats.objects.filter(day__range=(since, until))
+        .values("day", "plan_id")
+        .annotate(
+            orders=Sum("orders"),
+            paid=Sum("paid"),
+            failed=Sum("failed"),
+            revenue=Sum("revenue"),
+        )
+        .order_by("day", "plan_id")
+    )
+
+
+def conversions(since, until):
+    """
+    Orders placed and paid per city, busiest cities first.
+    """
+    rows = list(
+        DailyOrderStats.objects.filter(day__range=(since, until))
+        .values("city")
+        .annotate(orders=Sum("orders"), paid=Sum("paid"), revenue=Sum("revenue"))
+        .order_by("-orders", "city")
+    )
+    for row in rows:
+        row["conversion"] = (
+            round(row["paid"] / row["orders"], 4) if row["orders"] else None
+        )
+    return rows
+
+
+def subscriber_counts():
+    return list(
+        PlanSubscriberCount.objects.values("plan_id", "active").order_by("plan_id")
+    )
+
+
+def subscription_flows(since, until):
+    """
+    Subscriptions started, trials started and expired per day and plan.
+    """
+    return list(
+        DailySubscriptionStats.objects.filter(day__range=(since, until))
+        .values("day", "plan_id", "started", "trials", "expired")
+        .order_by("day", "plan_id")
+    )
+
+
+def build_dashboard(days):
+    until = timezone.localdate()
+    since = until - timedelta(days=days - 1)
+    with use_replica():
+        daily = list(
+            DailyOrderStats.objects.filter(day__range=(since, until))
+            .values("day")
+            .annotate(orders=Sum("orders"), paid=Sum("paid"), revenue=Sum("revenue"))
+            .order_by("day")
+        )
+        plans = list(
+            DailyOrderStats.objects.filter(day__range=(since, until))
+            .values("plan_id", "plan__duration_days")
+            .annotate(orders=Sum("orders"), paid=Sum("paid"), revenue=Sum("revenue"))
+            .order_by("-revenue", "plan_id")
+        )
+        cities = conversions(since, until)[:10]
+        subscribers = list(
+            PlanSubscriberCount.objects.values(
+                "plan_id", "plan__duration_days", "active"
+            ).order_by("plan_id")
+        )
+    return {
+        "since": since,
+        "until": until,
+        "generated": timezone.now(),
+        "totals": {
+            "orders": sum(row["orders"] for row in daily),
+            "paid": sum(row["paid"] for row in daily),
+            "revenue": sum(row["revenue"] for row in daily),
+            "active": sum(row["active"] for row in subscribers),
+        },
+        "daily": daily,
+        "plans": plans,
+        "cities": cities,
+        "subscribers": subscribers,
+    }
+
+
+def get_dashboard():
+    """
+    Dashboard figures of the last STATS["DASHBOARD_DAYS"] days, cached for
+    STATS["DASHBOARD_TIMEOUT"] seconds.
+    """
+    dashboard = cache.get(DASHBOARD_KEY)
+    cache_lookup("stats_dashboard", dashboard is not None)
+    if dashboard is None:
+        dashboard = build_dashboard(settings.STATS["DASHBOARD_DAYS"])
+        cache.set(DASHBOARD_KEY, dashboard, timeout=settings.STATS["DASHBOARD_TIMEOUT"])
+    return dashboard
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from orders.models import Order, Payment
+from products.models import ACTIVE_STATUSES, Subscription
+
+from .models import DailyOrderStats, DailySubscriptionStats, PlanSubscriberCount
+
+
+# Every writer of an order, payment or subscription state calls one of these
+# inside the transaction of the change, so a rollup never counts a change
+# that rolled back. Edits made around them (the admin, raw SQL) are only
+# picked up by rebuild_rollups.
+
+
+def _day(value):
+    # the day TruncDate gives in the current time zone, so rebuilds agree
+    return timezone.localdate(value)
+
+
+def settled_at(payment):
+    """
+    When a settled payment counts, record_payments and rebuild_days both
+    give it the day of this. Every settling path stamps payment_date, failed
+    payments from before that fall back to updated.
+    """
+    return payment.payment_date or payment.updated
+
+
+def _count_payments(deltas, payments):
+    for payment, plan_id, city in payments:
+        counts = deltas[(_day(settled_at(payment)), plan_id, city)]
+        if payment.status == "PAID":
+            counts["paid"] += 1
+            counts["revenue"] += payment.amount
+        else:
+            counts["failed"] += 1
+
+
+def _lock_rollups(*models):
+    """
+    Keep the incremental writers off the rollup tables of ``models`` until
+    the transaction ends, so an increment cannot land between a rebuild's
+    read and its delete. Reads go on.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            tables = ", ".join(
+                connection.ops.quote_name(model._meta.db_table) for model in models
+            )
+            cursor.execute(f"LOCK TABLE {tables} IN EXCLUSIVE MODE")
+        else:
+            # SQLite has one write lock per database, the first write takes it
+            table = connection.ops.quote_name(models[0]._meta.db_table)
+            cursor.execute(f"DELETE FROM {table} WHERE 0 = 1")
+
+
+def _apply(model, deltas):
+    """
+    Add ``deltas``, a mapping of ROLLUP_KEY tuple to field increments, to
+    the rollup rows of ``model``. Keys are applied in sorted order so
+    concurrent transactions lock the rows in the same order.
+    """
+    for key in sorted(deltas):
+        changes = {field: value for field, value in deltas[key].items() if value}
+        if not changes:
+            continue
+        lookup = dict(zip(model.ROLLUP_KEY, key))
+        increments = {field: F(field) + value for field, value in changes.items()}
+        if model.objects.filter(**lookup).update(**increments):
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup, **changes)
+        except IntegrityError:
+            # a concurrent transaction created the row first
+            model.objects.filter(**lookup).update(**increments)
+
+
+def record_order(order):
+    _apply(
+        DailyOrderStats,
+        {(_day(order.created), order.plan_id, order.city): {"orders": 1}},
+    )
+
+
+def record_payments(payments):
+    """
+    Count settled payments, ``(payment, plan_id, city)`` tuples of payments
+    with their status and payment_date set.
+    """
+    deltas = defaultdict(Counter)
+    _count_payments(deltas, payments)
+    _apply(DailyOrderStats, deltas)
+
+
+def record_subscriptions(subscriptions):
+    """
+    Count subscriptions that just became active. Imported ones may arrive
+    already expired and are counted as started and expired at once,
+    anything else (the canceled placeholder of an unpaid order) is skipped.
+    """
+    daily = defaultdict(Counter)
+    active = Counter()
+    for subscription in subscriptions:
+        if subscription.status not in (*ACTIVE_STATUSES, "expired"):
+            continue
+        started = daily[(_day(subscription.start_date), subscription.plan_id)]
+        started["trials" if subscription.is_trial else "started"] += 1
+        if subscription.status == "expired":
+            daily[(_day(subscription.end_date), subscription.plan_id)]["expired"] += 1
+        else:
+            active[(subscription.plan_id,)] += 1
+    _apply(DailySubscriptionStats, daily)
+    _apply(
+        PlanSubscriberCount, {key: {"active": count} for key, count in active.items()}
+    )
+
+
+def record_expirations(rows):
+    """
+    Count subscriptions moved from active to expired, ``(plan_id, end_date)``
+    tuples.
+    """
+    daily = defaultdict(Counter)
+    active = Counter()
+    for plan_id, end_date in rows:
+        daily[(_day(end_date), plan_id)]["expired"] += 1
+        active[(plan_id,)] -= 1
+    _apply(DailySubscriptionStats, daily)
+    _apply(
+        PlanSubscriberCount, {key: {"active": count} for key, count in active.items()}
+    )
+
+
+def _bounds(since, until):
+    start = timezone.make_aware(datetime.combine(since, time.min))
+    end = timezone.make_aware(datetime.combine(until + timedelta(days=1), time.min))
+    return start, end
+
+
+def rebuild_days(since, until):
+    """
+    Recompute the daily rollups of ``since`` to ``until`` inclusive from the
+    orders, payments and subscriptions of those days. The days are deleted
+    and inserted again in one transaction, the incremental writers wait for
+    it.
+    """
+    with transaction.atomic():
+        _lock_rollups(DailyOrderStats, DailySubscriptionStats)
+        return _rebuild_days(since, until)
+
+
+def _rebuild_days(since, until):
+    start, end = _bounds(since, until)
+
+    orders = defaultdict(Counter)
+    for row in (
+        Order.objects.filter(created__gte=start, created__lt=end)
+        .annotate(day=TruncDate("created"))
+        .values("day", "plan_id", "city")
+        .annotate(count=Count("id"))
+        .order_by()
+    ):
+        orders[(row["day"], row["plan_id"], row["city"])]["orders"] += row["count"]
+    payments = (
+        Payment.objects.exclude(status="PENDING")
+        # settled_at in SQL picks the rows, the days come from settled_at itself
+        .annotate(settled=Coalesce("payment_date", "updated"))
+        .filter(settled__gte=start, settled__lt=end)
+        .annotate(plan_id=F("order__plan_id"), city=F("order__city"))
+        .only("status", "amount", "payment_date", "updated")
+        .order_by()
+    )
+    _count_payments(
+        orders,
+        ((payment, payment.plan_id, payment.city) for payment in payments.iterator()),
+    )
+
+    subscriptions = defaultdict(Counter)
+    for row in (
+        Subscription.objects.filter(
+            status__in=(*ACTIVE_STATUSES, "expired"),
+            start_date__gte=start,
+            start_date__lt=end,
+        )
+        .annotate(day=TruncDate("start_date"))
+        .values("day", "plan_id", "is_trial")
+        .annotate(count=Count("id"))
+        .order_by()
+    ):
+        subscriptions[(row["day"], row["plan_id"])][
+            "trials" if row["is_trial"] else "started"
+        ] += row["count"]
+    for row in (
+        Subscription.objects.filter(
+            status="expired", end_date__gte=start, end_date__lt=end
+        )
+        .annotate(day=TruncDate("end_date"))
+        .values("day", "plan_id")
+        .annotate(count=Count("id"))
+        .order_by()
+    ):
+        subscriptions[(row["day"], row["plan_id"])]["expired"] += row["count"]
+
+    DailyOrderStats.objects.filter(day__range=(since, until)).delete()
+    DailyOrderStats.objects.bulk_create(
+        DailyOrderStats(day=day, plan_id=plan_id, city=city, **counts)
+        for (day, plan_id, city), counts in orders.items()
+    )
+    DailySubscriptionStats.objects.filter(day__range=(since, until)).delete()
+    DailySubscriptionStats.objects.bulk_create(
+        DailySubscriptionStats(day=day, plan_id=plan_id, **counts)
+        for (day, plan_id), counts in subscriptions.items()
+    )
+    return len(orders), len(subscriptions)
+
+
+def rebuild_subscriber_counts():
+    """
+    Recompute the active subscriber count of every plan.
+    """
+    with transaction.atomic():
+        _lock_rollups(PlanSubscriberCount)
+        counts = (
+            Subscription.objects.filter(status__in=ACTIVE_STATUSES)
+            .values("plan_id")
+            .annotate(count=Count("id"))
+            .order_by()
+        )
+        PlanSubscriberCount.objects.all().delete()
+        PlanSubscriberCount.objects.bulk_create(
+            PlanSubscriberCount(plan_id=row["plan_id"], active=row["count"])
+            for row in counts
+        )
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import serializers
+
+
+class DateRangeSerializer(serializers.Serializer):
+    since = serializers.DateField(required=False)
+    until = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        until = attrs.get("until") or timezone.localdate()
+        since = attrs.get("since") or until - timedelta(days=29)
+        if since > until:
+            msg = "since must not be after until."
+            raise serializers.ValidationError(msg)
+        max_days = settings.STATS["MAX_RANGE_DAYS"]
+        if (until - since).days >= max_days:
+            msg = f"The range may span at most {max_days} days."
+            raise serializers.ValidationError(msg)
+        return {"since": since, "until": until}
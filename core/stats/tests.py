@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from accounts.services import signup
+from accounts.tokens import RefreshToken
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from orders.models import Order, Payment
+from orders.services import process_callback, settle_payments
+from products.catalog import invalidate_trial_plan
+from products.models import Plan, Subscription
+from rest_framework.test import APIClient
+from utils.testing import QueryBudgetMixin
+
+from .models import DailyOrderStats, DailySubscriptionStats, PlanSubscriberCount
+from .reports import get_dashboard
+from .rollups import rebuild_days, record_order
+
+
+User = get_user_model()
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+PAID = {"ref_id": 1234, "raw_response": {"data": {"code": 100, "ref_id": 1234}}}
+
+
+def snapshot():
+    return {
+        "orders": sorted(
+            DailyOrderStats.objects.values_list("day", "plan_id", "city", "orders", "paid", "failed", "revenue")
+        ),
+        "subscriptions": sorted(
+            DailySubscriptionStats.objects.values_list("day", "plan_id", "started", "trials", "expired")
+        ),
+        "active": sorted(PlanSubscriberCount.objects.values_list("plan_id", "active")),
+    }
+
+
+@override_settings(CACHES=LOCMEM_CACHES, RATELIMIT_ENABLE=False)
+class RollupTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        invalidate_trial_plan()
+        self.trial = Plan.objects.create(duration_days=3, price=0)
+        self.plan = Plan.objects.create(duration_days=30, price=1000)
+
+    def place_order(self, phone, city):
+        user = signup(phone)
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(
+            reverse("payments:orders"),
+            {
+                "plan": self.plan.id,
+                "first_name": "first",
+                "last_name": "last",
+                "phone": phone,
+                "city": city,
+                "address": "address",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 202, response.data)
+        payment = Payment.objects.get(user=user)
+        payment.authority = f"A{payment.id:035d}"
+        payment.save(update_fields=["authority"])
+        return payment
+
+    def test_incremental_rollups_match_a_rebuild(self):
+        callback = self.place_order("09121111111", "tehran")
+        failed = self.place_order("09121111112", "tehran")
+        reconciled = self.place_order("09121111113", "shiraz")
+
+        gateway = mock.Mock(verify_payment=mock.Mock(return_value=PAID))
+        process_callback(callback.authority, client=gateway)
+        settle_payments({reconciled.id: PAID}, [failed.id])
+        Subscription.objects.filter(user=callback.user, is_trial=True).update(
+            end_date=timezone.now() - timedelta(minutes=1)
+        )
+        call_command("expire_subscriptions", stdout=StringIO())
+
+        today = timezone.localdate()
+        incremental = snapshot()
+        self.assertEqual(
+            incremental["orders"],
+            [
+                (today, self.plan.id, "shiraz", 1, 1, 0, 1000),
+                (today, self.plan.id, "tehran", 2, 1, 1, 1000),
+            ],
+        )
+        self.assertEqual(
+            incremental["subscriptions"],
+            [(today, self.trial.id, 0, 3, 1), (today, self.plan.id, 2, 0, 0)],
+        )
+        self.assertEqual(incremental["active"], [(self.trial.id, 2), (self.plan.id, 2)])
+
+        DailyOrderStats.objects.update(orders=0, paid=0, failed=0, revenue=0)
+        PlanSubscriberCount.objects.all().delete()
+        out = StringIO()
+        call_command("rebuild_rollups", "--chunk-days", "1", stdout=out)
+
+        self.assertIn("Rebuilt rollups", out.getvalue())
+        self.assertEqual(snapshot(), incremental)
+
+    def test_rebuild_keeps_failed_payments_on_their_day(self):
+        failed = self.place_order("09121111111", "tehran")
+        settle_payments({}, [failed.id])
+        incremental = snapshot()
+
+        # a later edit of the payment does not move it to another day
+        Payment.objects.filter(pk=failed.pk).update(updated=timezone.now() + timedelta(days=2))
+        call_command("rebuild_rollups", stdout=StringIO())
+        self.assertEqual(snapshot(), incremental)
+
+    def test_rebuild_locks_the_rollups_first(self):
+        with CaptureQueriesContext(connection) as queries:
+            rebuild_days(timezone.localdate(), timezone.localdate())
+        statements = [query["sql"] for query in queries if not query["sql"].startswith(("BEGIN", "SAVEPOINT"))]
+        self.assertIn(DailyOrderStats._meta.db_table, statements[0])
+
+    def test_settled_payment_is_not_counted_twice(self):
+        payment = self.place_order("09121111111", "tehran")
+        gateway = mock.Mock(verify_payment=mock.Mock(return_value=PAID))
+        process_callback(payment.authority, client=gateway)
+
+        self.assertEqual(settle_payments({payment.id: PAID}, []), (0, 0))
+        self.assertEqual(DailyOrderStats.objects.get(city="tehran").paid, 1)
+        self.assertEqual(PlanSubscriberCount.objects.get(plan=self.plan).active, 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, STATS={"DASHBOARD_DAYS": 30, "DASHBOARD_TIMEOUT": 300, "MAX_RANGE_DAYS": 90})
+class StatsAPITests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.plan = Plan.objects.create(duration_days=30, price=1000)
+        self.staff = User.objects.create_superuser(phone="09129999999", password="password")
+        self.user = User.objects.create(phone="09121111111")
+        DailyOrderStats.objects.create(
+            day=timezone.localdate(), plan=self.plan, city="tehran", orders=4, paid=3, failed=1, revenue=3000
+        )
+
+    def get(self, user, url_name, **params):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+        return client.get(reverse(url_name), params)
+
+    def test_staff_only(self):
+        self.assertEqual(APIClient().get(reverse("stats:revenue")).status_code, 401)
+        self.assertEqual(self.get(self.user, "stats:revenue").status_code, 403)
+
+    def test_revenue_and_conversions(self):
+        response = self.get(self.staff, "stats:revenue")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["revenue"], 3000)
+
+        response = self.get(self.staff, "stats:conversions")
+        self.assertEqual(response.data["results"], [
+            {"city": "tehran", "orders": 4, "paid": 3, "revenue": 3000, "conversion": 0.75},
+        ])
+
+    def test_range_is_bounded(self):
+        today = timezone.localdate()
+        response = self.get(self.staff, "stats:subscribers", since=today - timedelta(days=90), until=today)
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StatsDashboardTests(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(phone="09129999999", password="password")
+        self.user = User.objects.create(phone="09121111111")
+        self.plan = Plan.objects.create(duration_days=30, price=1000)
+        self.seeded = 0
+
+    def seed_orders(self, count):
+        for _ in range(count):
+            self.seeded += 1
+            order = Order.objects.create(
+                user=self.user,
+                plan=self.plan,
+                first_name="first",
+                last_name="last",
+                phone=self.user.phone,
+                city=f"city {self.seeded % 3}",
+                address="address",
+            )
+            record_order(order)
+
+    def test_dashboard_does_not_grow_with_history(self):
+        self.client.force_login(self.admin)
+        url = reverse("admin:stats_dashboard")
+
+        def request():
+            cache.clear()
+            return self.client.get(url)
+
+        self.assertConstantQueries(self.seed_orders, request)
+
+    def test_dashboard_is_cached(self):
+        self.seed_orders(2)
+        self.assertEqual(get_dashboard()["totals"]["orders"], 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_dashboard()["totals"]["orders"], 2)
@@ -0,0 +1,14 @@
+from __future__ import annotations
+
+from django.urls import path
+
+from . import views
+
+
+app_name = "stats"
+
+urlpatterns = [
+    path("revenue/", views.RevenueStatsView.as_view(), name="revenue"),
+    path("conversions/", views.ConversionStatsView.as_view(), name="conversions"),
+    path("subscribers/", views.SubscriberStatsView.as_view(), name="subscribers"),
+]
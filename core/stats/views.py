@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from accounts.authentication import StatelessJWTAuthentication
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.db_router import use_replica
+
+from . import reports
+from .serializers import DateRangeSerializer
+
+
+class StatsView(APIView):
+    """
+    Reads one report of the rollups for ``?since=&until=`` (YYYY-MM-DD),
+    the last 30 days by default.
+    """
+
+    authentication_classes = (StatelessJWTAuthentication,)
+    permission_classes = (IsAdminUser,)
+
+    @extend_schema(parameters=[DateRangeSerializer], responses=OpenApiTypes.OBJECT)
+    def get(self, request, *args, **kwargs):
+        serializer = DateRangeSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        since, until = (
+            serializer.validated_data["since"],
+            serializer.validated_data["until"],
+        )
+        with use_replica():
+            data = self.report(since, until)
+        return Response({"since": since, "until": until, **data})
+
+
+class RevenueStatsView(StatsView):
+    def report(self, since, until):
+        return {"results": reports.revenue(since, until)}
+
+
+class ConversionStatsView(StatsView):
+    def report(self, since, until):
+        return {"results": reports.conversions(since, until)}
+
+
+class SubscriberStatsView(StatsView):
+    def report(self, since, until):
+        return {
+            "active": reports.subscriber_counts(),
+            "results": reports.subscription_flows(since, until),
+        }
@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+import json
+from pathlib import Path
+import threading
+import time
+
+from django.core.management.base import CommandError
+from django.db import connection
+
+
+METRICS = ("errors", "p50_ms", "p95_ms", "p99_ms", "rps", "queries")
+# lower is better for everything except throughput
+HIGHER_IS_BETTER = {"rps"}
+# counts, not timings, no tolerance applies
+EXACT = {"errors", "queries"}
+
+
+def cache_settings(backend):
+    """
+    CACHES for an in-process cache, ``locmem`` or a django-redis cache on
+    fakeredis so Redis-only code paths run without a server.
+    """
+    if backend == "locmem":
+        return {
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                # the default cull at 300 entries would evict live codes and
+                # cached rows mid-run
+                "OPTIONS": {"MAX_ENTRIES": 1_000_000},
+            },
+        }
+    try:
+        import fakeredis
+    except ImportError:
+        msg = "--cache fakeredis needs the packages in requirements-dev.txt installed."
+        raise CommandError(msg)
+    return {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": "redis://loadtest:6379/0",
+            "OPTIONS": {
+                "CLIENT": "django_redis.client.DefaultClient",
+                "CONNECTION_POOL_KWARGS": {
+                    "connection_class": fakeredis.FakeConnection
+                },
+            },
+        },
+    }
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Scenario:
+    """
+    A named request against one endpoint. ``call(i)`` performs the i-th
+    request and returns the response; anything with a ``status_code`` works,
+    so the same scenario can drive the test client or a real HTTP session.
+    """
+
+    def __init__(self, name, call, ok=None):
+        self.name = name
+        self.call = call
+        self.ok = ok or (
+            lambda response: response.status_code < HTTPStatus.BAD_REQUEST
+        )
+
+
+def run_scenario(scenario, iterations, concurrency):
+    latencies = []
+    queries = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        counter = _QueryCounter()
+        try:
+            with connection.execute_wrapper(counter):
+                started = time.perf_counter()
+                response = scenario.call(i)
+                elapsed = time.perf_counter() - started
+        finally:
+            if concurrency > 1:
+                connection.close()
+        with lock:
+            latencies.append(elapsed)
+            queries.append(counter.count)
+            if not scenario.ok(response):
+                errors += 1
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(iterations)))
+    else:
+        for i in range(iterations):
+            one(i)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": iterations,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "rps": round(iterations / elapsed, 1) if elapsed else 0.0,
+        "queries": round(sum(queries) / len(queries), 2) if queries else 0.0,
+    }
+
+
+def format_table(results):
+    header = (
+        f"{'endpoint':<28}{'reqs':>6}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}"
+        f"{'p99 ms':>9}{'req/s':>9}{'q/req':>7}"
+    )
+    lines = [header, "-" * len(header)]
+    for name, row in results.items():
+        lines.append(
+            f"{name:<28}{row['requests']:>6}{row['errors']:>5}{row['p50_ms']:>9.1f}"
+            f"{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['rps']:>9.1f}{row['queries']:>7.1f}"
+        )
+    return "\n".join(lines)
+
+
+def load_baseline(path):
+    return json.loads(Path(path).read_text())
+
+
+def save_baseline(path, results):
+    Path(path).write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+
+
+def diff_baseline(baseline, results, tolerance):
+    """
+    Compare results with a stored baseline. Returns report lines and the
+    list of (endpoint, metric) pairs that regressed beyond ``tolerance``
+    (a fraction, 0.2 means 20% worse). Error and query counts regress on any
+    increase.
+    """
+    lines = []
+    regressions = []
+    for name, row in results.items():
+        before = baseline.get(name)
+        if before is None:
+            lines.append(f"{name}: new endpoint, no baseline")
+            continue
+        changes = []
+        for metric in METRICS:
+            old, new = before.get(metric), row[metric]
+            if old is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            if metric in EXACT:
+                regressed = new > old
+            elif metric in HIGHER_IS_BETTER:
+                regressed = -change > tolerance
+            else:
+                regressed = change > tolerance
+            if regressed:
+                regressions.append((name, metric))
+            changes.append(
+                f"{metric} {old}->{new} ({change:+.0%}){' !' if regressed else ''}"
+            )
+        lines.append(f"{name}: " + ", ".join(changes))
+    return lines, regressions
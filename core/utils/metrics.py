@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import ipaddress
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django_ratelimit import ALL
+from django_ratelimit.decorators import ratelimit as _ratelimit
+from django_ratelimit.exceptions import Ratelimited
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from rest_framework.views import exception_handler as drf_exception_handler
+
+
+# with PROMETHEUS_MULTIPROC_DIR set every worker writes its samples to mmap
+# files in that directory and /metrics aggregates them, whichever worker serves it
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Request latency by view.",
+    ["view", "method", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Database queries per request by view.",
+    ["view"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_seconds",
+    "Time spent in database queries per request by view.",
+    ["view"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "Cache lookups of the hot key spaces by result.",
+    ["cache", "result"],
+)
+RATELIMITED = Counter(
+    "ratelimit_requests_total",
+    "Requests checked by a rate limit by view and result, passed or blocked.",
+    ["view", "result"],
+)
+GATEWAY_LATENCY = Histogram(
+    "zarinpal_request_duration_seconds",
+    "Payment gateway calls, retries included, by operation and outcome.",
+    ["operation", "outcome"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+GATEWAY_CONNECTIONS = Counter(
+    "zarinpal_connections_total",
+    "Payment gateway requests by whether they opened a connection or reused a "
+    "pooled one.",
+    ["client", "connection"],
+)
+GATEWAY_BREAKER = Gauge(
+    "zarinpal_circuit_state",
+    "Payment gateway circuit breaker state: 0 closed, 1 half open, 2 open.",
+    ["client"],
+    # the worst state of any live worker
+    multiprocess_mode="livemax",
+)
+
+UNMATCHED = "unmatched"
+
+
+class _QueryStats:
+    __slots__ = ("count", "duration")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+_query_stats = ContextVar("query_stats", default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.count += 1
+        stats.duration += time.perf_counter() - started
+
+
+def instrument_connection(connection):
+    # first in the list, execute_wrapper() pops the last one when it exits
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+@receiver(connection_created)
+def _instrument_new_connection(connection, **_kwargs):
+    instrument_connection(connection)
+
+
+def cache_lookup(cache, hit):
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+@contextmanager
+def gateway_timer(operation):
+    started = time.perf_counter()
+    outcome = "success"
+    try:
+        yield
+    except Exception as e:
+        outcome = type(e).__name__
+        raise
+    finally:
+        GATEWAY_LATENCY.labels(operation, outcome).observe(
+            time.perf_counter() - started
+        )
+
+
+def gateway_connection(client, opened):
+    GATEWAY_CONNECTIONS.labels(client, "new" if opened else "reused").inc()
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    # unmatched paths share one label so scanners cannot blow up cardinality
+    if match is None:
+        return UNMATCHED
+    return match.view_name or match.route or UNMATCHED
+
+
+class MetricsMiddleware:
+    """
+    Latency, query count and query time per view. Queries are counted on
+    every database alias through a wrapper installed on each connection, the
+    request's counters live in a ContextVar so async views are counted too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # connections opened before this module was imported
+        for connection in connections.all(initialized_only=True):
+            instrument_connection(connection)
+        stats = _QueryStats()
+        token = _query_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_stats.reset(token)
+        self.observe(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = _QueryStats()
+        token = _query_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_stats.reset(token)
+        self.observe(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def observe(self, request, response, stats, elapsed):
+        view = view_name(request)
+        REQUEST_LATENCY.labels(view, request.method, response.status_code).observe(
+            elapsed
+        )
+        REQUEST_QUERIES.labels(view).observe(stats.count)
+        REQUEST_DB_TIME.labels(view).observe(stats.duration)
+
+
+def ratelimit(method=ALL, **kwargs):
+    """
+    django-ratelimit's decorator, counting the requests it lets through. The
+    blocked ones are counted by exception_handler.
+    """
+    methods = (
+        None
+        if method == ALL
+        else method
+        if isinstance(method, (list, tuple))
+        else [method]
+    )
+
+    def decorator(fn):
+        @wraps(fn)
+        def counted(request, *args, **kw):
+            if methods is None or request.method in methods:
+                RATELIMITED.labels(view_name(request), "passed").inc()
+            return fn(request, *args, **kw)
+
+        return _ratelimit(method=method, **kwargs)(counted)
+
+    return decorator
+
+
+def exception_handler(exc, context):
+    # django-ratelimit raises Ratelimited, which DRF turns into a plain 403
+    if isinstance(exc, Ratelimited):
+        RATELIMITED.labels(view_name(context["request"]), "blocked").inc()
+    return drf_exception_handler(exc, context)
+
+
+def _may_scrape(request):
+    token = settings.METRICS["TOKEN"]
+    if token and constant_time_compare(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    ):
+        return True
+    networks = settings.METRICS.get("ALLOWED_NETWORKS")
+    if not networks:
+        return False
+    try:
+        address = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network, strict=False) for network in networks
+    )
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition, for a scraper sending ``METRICS["TOKEN"]`` or
+    connecting from ``METRICS["ALLOWED_NETWORKS"]``. With neither set nobody
+    gets it.
+    """
+    if not _may_scrape(request):
+        return HttpResponseForbidden()
+
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CreatedCursorPagination(CursorPagination):
+    """
+    Keyset pagination over ``(created, id)``, newest first. Every page is an
+    index range scan from the cursor, so deep pages cost the same as the first.
+    """
+
+    ordering = ("-created", "-id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+def planner_estimate(queryset):
+    """
+    Rows the PostgreSQL planner expects ``queryset`` to return, from EXPLAIN
+    without running it. None on other databases.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Admin changelist paginator for tables too big to COUNT(*) on every page
+    view. Results the planner expects to be larger than ``exact_count_limit``
+    report its estimate, smaller ones are counted exactly.
+    """
+
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        estimate = planner_estimate(self.object_list)
+        if estimate is None or estimate <= self.exact_count_limit:
+            return super().count
+        return estimate
+
+
+class RankedPagination(PageNumberPagination):
+    """
+    Page numbers for results ordered by relevance, which a cursor cannot
+    follow. Large result sets are counted from the planner's estimate.
+    """
+
+    django_paginator_class = EstimatedCountPaginator
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
@@ -0,0 +1,407 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import json
+from pathlib import Path
+import sys
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from django_redis import get_redis_connection
+from django_redis.cache import RedisCache
+
+
+# sent messages of LocMemBackend, like django.core.mail.outbox
+outbox = []
+
+
+class DeliveryError(Exception):
+    pass
+
+
+class BaseSMSBackend(ABC):
+    """
+    One SMS provider. ``send_batch`` gets up to ``BATCH_SIZE`` messages and
+    either delivers all of them or raises DeliveryError, the whole batch is
+    retried then.
+    """
+
+    def __init__(self, latency=0.0, **options):
+        # simulated provider round trip, for local backends and benchmarks
+        self.latency = latency
+        self.options = options
+
+    def send_messages(self, messages):
+        if self.latency:
+            time.sleep(self.latency)
+        self.send_batch(messages)
+
+    @abstractmethod
+    def send_batch(self, messages):
+        ...
+
+
+class ConsoleBackend(BaseSMSBackend):
+
+    def __init__(self, stream=None, **options):
+        super().__init__(**options)
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def send_batch(self, messages):
+        with self._lock:
+            for message in messages:
+                self.stream.write(
+                    f"Send OTP {message['code']} to phone {message['phone']}\n"
+                )
+            self.stream.flush()
+
+
+class FileBackend(BaseSMSBackend):
+
+    def __init__(self, path, **options):
+        super().__init__(**options)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send_batch(self, messages):
+        with self._lock, Path(self.path).open("a") as f:
+            for message in messages:
+                f.write(json.dumps(message) + "\n")
+
+
+class LocMemBackend(BaseSMSBackend):
+
+    def send_batch(self, messages):
+        outbox.extend(messages)
+
+
+def provider_config(name):
+    config = settings.OTP_DELIVERY["PROVIDERS"][name]
+    return {"BATCH_SIZE": 100, "CONCURRENCY": 4, "OPTIONS": {}, **config}
+
+
+def get_backend(name):
+    config = provider_config(name)
+    return import_string(config["BACKEND"])(**config["OPTIONS"])
+
+
+class RedisQueue:
+    """
+    Per-provider Redis list of pending messages, a sorted set of retries
+    scored by due time, a sorted set of popped but unacknowledged messages
+    scored by pop time and a dead-letter list.
+    """
+
+    # KEYS: queue, processing  ARGV: count, now
+    POP_SCRIPT = """
+    local items = redis.call("LPOP", KEYS[1], ARGV[1])
+    if not items then
+        return {}
+    end
+    for _, item in ipairs(items) do
+        redis.call("ZADD", KEYS[2], ARGV[2], item)
+    end
+    return items
+    """
+
+    # KEYS: retries, queue, processing  ARGV: now, popped before
+    PROMOTE_SCRIPT = """
+    local due = redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[1], "LIMIT", 0, 1000)
+    if #due > 0 then
+        redis.call("ZREM", KEYS[1], unpack(due))
+        redis.call("RPUSH", KEYS[2], unpack(due))
+    end
+    local stale = redis.call(
+        "ZRANGEBYSCORE", KEYS[3], "-inf", ARGV[2], "LIMIT", 0, 1000
+    )
+    if #stale > 0 then
+        redis.call("ZREM", KEYS[3], unpack(stale))
+        redis.call("RPUSH", KEYS[2], unpack(stale))
+    end
+    return #due + #stale
+    """
+
+    def __init__(self, client, key_func=None):
+        self.client = client
+        self.key_func = key_func or (lambda key: key)
+        self.pop_script = client.register_script(self.POP_SCRIPT)
+        self.promote_script = client.register_script(self.PROMOTE_SCRIPT)
+
+    def _key(self, provider, kind):
+        return self.key_func(f"sms:{{{provider}}}:{kind}")
+
+    def push(self, provider, message):
+        self.client.rpush(self._key(provider, "queue"), json.dumps(message))
+
+    def pop(self, provider, count, now):
+        items = self.pop_script(
+            keys=[self._key(provider, "queue"), self._key(provider, "processing")],
+            args=[count, now],
+        )
+        return [json.loads(item) for item in items]
+
+    def ack(self, provider, messages):
+        # members are what push() stored, json.dumps gives the same string back
+        if messages:
+            self.client.zrem(
+                self._key(provider, "processing"),
+                *(json.dumps(message) for message in messages),
+            )
+
+    def retry(self, provider, message, due):
+        self.client.zadd(self._key(provider, "retries"), {json.dumps(message): due})
+
+    def promote(self, provider, now, stale_before):
+        return self.promote_script(
+            keys=[
+                self._key(provider, "retries"),
+                self._key(provider, "queue"),
+                self._key(provider, "processing"),
+            ],
+            args=[now, stale_before],
+        )
+
+    def dead_letter(self, provider, message, max_size, ttl):
+        key = self._key(provider, "dead")
+        pipe = self.client.pipeline(transaction=False)
+        pipe.rpush(key, json.dumps(message))
+        pipe.ltrim(key, -max_size, -1)
+        pipe.expire(key, ttl)
+        pipe.execute()
+
+    def dead_letters(self, provider):
+        items = self.client.lrange(self._key(provider, "dead"), 0, -1)
+        return [json.loads(item) for item in items]
+
+    def sizes(self, provider):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.llen(self._key(provider, "queue"))
+        pipe.zcard(self._key(provider, "retries"))
+        pipe.zcard(self._key(provider, "processing"))
+        pipe.llen(self._key(provider, "dead"))
+        queued, retrying, processing, dead = pipe.execute()
+        return {
+            "queued": queued,
+            "retrying": retrying,
+            "processing": processing,
+            "dead": dead,
+        }
+
+
+# the state of every LocalQueue, shared like the Redis keys are
+_local_queues = {}
+_local_lock = threading.Lock()
+
+
+class LocalQueue:
+    """
+    In-process stand-in for RedisQueue, only a worker running in the same
+    process sees its messages. Used when ``OTP_DELIVERY["LOCAL_QUEUE"]`` is
+    set, for tests and benchmarks.
+    """
+
+    def _queue(self, provider):
+        with _local_lock:
+            return _local_queues.setdefault(
+                provider,
+                {"queue": deque(), "retries": [], "processing": {}, "dead": []},
+            )
+
+    def push(self, provider, message):
+        self._queue(provider)["queue"].append(message)
+
+    def pop(self, provider, count, now):
+        state = self._queue(provider)
+        items = []
+        with _local_lock:
+            while state["queue"] and len(items) < count:
+                message = state["queue"].popleft()
+                state["processing"][message["id"]] = (now, message)
+                items.append(message)
+        return items
+
+    def ack(self, provider, messages):
+        processing = self._queue(provider)["processing"]
+        with _local_lock:
+            for message in messages:
+                processing.pop(message["id"], None)
+
+    def retry(self, provider, message, due):
+        retries = self._queue(provider)["retries"]
+        with _local_lock:
+            heapq.heappush(retries, (due, message["id"], message))
+
+    def promote(self, provider, now, stale_before):
+        state = self._queue(provider)
+        moved = 0
+        with _local_lock:
+            while state["retries"] and state["retries"][0][0] <= now:
+                state["queue"].append(heapq.heappop(state["retries"])[2])
+                moved += 1
+            for key, (popped, message) in list(state["processing"].items()):
+                if popped <= stale_before:
+                    del state["processing"][key]
+                    state["queue"].append(message)
+                    moved += 1
+        return moved
+
+    def dead_letter(self, provider, message, max_size, _ttl):
+        dead = self._queue(provider)["dead"]
+        with _local_lock:
+            dead.append(message)
+            del dead[:-max_size]
+
+    def dead_letters(self, provider):
+        return list(self._queue(provider)["dead"])
+
+    def sizes(self, provider):
+        state = self._queue(provider)
+        return {
+            "queued": len(state["queue"]),
+            "retrying": len(state["retries"]),
+            "processing": len(state["processing"]),
+            "dead": len(state["dead"]),
+        }
+
+    @staticmethod
+    def clear():
+        with _local_lock:
+            _local_queues.clear()
+
+
+def get_queue(alias="default"):
+    """
+    The queue shared by the web processes and the delivery worker, None when
+    the cache is not Redis: nothing would carry the messages to the worker.
+    """
+    backend = caches[alias]
+    if isinstance(backend, RedisCache):
+        return RedisQueue(get_redis_connection(alias), key_func=backend.make_key)
+    if settings.OTP_DELIVERY.get("LOCAL_QUEUE"):
+        return LocalQueue()
+    return None
+
+
+def send_otp(phone, code, provider=None):
+    """
+    Queue an OTP for the delivery worker, a single list push whatever the
+    provider's latency. Without a shared queue (no Redis cache) it is sent
+    right away instead.
+    """
+    provider = provider or settings.OTP_DELIVERY["PROVIDER"]
+    message = {
+        "id": uuid.uuid4().hex,
+        "phone": phone,
+        "code": code,
+        "queued_at": time.time(),
+        "attempts": 0,
+    }
+    queue = get_queue()
+    if queue is None:
+        get_backend(provider).send_messages([message])
+    else:
+        queue.push(provider, message)
+    return message
+
+
+class Dispatcher:
+    """
+    Drains the queue of each provider into batch calls, at most
+    ``CONCURRENCY`` in flight per provider. A failed batch is retried with
+    exponential backoff, after ``MAX_RETRIES`` its messages are dead-lettered
+    without their code, the list is capped and expires. Messages older than the
+    OTP lifetime are dropped, the code is useless by then. A popped message is
+    acknowledged once it is handled, one a crashed worker left unacknowledged
+    is queued again after ``ACK_TIMEOUT`` seconds.
+    """
+
+    def __init__(self, providers=None, queue=None):
+        config = settings.OTP_DELIVERY
+        self.providers = providers or list(config["PROVIDERS"])
+        self.max_retries = config["MAX_RETRIES"]
+        self.retry_backoff = config["RETRY_BACKOFF"]
+        self.dead_letter_max = config.get("DEAD_LETTER_MAX", 1000)
+        self.dead_letter_ttl = config.get("DEAD_LETTER_TTL", 7 * 86400)
+        self.ack_timeout = config.get("ACK_TIMEOUT", 30)
+        self.max_age = settings.OTP["TTL"]
+        self.queue = queue or get_queue()
+        if self.queue is None:
+            msg = (
+                "OTP delivery needs a Redis cache to share its queue with the web "
+                "processes, without one they send OTPs themselves."
+            )
+            raise ImproperlyConfigured(msg)
+        self.backends = {name: get_backend(name) for name in self.providers}
+        self.executors = {
+            name: ThreadPoolExecutor(
+                max_workers=provider_config(name)["CONCURRENCY"],
+                thread_name_prefix=f"sms-{name}",
+            )
+            for name in self.providers
+        }
+
+    def run_once(self):
+        stats = {"sent": 0, "retried": 0, "dead": 0, "expired": 0}
+        futures = []
+        now = time.time()
+        for name in self.providers:
+            config = provider_config(name)
+            self.queue.promote(name, now, now - self.ack_timeout)
+            batch_size = config["BATCH_SIZE"]
+            messages = self.queue.pop(name, batch_size * config["CONCURRENCY"], now)
+
+            live = [
+                message
+                for message in messages
+                if now - message["queued_at"] < self.max_age
+            ]
+            stats["expired"] += len(messages) - len(live)
+            expired = [message for message in messages if message not in live]
+            self.queue.ack(name, expired)
+
+            send = self.backends[name].send_messages
+            for start in range(0, len(live), batch_size):
+                batch = live[start:start + batch_size]
+                future = self.executors[name].submit(send, batch)
+                futures.append((name, batch, future))
+
+        for name, batch, future in futures:
+            try:
+                future.result()
+            except Exception:
+                self._failed(name, batch, stats)
+            else:
+                stats["sent"] += len(batch)
+            # after the retries are stored, a crash in between sends twice
+            # rather than never
+            self.queue.ack(name, batch)
+        return stats
+
+    def _failed(self, name, batch, stats):
+        due = time.time()
+        for failed in batch:
+            message = {**failed, "attempts": failed["attempts"] + 1}
+            if message["attempts"] > self.max_retries:
+                # only kept to see what failed, the code must not outlive the OTP
+                dead = {key: value for key, value in message.items() if key != "code"}
+                self.queue.dead_letter(
+                    name, dead, self.dead_letter_max, self.dead_letter_ttl
+                )
+                stats["dead"] += 1
+            else:
+                backoff = self.retry_backoff * 2 ** (message["attempts"] - 1)
+                self.queue.retry(name, message, due + backoff)
+                stats["retried"] += 1
+
+    def close(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """
+    Assert an endpoint issues the same number of queries however many rows it
+    has to render. ``seed(count)`` adds ``count`` rows, ``request()`` performs
+    the request and returns the response.
+    """
+
+    dataset_sizes = (1, 5, 25)
+
+    def assertConstantQueries(self, seed, request, budget=None):
+        request()  # warm up per-process caches (content types, sessions, ...)
+
+        counts = {}
+        seeded = 0
+        for size in self.dataset_sizes:
+            seed(size - seeded)
+            seeded = size
+            with CaptureQueriesContext(connection) as ctx:
+                response = request()
+            self.assertLess(response.status_code, 400, response)
+            counts[size] = len(ctx.captured_queries)
+
+        queries = "\n".join(query["sql"] for query in ctx.captured_queries)
+        self.assertEqual(
+            len(set(counts.values())),
+            1,
+            f"query count grows with rows {counts}:\n{queries}",
+        )
+        if budget is not None:
+            self.assertLessEqual(counts[seeded], budget, queries)
+        return counts[seeded]
@@ -1,33 +1,200 @@
 from __future__ import annotations
 
+import asyncio
+from http import HTTPStatus
 import json
+import random
+import threading
+import time
+import weakref
 
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
 
+from .metrics import GATEWAY_BREAKER, gateway_connection, gateway_timer
 
-class ZarinpalClient:
 
-    def __init__(self, timeout=10.0):
-        self.merchant_id = settings.ZARINPAL["MERCHANT_ID"]
-        self.sandbox = settings.ZARINPAL["SANDBOX"]
-        self.timeout = timeout
+DEFAULTS = {
+    "API_URL": None,
+    "GATEWAY_URL": None,
+    "POOL_SIZE": 10,
+    "CONNECT_TIMEOUT": 3.05,
+    "READ_TIMEOUT": 10.0,
+    "VERIFY_RETRIES": 2,
+    "RETRY_BACKOFF": 0.2,
+    "BREAKER_FAILURES": 5,
+    "BREAKER_RESET": 30.0,
+}
 
-        self.base_api_url = (
+
+HEADERS = {
+    "Content-Type": "application/json",
+    "Accept": "application/json",
+}
+
+
+# verify codes that mean the customer never paid. Any other code, a merchant
+# or configuration error like -9 to -11 for example, says nothing about the
+# payment itself.
+UNPAID_CODES = {-51}
+
+SUCCESS_CODE = 100
+# 101 means the authority was already verified, which is still a success
+VERIFIED_CODES = {SUCCESS_CODE, 101}
+
+
+def _result_code(data):
+    # v4 answers errors with an empty list in "data" and the code in "errors"
+    return (
+        (data.get("data") or {}).get("code")
+        or (data.get("errors") or {}).get("code")
+    )
+
+
+CIRCUIT_OPEN = "Payment gateway circuit is open"
+TIMED_OUT = "Payment gateway timed out"
+
+
+class ZarinpalError(Exception):
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        # gateway result code when the gateway answered, None for transport errors
+        self.code = code
+
+
+class CircuitOpenError(ZarinpalError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker: opens after ``failure_threshold`` transport
+    failures, lets a single probe through after ``reset_timeout`` seconds.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    # a state's position is its zarinpal_circuit_state value
+    STATES = (CLOSED, HALF_OPEN, OPEN)
+
+    def __init__(self, failure_threshold, reset_timeout, name="sync"):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+        self._report()
+
+    def _report(self):
+        # on every call and transition, an idle open breaker shows open
+        # until the next call
+        GATEWAY_BREAKER.labels(self.name).set(self.STATES.index(self.state))
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            self._report()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+            self._report()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._report()
+
+
+# set by the pools below when a request had to open a connection, urllib3
+# opens it in the thread that makes the request
+_opened = threading.local()
+
+
+class _TrackNewConnections:
+
+    def _new_conn(self):
+        _opened.value = True
+        return super()._new_conn()
+
+
+class _HTTPConnectionPool(_TrackNewConnections, HTTPConnectionPool):
+    pass
+
+
+class _HTTPSConnectionPool(_TrackNewConnections, HTTPSConnectionPool):
+    pass
+
+
+class _PoolAdapter(HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _HTTPConnectionPool,
+            "https": _HTTPSConnectionPool,
+        }
+
+
+class _BaseZarinpalClient:
+
+    # label of the connection and breaker metrics
+    kind = None
+
+    def __init__(self, timeout=None):
+        config = {**DEFAULTS, **settings.ZARINPAL}
+        self.merchant_id = config["MERCHANT_ID"]
+        self.sandbox = config["SANDBOX"]
+        self.timeout = timeout or (config["CONNECT_TIMEOUT"], config["READ_TIMEOUT"])
+        self.pool_size = config["POOL_SIZE"]
+        self.verify_retries = config["VERIFY_RETRIES"]
+        self.retry_backoff = config["RETRY_BACKOFF"]
+        self.breaker = CircuitBreaker(
+            config["BREAKER_FAILURES"], config["BREAKER_RESET"], self.kind
+        )
+
+        self.base_api_url = config["API_URL"] or (
             "https://payment.zarinpal.com/pg/v4/payment/"  # Production
             if not self.sandbox
             else "https://sandbox.zarinpal.com/pg/v4/payment/"  # Sandbox
         )
 
-        self.payment_gateway_url = (
+        self.payment_gateway_url = config["GATEWAY_URL"] or (
             "https://payment.zarinpal.com/pg/StartPay/"  # Production
             if not self.sandbox
             else "https://sandbox.zarinpal.com/pg/StartPay/"  # Sandbox
         )
 
-    def request_payment(self, amount, callback_url, description="Request Payment",
-                        mobile=None, email=None,metadata=None,):
-        url = self.base_api_url + "request.json"
+    def _request_payload(self, amount, callback_url, description, **optional):
         payload = {
             "merchant_id": self.merchant_id,
             "amount": amount,
@@ -35,76 +202,230 @@ class ZarinpalClient:
             "description": description,
             "currency": "IRT",
         }
-        if mobile:
-            payload["mobile"] = mobile
-        if email:
-            payload["email"] = email
-        if metadata:
-            payload["metadata"] = metadata
-
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-        }
+        # mobile, email and metadata, only when given
+        payload.update({key: value for key, value in optional.items() if value})
+        return payload
 
-        try:
-            response = requests.post(
-                url,
-                data=json.dumps(payload),
-                headers=headers,
-                timeout=self.timeout,
-            )
-            response.raise_for_status()
-            data = response.json()
-            if data.get("data", {}).get("code") != 100:
-                error_msg = data.get("errors", {}).get("message", "Payment request failed")
-                raise Exception(f"ZarinPal Error: {error_msg} (Code: {data.get('data', {}).get('code')})")
-
-            authority = data["data"]["authority"]
-            payment_url = f"{self.payment_gateway_url}{authority}"
-
-            return {
-                "authority": authority,
-                "payment_url": payment_url,
-                "raw_response": data,
-            }
-        except requests.Timeout:
-            raise Exception("Payment request timed out")
-        except requests.RequestException as e:
-            raise Exception(f"Network error: {e!s}")
+    def _parse_request(self, data):
+        code = _result_code(data)
+        if code != SUCCESS_CODE:
+            errors = data.get("errors") or {}
+            error_msg = errors.get("message", "Payment request failed")
+            msg = f"ZarinPal Error: {error_msg} (Code: {code})"
+            raise ZarinpalError(msg, code=code)
 
-    def verify_payment(self, authority, amount):
-        url = self.base_api_url + "verify.json"
-        payload = {
+        authority = data["data"]["authority"]
+        payment_url = f"{self.payment_gateway_url}{authority}"
+
+        return {
+            "authority": authority,
+            "payment_url": payment_url,
+            "raw_response": data,
+        }
+
+    def _verify_payload(self, authority, amount):
+        return {
             "merchant_id": self.merchant_id,
             "amount": amount,
             "authority": authority,
         }
 
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json",
+    def _parse_verify(self, data):
+        code = _result_code(data)
+        if code not in VERIFIED_CODES:
+            msg = f"ZarinPal Error: {data.get('errors')} (Code: {code})"
+            raise ZarinpalError(msg, code=code)
+
+        return {
+            "ref_id": data["data"]["ref_id"],
+            "raw_response": data,
         }
 
-        try:
-            response = requests.post(
-                url,
-                data=json.dumps(payload),
-                headers=headers,
-                timeout=self.timeout,
+    def _backoff(self, attempt):
+        return random.uniform(0, self.retry_backoff * 2 ** attempt)
+
+
+class ZarinpalClient(_BaseZarinpalClient):
+
+    kind = "sync"
+
+    def __init__(self, timeout=None):
+        super().__init__(timeout)
+        adapter = _PoolAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            pool_block=False,
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(HEADERS)
+
+    def _post(self, url, payload, retries=0):
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(CIRCUIT_OPEN)
+            try:
+                _opened.value = False
+                response = self.session.post(
+                    url, data=json.dumps(payload), timeout=self.timeout
+                )
+                gateway_connection(self.kind, _opened.value)
+                if response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR:
+                    response.raise_for_status()
+            except requests.RequestException as e:
+                self.breaker.record_failure()
+                if attempt >= retries:
+                    if isinstance(e, requests.Timeout):
+                        raise ZarinpalError(TIMED_OUT)
+                    msg = f"Network error: {e!s}"
+                    raise ZarinpalError(msg)
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            self.breaker.record_success()
+            try:
+                response.raise_for_status()
+            except requests.RequestException as e:
+                msg = f"Network error: {e!s}"
+                raise ZarinpalError(msg)
+            return response.json()
+
+    def request_payment(self, amount, callback_url, description="Request Payment",
+                        mobile=None, email=None,metadata=None,):
+        url = self.base_api_url + "request.json"
+        payload = self._request_payload(
+            amount, callback_url, description,
+            mobile=mobile, email=email, metadata=metadata,
+        )
+        with gateway_timer("request"):
+            return self._parse_request(self._post(url, payload))
+
+    def verify_payment(self, authority, amount):
+        url = self.base_api_url + "verify.json"
+        payload = self._verify_payload(authority, amount)
+        # verification is idempotent on the gateway side, so it is safe to retry
+        with gateway_timer("verify"):
+            return self._parse_verify(
+                self._post(url, payload, retries=self.verify_retries)
+            )
+
+
+class AsyncZarinpalClient(_BaseZarinpalClient):
+    """
+    asyncio counterpart of ZarinpalClient for async views, the client is bound
+    to the event loop it was created on.
+    """
+
+    kind = "async"
+
+    def __init__(self, timeout=None):
+        super().__init__(timeout)
+        connect_timeout, read_timeout = (
+            self.timeout
+            if isinstance(self.timeout, tuple)
+            else (self.timeout, self.timeout)
+        )
+        self.http = httpx.AsyncClient(
+            headers=HEADERS,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+            ),
+        )
+
+    async def _post(self, url, payload, retries=0):
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(CIRCUIT_OPEN)
+            opened = False
+
+            async def trace(event, _info):
+                nonlocal opened
+                if event == "connection.connect_tcp.complete":
+                    opened = True
+
+            try:
+                response = await self.http.post(
+                    url, content=json.dumps(payload), extensions={"trace": trace}
+                )
+                gateway_connection(self.kind, opened)
+                if response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR:
+                    response.raise_for_status()
+            except httpx.HTTPError as e:
+                self.breaker.record_failure()
+                if attempt >= retries:
+                    if isinstance(e, httpx.TimeoutException):
+                        raise ZarinpalError(TIMED_OUT)
+                    msg = f"Network error: {e!s}"
+                    raise ZarinpalError(msg)
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            self.breaker.record_success()
+            try:
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                msg = f"Network error: {e!s}"
+                raise ZarinpalError(msg)
+            return response.json()
+
+    async def request_payment(
+        self, amount, callback_url, description="Request Payment", **optional
+    ):
+        # mobile, email and metadata as in ZarinpalClient.request_payment
+        url = self.base_api_url + "request.json"
+        payload = self._request_payload(amount, callback_url, description, **optional)
+        with gateway_timer("request"):
+            return self._parse_request(await self._post(url, payload))
+
+    async def verify_payment(self, authority, amount):
+        url = self.base_api_url + "verify.json"
+        payload = self._verify_payload(authority, amount)
+        with gateway_timer("verify"):
+            return self._parse_verify(
+                await self._post(url, payload, retries=self.verify_retries)
             )
-            response.raise_for_status()
-            data = response.json()
-            if data.get("data").get("code") != 100:
-                error_msg = data.get("errors")
-                raise Exception(f"ZarinPal Error: {error_msg} (Code: {data.get('data').get('code')})")
-
-            return {
-                "ref_id": data["data"]["ref_id"],
-                "raw_response": data,
-            }
-        except requests.Timeout:
-            raise Exception("Verification request timed out")
-        except requests.RequestException as e:
-            raise Exception(f"Network error: {e!s}")
 
+    async def aclose(self):
+        await self.http.aclose()
+
+
+# the process-wide ZarinpalClient under "sync"
+_clients = {}
+_client_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """
+    Process-wide client so every request reuses the same connection pool.
+    """
+    if "sync" not in _clients:
+        with _client_lock:
+            if "sync" not in _clients:
+                _clients["sync"] = ZarinpalClient()
+    return _clients["sync"]
+
+
+def get_async_client():
+    """
+    One AsyncZarinpalClient per running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncZarinpalClient()
+    return client
+
+
+@receiver(setting_changed)
+def reset_clients(setting, **_kwargs):
+    if setting == "ZARINPAL":
+        _clients.clear()
+        _async_clients.clear()
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import itertools
+import json
+import sys
+import threading
+import time
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        stub = self.server.stub
+
+        if stub.latency:
+            time.sleep(stub.latency)
+
+        if self.path.endswith("/request.json"):
+            authority = f"S{next(stub.counter):035d}"
+            body = {
+                "data": {"code": 100, "message": "Success", "authority": authority},
+                "errors": [],
+            }
+        elif self.path.endswith("/verify.json"):
+            authority = payload.get("authority", "")
+            if authority in stub.server_errors:
+                stub.requests += 1
+                self.send_error(500)
+                return
+            if authority in stub.verify_codes:
+                # the shape v4 answers errors with
+                code = stub.verify_codes[authority]
+                body = {
+                    "data": [],
+                    "errors": {
+                        "code": code,
+                        "message": "Stub error",
+                        "validations": [],
+                    },
+                }
+            else:
+                code = 101 if authority in stub.verified else 100
+                stub.verified.add(authority)
+                body = {
+                    "data": {
+                        "code": code,
+                        "message": "Verified",
+                        "ref_id": next(stub.counter),
+                    },
+                    "errors": [],
+                }
+        else:
+            self.send_error(404)
+            return
+
+        stub.requests += 1
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def process_request(self, request, client_address):
+        # one call per accepted connection, keep-alive requests reuse it
+        self.stub.connections += 1
+        super().process_request(request, client_address)
+
+    def handle_error(self, request, client_address):
+        # a client that timed out hung up before the answer, nothing to report
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StubGateway:
+    """
+    Local stand-in for the ZarinPal v4 API with configurable latency. Point
+    ``ZARINPAL["API_URL"]`` at ``api_url`` to run the client against it.
+    Verifies of authorities in ``verify_codes`` answer with that error code,
+    those in ``server_errors`` with a 500.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.latency = latency
+        self.counter = itertools.count(1)
+        self.verified = set()
+        self.verify_codes = {}
+        self.server_errors = set()
+        self.requests = 0
+        self.connections = 0
+        self.server = _StubServer((host, port), _StubHandler)
+        self.server.stub = self
+        self._thread = None
+
+    @property
+    def api_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/pg/v4/payment/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()